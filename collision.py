@@ -0,0 +1,155 @@
+"""Server-side collision for player movement.
+
+Trees and structures are axis-aligned boxes (the same trunk / body sizes
+the client's Arcade physics uses), grown by the player's half size so a
+player can be treated as a point. Every grown box is stored in the cells of
+a uniform spatial hash it overlaps. A move is then a segment: walk the
+cells it crosses (usually one or two) and test it against the few boxes
+found there, so a check costs O(1) on average however big the world gets.
+
+A small tolerance is taken off every box so client physics (which separates
+bodies after the fact) is never judged harsher than the server's own test.
+"""
+import math
+
+PLAYER_HALF = 16   # playerContainer.setSize(32, 32)
+TOLERANCE = 4      # px of overlap forgiven on every side
+WORLD_BOUNDS = 1000  # physics.world.setBounds(-1000, -1000, 2000, 2000)
+STRUCTURE_HALF = 20  # 40px emoji text body
+
+# Trunk boxes as (half width, half height, centre offset y) relative to the
+# tree's x, y; the client anchors tree sprites at origin (0.5, 0.9)
+TREE_TRUNK = (10, 10, -6.4)
+CACTUS_TRUNK = (8, 8, -3.6)
+
+
+def tree_box(tree):
+    """(cx, cy, half_w, half_h) of a tree's trunk (cacti grow in the south, y > 700)"""
+    half_w, half_h, offset_y = CACTUS_TRUNK if tree['y'] > 700 else TREE_TRUNK
+    return tree['x'], tree['y'] + offset_y, half_w, half_h
+
+
+def blocks_movement(obj_type):
+    """Structures the client gives a physics body (not bonfires, not dropped items)"""
+    return obj_type != 'bonfire' and not obj_type.startswith('drop_')
+
+
+def segment_hits_box(x0, y0, x1, y1, box):
+    """True if the segment enters the open box. Starting inside doesn't count (walking out is fine)."""
+    min_x, min_y, max_x, max_y = box
+    if min_x < x0 < max_x and min_y < y0 < max_y:
+        return False
+    t_enter, t_exit = 0.0, 1.0
+    for start, delta, low, high in ((x0, x1 - x0, min_x, max_x), (y0, y1 - y0, min_y, max_y)):
+        if delta == 0:
+            if start <= low or start >= high:
+                return False
+            continue
+        t_low = (low - start) / delta
+        t_high = (high - start) / delta
+        if t_low > t_high:
+            t_low, t_high = t_high, t_low
+        t_enter = max(t_enter, t_low)
+        t_exit = min(t_exit, t_high)
+        if t_enter >= t_exit:
+            return False
+    return True
+
+
+class CollisionGrid:
+    """Uniform spatial hash of blocking boxes, updated as things are built and removed"""
+
+    def __init__(self, cell_size=64, margin=PLAYER_HALF - TOLERANCE, bounds=WORLD_BOUNDS):
+        self.cell_size = cell_size
+        self.margin = margin
+        self.bounds = bounds
+        self._boxes = {}  # key -> (min_x, min_y, max_x, max_y), already grown by margin
+        self._cells = {}  # (cx, cy) -> set of keys
+
+        # Metrics
+        self.checks = 0
+        self.blocked_moves = 0
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def _cell_range(self, box):
+        min_x, min_y, max_x, max_y = box
+        size = self.cell_size
+        for cx in range(math.floor(min_x / size), math.floor(max_x / size) + 1):
+            for cy in range(math.floor(min_y / size), math.floor(max_y / size) + 1):
+                yield cx, cy
+
+    def add(self, key, cx, cy, half_w, half_h):
+        """Insert (or move) a box centred on cx, cy"""
+        self.remove(key)
+        box = (cx - half_w - self.margin, cy - half_h - self.margin,
+               cx + half_w + self.margin, cy + half_h + self.margin)
+        self._boxes[key] = box
+        for cell in self._cell_range(box):
+            self._cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        box = self._boxes.pop(key, None)
+        if box is None:
+            return
+        for cell in self._cell_range(box):
+            keys = self._cells.get(cell)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._cells[cell]
+
+    def _cells_on_segment(self, x0, y0, x1, y1):
+        """Cells crossed by a segment, in order (grid traversal, Amanatides & Woo)"""
+        size = self.cell_size
+        cx, cy = math.floor(x0 / size), math.floor(y0 / size)
+        end_x, end_y = math.floor(x1 / size), math.floor(y1 / size)
+        dx, dy = x1 - x0, y1 - y0
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        # Segment parameter t at which the next vertical / horizontal cell border is crossed
+        t_max_x = ((cx + (step_x > 0)) * size - x0) / dx if dx else math.inf
+        t_max_y = ((cy + (step_y > 0)) * size - y0) / dy if dy else math.inf
+        t_delta_x = size / abs(dx) if dx else math.inf
+        t_delta_y = size / abs(dy) if dy else math.inf
+
+        yield cx, cy
+        # Exactly one border crossing per step, so the count also guards against float drift
+        for _ in range(abs(end_x - cx) + abs(end_y - cy)):
+            if t_max_x < t_max_y:
+                cx += step_x
+                t_max_x += t_delta_x
+            else:
+                cy += step_y
+                t_max_y += t_delta_y
+            yield cx, cy
+
+    def blocked(self, x0, y0, x1, y1):
+        """Would moving from (x0, y0) to (x1, y1) walk into a tree, a structure or out of the world?"""
+        self.checks += 1
+        limit = self.bounds - PLAYER_HALF + TOLERANCE
+        hit = abs(x1) > limit or abs(y1) > limit
+        if not hit:
+            seen = set()
+            for cell in self._cells_on_segment(x0, y0, x1, y1):
+                for key in self._cells.get(cell, ()):
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    if segment_hits_box(x0, y0, x1, y1, self._boxes[key]):
+                        hit = True
+                        break
+                if hit:
+                    break
+        if hit:
+            self.blocked_moves += 1
+        return hit
+
+    def stats(self):
+        return {
+            'boxes': len(self._boxes),
+            'cells': len(self._cells),
+            'checks': self.checks,
+            'blocked_moves': self.blocked_moves,
+        }
@@ -0,0 +1,45 @@
+"""Recent guestbook posts kept in memory.
+
+Every connect used to query guestbook.db for the latest messages. The
+newest posts now live in a ring buffer that add_guestbook_post writes
+through to, so connects (and the first history pages) never touch SQLite.
+Older pages are read from the DB by id cursor.
+"""
+from collections import deque
+
+
+class GuestbookBuffer:
+    """Ring buffer of the newest posts, oldest first. Posts are dicts with an 'id'."""
+
+    def __init__(self, capacity=200):
+        self.capacity = capacity
+        self._posts = deque(maxlen=capacity)
+        self.complete = True  # Buffer holds every post ever written (nothing older in the DB)
+
+    def __len__(self):
+        return len(self._posts)
+
+    def load(self, posts, complete):
+        """Fill from the DB (posts oldest first)"""
+        self._posts.clear()
+        self._posts.extend(posts[-self.capacity:])
+        self.complete = complete and len(posts) <= self.capacity
+
+    def append(self, post):
+        if len(self._posts) == self.capacity:
+            self.complete = False
+        self._posts.append(post)
+
+    def page(self, before=None, limit=20):
+        """
+        Up to `limit` posts older than id `before` (newest first),
+        or None if the buffer can't answer and the DB has to.
+        """
+        found = []
+        for post in reversed(self._posts):
+            if before is not None and post['id'] >= before:
+                continue
+            found.append(post)
+            if len(found) == limit:
+                return found
+        return found if self.complete else None
@@ -0,0 +1,110 @@
+"""Area-of-interest (AOI) grid for Socket.IO fan-out.
+
+The world is split into square cells. Every sid is subscribed to the room of
+its own cell and of the cells around it, so an event that happens inside a
+cell only has to be emitted to that one cell's room to reach every player
+who can see it.
+"""
+import math
+
+
+class InterestGrid:
+    """Tracks which cell every sid is in and which cell rooms it listens to"""
+
+    def __init__(self, cell_size=600, radius=1, prefix='aoi', origin=0):
+        self.cell_size = cell_size
+        self.radius = radius
+        self.prefix = prefix
+        self.origin = origin  # shifts cell borders, e.g. to line up with another grid
+        self.cells = {}    # sid -> (cx, cy)
+        self.members = {}  # (cx, cy) -> set of sids standing in that cell
+
+    def cell_of(self, x, y):
+        return (math.floor((x + self.origin) / self.cell_size),
+                math.floor((y + self.origin) / self.cell_size))
+
+    def room(self, cell):
+        """Room name for a cell (everyone whose view covers the cell is in it)"""
+        return f"{self.prefix}:{cell[0]}:{cell[1]}"
+
+    def room_at(self, x, y):
+        return self.room(self.cell_of(x, y))
+
+    def neighbourhood(self, cell):
+        """All cells visible from `cell` (including itself)"""
+        cx, cy = cell
+        r = self.radius
+        return {(cx + dx, cy + dy) for dx in range(-r, r + 1) for dy in range(-r, r + 1)}
+
+    def sids_in(self, cells):
+        """All sids standing in any of the given cells"""
+        found = set()
+        for cell in cells:
+            found |= self.members.get(cell, set())
+        return found
+
+    def visible_to(self, sid):
+        """Sids that `sid` can currently see (excluding itself)"""
+        cell = self.cells.get(sid)
+        if cell is None:
+            return set()
+        return self.sids_in(self.neighbourhood(cell)) - {sid}
+
+    def place(self, sid, x, y):
+        """
+        Put (or move) a sid at x, y.
+        Returns (rooms_to_join, rooms_to_leave, entered_sids, left_sids);
+        all empty when the sid stayed in the same cell.
+        """
+        new_cell = self.cell_of(x, y)
+        old_cell = self.cells.get(sid)
+        if old_cell == new_cell:
+            return [], [], set(), set()
+
+        old_view = self.neighbourhood(old_cell) if old_cell is not None else set()
+        new_view = self.neighbourhood(new_cell)
+
+        # Snapshot neighbours before moving so the sid never shows up in its own lists
+        if old_cell is not None:
+            self.members[old_cell].discard(sid)
+            if not self.members[old_cell]:
+                del self.members[old_cell]
+        entered = self.sids_in(new_view - old_view)
+        left = self.sids_in(old_view - new_view)
+
+        self.cells[sid] = new_cell
+        self.members.setdefault(new_cell, set()).add(sid)
+
+        rooms_to_join = [self.room(c) for c in new_view - old_view]
+        rooms_to_leave = [self.room(c) for c in old_view - new_view]
+        return rooms_to_join, rooms_to_leave, entered, left
+
+    def remove(self, sid):
+        """Forget a sid. Returns the sids that could still see it."""
+        cell = self.cells.pop(sid, None)
+        if cell is None:
+            return set()
+        self.members[cell].discard(sid)
+        if not self.members[cell]:
+            del self.members[cell]
+        return self.sids_in(self.neighbourhood(cell))
+
+    def frames(self, changes):
+        """
+        Group per-sid changes ({sid: payload}) into one frame per occupied cell.
+        Yields (recipient_sids, {sid: payload}) where the frame holds every change
+        visible from that cell, so all recipients standing in it share one frame.
+        """
+        by_cell = {}
+        for sid, payload in changes.items():
+            cell = self.cells.get(sid)
+            if cell is not None:
+                by_cell.setdefault(cell, {})[sid] = payload
+
+        for cell, recipients in self.members.items():
+            frame = {}
+            for visible_cell in self.neighbourhood(cell):
+                if visible_cell in by_cell:
+                    frame.update(by_cell[visible_cell])
+            if frame:
+                yield list(recipients), frame
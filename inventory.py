@@ -0,0 +1,345 @@
+"""Write-behind inventories for online players.
+
+Every inventory request used to go straight to users.db (the full update
+endpoint deleted and re-inserted every row). Now each user's inventory is
+loaded once into an Inventory object and all mutations happen in memory on
+the event loop. InventoryStore flushes dirty inventories to users.db in
+batches, one SQLite transaction per batch, on an interval and when a player
+leaves.
+
+Crash safety: a batch commits atomically (WAL), and an inventory is only
+marked clean if nothing changed it while its snapshot was being written, so
+a failed or racing flush is simply retried on the next one. A hard crash
+loses at most the changes made since the last flush interval.
+
+Requests that await (World DB, Users DB) between reading and changing an
+inventory hold it with `async with store.using(user_id) as inv`; a held
+inventory is never released or evicted, so their change can't land on a
+copy that was already dropped and would never be flushed.
+
+With several workers only one of them may have a user's inventory loaded.
+`before_load` (the server's claim_inventory) runs before every load and
+makes the previous owner hand_over() its copy: wait for its requests,
+flush, forget. The new owner reads the DB only after that.
+"""
+import asyncio
+import contextlib
+import time
+
+INVENTORY_SLOTS = 40
+
+
+class Inventory:
+    """One user's slots, mutated in memory. Every change bumps `version`."""
+
+    def __init__(self, user_id, rows=()):
+        self.user_id = user_id
+        self.slots = {}  # slot_index -> [item_id, quantity]
+        for item_id, quantity, slot_index in rows:
+            self.slots[slot_index] = [item_id, quantity]
+        self.version = 0
+        self.saved_version = 0
+        self.touched_at = time.monotonic()
+
+    @property
+    def dirty(self):
+        return self.version != self.saved_version
+
+    def _changed(self):
+        self.version += 1
+
+    def items(self):
+        """Inventory as the API returns it"""
+        return [
+            {"item_id": item_id, "quantity": quantity, "slot_index": slot}
+            for slot, (item_id, quantity) in sorted(self.slots.items())
+        ]
+
+    def rows(self):
+        """(item_id, quantity, slot_index) tuples for the inventory table"""
+        return [(item_id, quantity, slot) for slot, (item_id, quantity) in self.slots.items()]
+
+    def snapshot(self):
+        return {slot: tuple(entry) for slot, entry in self.slots.items()}
+
+    def restore(self, snapshot):
+        self.slots = {slot: list(entry) for slot, entry in snapshot.items()}
+        self._changed()
+
+    def diff(self, before):
+        """Slots changed / emptied since `before` (a snapshot())"""
+        changed = [
+            {"item_id": item_id, "quantity": quantity, "slot_index": slot}
+            for slot, (item_id, quantity) in sorted(self.slots.items())
+            if before.get(slot) != (item_id, quantity)
+        ]
+        removed = sorted(slot for slot in before if slot not in self.slots)
+        return {"changed": changed, "removed": removed}
+
+    def replace(self, items):
+        """Overwrite everything (items are (item_id, quantity, slot_index))"""
+        self.slots = {slot: [item_id, quantity] for item_id, quantity, slot in items if quantity > 0}
+        self._changed()
+
+    def get(self, slot):
+        """(item_id, quantity) in a slot, or None"""
+        entry = self.slots.get(slot)
+        return tuple(entry) if entry else None
+
+    def move(self, slot_from, slot_to):
+        """Swap two slots. False if the source is empty."""
+        if slot_from not in self.slots:
+            return False
+        src = self.slots.pop(slot_from)
+        dst = self.slots.pop(slot_to, None)
+        self.slots[slot_to] = src
+        if dst:
+            self.slots[slot_from] = dst
+        self._changed()
+        return True
+
+    def take(self, slot, quantity=1):
+        """Remove up to `quantity` from a slot. Returns (item_id, taken) or None."""
+        entry = self.slots.get(slot)
+        if not entry:
+            return None
+        taken = min(quantity, entry[1])
+        entry[1] -= taken
+        if entry[1] <= 0:
+            del self.slots[slot]
+        self._changed()
+        return entry[0], taken
+
+    def split(self, slot_from, slot_to, quantity):
+        """Move `quantity` from one stack into an empty (or same-item) slot"""
+        src = self.slots.get(slot_from)
+        dst = self.slots.get(slot_to)
+        if not src or slot_from == slot_to or quantity <= 0 or quantity > src[1]:
+            return False
+        if dst and dst[0] != src[0]:
+            return False
+        if quantity == src[1]:
+            del self.slots[slot_from]
+        else:
+            src[1] -= quantity
+        if dst:
+            dst[1] += quantity
+        else:
+            self.slots[slot_to] = [src[0], quantity]
+        self._changed()
+        return True
+
+    def count(self, item_id):
+        return sum(quantity for stored, quantity in self.slots.values() if stored == item_id)
+
+    def missing(self, costs):
+        """First item_id in {item_id: qty} we don't have enough of, or None"""
+        for item_id, qty in costs.items():
+            if self.count(item_id) < qty:
+                return item_id
+        return None
+
+    def remove_items(self, costs):
+        """Deduct {item_id: qty} across stacks. Check missing() first."""
+        for item_id, qty in costs.items():
+            for slot in sorted(self.slots):
+                if qty <= 0:
+                    break
+                entry = self.slots[slot]
+                if entry[0] != item_id:
+                    continue
+                taken = min(qty, entry[1])
+                entry[1] -= taken
+                qty -= taken
+                if entry[1] <= 0:
+                    del self.slots[slot]
+        self._changed()
+
+    def add(self, item_id, quantity):
+        """Stack onto an existing slot or use the first free one. False if full."""
+        for entry in self.slots.values():
+            if entry[0] == item_id:
+                entry[1] += quantity
+                self._changed()
+                return True
+        for slot in range(INVENTORY_SLOTS):
+            if slot not in self.slots:
+                self.slots[slot] = [item_id, quantity]
+                self._changed()
+                return True
+        return False
+
+
+class InventoryStore:
+    """Authoritative in-memory inventories backed by a SQLitePool (write-behind)"""
+
+    def __init__(self, pool, batch_size=200, before_load=None):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.before_load = before_load  # async fn(user_id), e.g. take it over from another worker
+        self._live = {}     # user_id -> Inventory
+        self._loading = {}  # user_id -> Future[Inventory]
+        self._in_use = {}   # user_id -> requests holding it (see using())
+        self._unused = {}   # user_id -> Event set when the last request lets go (hand_over waits on it)
+        self._flush_lock = asyncio.Lock()
+
+        # Metrics
+        self.loads = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.inventories_written = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.flush_seconds = 0.0
+
+    def __len__(self):
+        return len(self._live)
+
+    @property
+    def dirty_count(self):
+        return sum(1 for inv in self._live.values() if inv.dirty)
+
+    async def _load(self, user_id):
+        if self.before_load:
+            await self.before_load(user_id)
+
+        def fetch_rows(conn):
+            return conn.execute(
+                "SELECT item_id, quantity, slot_index FROM inventory WHERE user_id = ?",
+                (user_id,)
+            ).fetchall()
+
+        inv = Inventory(user_id, await self.pool.run(fetch_rows))
+        self._live[user_id] = inv
+        self.loads += 1
+        return inv
+
+    def _start_load(self, user_id):
+        pending = self._loading.get(user_id)
+        if pending is None:
+            # Concurrent callers share one load so nobody mutates a copy that gets replaced
+            pending = asyncio.ensure_future(self._load(user_id))
+            self._loading[user_id] = pending
+            pending.add_done_callback(lambda _: self._loading.pop(user_id, None))
+        return pending
+
+    async def get(self, user_id):
+        """The user's live Inventory (loaded from the DB on first use)"""
+        inv = self._live.get(user_id)
+        if inv is None:
+            inv = await self._start_load(user_id)
+        inv.touched_at = time.monotonic()
+        return inv
+
+    @contextlib.asynccontextmanager
+    async def using(self, user_id):
+        """The user's live Inventory, kept loaded until the block ends"""
+        self._in_use[user_id] = self._in_use.get(user_id, 0) + 1
+        try:
+            yield await self.get(user_id)
+        finally:
+            self._in_use[user_id] -= 1
+            if not self._in_use[user_id]:
+                del self._in_use[user_id]
+                unused = self._unused.pop(user_id, None)
+                if unused:
+                    unused.set()
+
+    def preload(self, user_id):
+        """Start loading in the background (login / join), errors are only logged"""
+        if user_id in self._live:
+            return
+        def report(future):
+            if not future.cancelled() and future.exception():
+                print(f"Inventory preload error for user {user_id}: {future.exception()}")
+        self._start_load(user_id).add_done_callback(report)
+
+    async def flush(self, user_ids=None):
+        """Write dirty inventories (all, or only `user_ids`) in batched transactions"""
+        async with self._flush_lock:
+            candidates = self._live.values() if user_ids is None else \
+                [self._live[u] for u in user_ids if u in self._live]
+            # Snapshot on the event loop; the write runs off it
+            pending = [(inv, inv.version, inv.rows()) for inv in candidates if inv.dirty]
+
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+
+                def write_batch(conn):
+                    for inv, _, rows in batch:
+                        conn.execute("DELETE FROM inventory WHERE user_id = ?", (inv.user_id,))
+                        conn.executemany(
+                            "INSERT INTO inventory (user_id, item_id, quantity, slot_index) VALUES (?, ?, ?, ?)",
+                            [(inv.user_id, item_id, quantity, slot) for item_id, quantity, slot in rows]
+                        )
+
+                started_at = time.perf_counter()
+                try:
+                    await self.pool.run(write_batch)
+                except Exception as e:
+                    # Nothing was committed, the inventories stay dirty for the next flush
+                    self.flush_errors += 1
+                    print(f"Inventory flush error: {e}")
+                    continue
+                elapsed = time.perf_counter() - started_at
+
+                for inv, version, _ in batch:
+                    inv.saved_version = max(inv.saved_version, version)
+                self.flushes += 1
+                self.inventories_written += len(batch)
+                self.last_flush_seconds = elapsed
+                self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+                self.flush_seconds += elapsed
+
+    async def release(self, user_id):
+        """Flush and forget a user's inventory (player left)"""
+        inv = self._live.get(user_id)
+        if inv is None:
+            return
+        touched_at = inv.touched_at
+        await self.flush([user_id])
+        # Keep it if the user came back (or changed it) while we were writing, or a request still holds it
+        if self._live.get(user_id) is inv and not inv.dirty and inv.touched_at == touched_at \
+                and user_id not in self._in_use:
+            del self._live[user_id]
+
+    async def hand_over(self, user_id):
+        """Flush and forget a user's inventory as soon as no request holds it (another worker takes it over)"""
+        pending = self._loading.get(user_id)
+        if pending:
+            await asyncio.wait([pending])
+        while True:
+            while user_id in self._in_use:
+                await self._unused.setdefault(user_id, asyncio.Event()).wait()
+            inv = self._live.get(user_id)
+            if inv is None:
+                return
+            errors = self.flush_errors
+            await self.flush([user_id])
+            # A request may have picked it up during the write; then go round again
+            if self._live.get(user_id) is inv and not inv.dirty and user_id not in self._in_use:
+                del self._live[user_id]
+                return
+            if self.flush_errors > errors:
+                await asyncio.sleep(1)  # the DB is failing, don't spin on it
+
+    def evict_idle(self, keep, idle_seconds=600):
+        """Drop clean inventories untouched for a while, except users in `keep` or held by a request"""
+        cutoff = time.monotonic() - idle_seconds
+        for user_id, inv in list(self._live.items()):
+            if user_id not in keep and user_id not in self._in_use and not inv.dirty and inv.touched_at < cutoff:
+                del self._live[user_id]
+
+    def stats(self):
+        return {
+            'loaded': len(self._live),
+            'dirty': self.dirty_count,
+            'in_use': len(self._in_use),
+            'loads': self.loads,
+            'flushes': self.flushes,
+            'flush_errors': self.flush_errors,
+            'inventories_written': self.inventories_written,
+            'last_flush_ms': self.last_flush_seconds * 1000,
+            'max_flush_ms': self.max_flush_seconds * 1000,
+            'avg_flush_ms': (self.flush_seconds / self.flushes * 1000) if self.flushes else 0.0,
+        }
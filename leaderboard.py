@@ -0,0 +1,362 @@
+"""Materialized minigame leaderboards.
+
+`leaderboard` keeps the full score history (one row per submit). Reads used
+to GROUP BY over all of it; now every submit also upserts the player's best
+score into `best_scores`, one row per (game_id, period, period_key, user_id):
+
+    period 'all'  -> period_key ''
+    period 'day'  -> period_key '2026-10-17'  (KST)
+    period 'week' -> period_key '2026-W42'    (KST, ISO weeks: Monday to Sunday,
+                                               a week spanning New Year is one window)
+
+Each board that is read gets loaded once into a Board: (-score,
+achieved_at, user_id) keys in a SortedKeys, a sorted list cut into buckets
+of at most 2 * BUCKET_LOAD keys with a Fenwick tree over the bucket sizes.
+Reads never touch SQL: a player's rank and the entry at a rank are
+O(log n), and a new personal best is O(log n) plus a shift inside one
+bounded bucket (a plain sorted list would shift up to n keys per update).
+"""
+import asyncio
+import bisect
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+KST = timezone(timedelta(hours=9))
+PERIODS = ('all', 'day', 'week')
+BUCKET_LOAD = 512
+
+
+def period_key(period, when=None):
+    """
+    Window a moment falls into ('' for all-time)
+
+    >>> period_key('week', datetime(2026, 12, 31, 23, 59, tzinfo=KST))
+    '2026-W53'
+    >>> period_key('week', datetime(2027, 1, 1, 0, 0, tzinfo=KST))
+    '2026-W53'
+    >>> period_key('week', datetime(2027, 1, 4, tzinfo=KST))
+    '2027-W01'
+    """
+    if period == 'all':
+        return ''
+    when = when or datetime.now(KST)
+    if period == 'day':
+        return when.strftime('%Y-%m-%d')
+    if period == 'week':
+        return when.strftime('%G-W%V')
+    raise ValueError(f"Unknown period: {period}")
+
+
+def week_key_sql(local):
+    """
+    SQL for period_key('week') of a local time expression. Older SQLite has no
+    %G / %V, so it goes through the week's Thursday, which always lies in the
+    ISO year and is day 1-7 of ISO week 1.
+    """
+    thursday = f"date({local}, 'weekday 0', '-3 days')"
+    return f"printf('%s-W%02d', strftime('%Y', {thursday}), (strftime('%j', {thursday}) - 1) / 7 + 1)"
+
+
+def migrate_best_scores(conn):
+    """Create best_scores and backfill it from the score history (idempotent)"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS best_scores (
+            game_id TEXT NOT NULL,
+            period TEXT NOT NULL,
+            period_key TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            score INTEGER NOT NULL,
+            achieved_at TEXT NOT NULL,
+            PRIMARY KEY (game_id, period, period_key, user_id)
+        )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_best_scores_rank ON best_scores(game_id, period, period_key, score DESC)"
+    )
+
+    # History timestamps are UTC (CURRENT_TIMESTAMP); windows are in KST.
+    # achieved_at is approximated by the first submit in the window (it only breaks ties).
+    local = "datetime(timestamp, '+9 hours')"
+    key_exprs = {'all': "''", 'day': f"strftime('%Y-%m-%d', {local})", 'week': week_key_sql(local)}
+
+    if conn.execute("SELECT 1 FROM best_scores LIMIT 1").fetchone():
+        # Weeks used to be keyed '%Y-W%W', which split the week around New Year in two.
+        # achieved_at is local time inside its window, so a row keyed any other way is an old one.
+        stale = conn.execute(f"""
+            SELECT 1 FROM best_scores WHERE period = 'week' AND period_key != {week_key_sql('achieved_at')} LIMIT 1
+        """).fetchone()
+        if not stale:
+            return
+        conn.execute("DELETE FROM best_scores WHERE period = 'week'")
+        periods = ('week',)
+    else:
+        periods = PERIODS
+
+    for period in periods:
+        key_expr = key_exprs[period]
+        conn.execute(f"""
+            INSERT INTO best_scores (game_id, period, period_key, user_id, score, achieved_at)
+            SELECT game_id, '{period}', {key_expr}, user_id, MAX(score), MIN({local})
+            FROM leaderboard
+            GROUP BY game_id, {key_expr}, user_id
+        """)
+    if periods == ('week',):
+        print("Rebuilt weekly best scores with ISO week keys")
+        return
+    count = conn.execute("SELECT COUNT(*) FROM best_scores WHERE period = 'all'").fetchone()[0]
+    if count:
+        print(f"Backfilled best scores for {count} players")
+
+
+class SortedKeys:
+    """
+    Sorted unique keys in buckets of at most 2 * BUCKET_LOAD, with a Fenwick
+    tree over the bucket sizes for positions. add / remove / index / [i] are
+    O(log n); the index is rebuilt (O(n / BUCKET_LOAD)) only when a bucket
+    splits or empties.
+    """
+
+    def __init__(self, keys=()):
+        keys = sorted(keys)
+        self._buckets = [keys[i:i + BUCKET_LOAD] for i in range(0, len(keys), BUCKET_LOAD)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._len = len(keys)
+        self._rebuild_index()
+
+    def __len__(self):
+        return self._len
+
+    def _rebuild_index(self):
+        size = len(self._buckets)
+        tree = [0] * (size + 1)
+        for i, bucket in enumerate(self._buckets, 1):
+            tree[i] += len(bucket)
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _grow(self, bucket_index, delta):
+        i = bucket_index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _count_before(self, bucket_index):
+        """Keys in the buckets before bucket_index"""
+        total, i = 0, bucket_index
+        while i:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def add(self, key):
+        if not self._buckets:
+            self._buckets, self._maxes, self._len = [[key]], [key], 1
+            self._rebuild_index()
+            return
+        b = min(bisect.bisect_left(self._maxes, key), len(self._buckets) - 1)
+        bucket = self._buckets[b]
+        bisect.insort(bucket, key)
+        self._maxes[b] = bucket[-1]
+        self._len += 1
+        if len(bucket) > 2 * BUCKET_LOAD:
+            self._buckets[b:b + 1] = [bucket[:BUCKET_LOAD], bucket[BUCKET_LOAD:]]
+            self._maxes[b:b + 1] = [bucket[BUCKET_LOAD - 1], bucket[-1]]
+            self._rebuild_index()
+        else:
+            self._grow(b, 1)
+
+    def remove(self, key):
+        b = bisect.bisect_left(self._maxes, key)
+        bucket = self._buckets[b]
+        del bucket[bisect.bisect_left(bucket, key)]
+        self._len -= 1
+        if bucket:
+            self._maxes[b] = bucket[-1]
+            self._grow(b, -1)
+        else:
+            del self._buckets[b]
+            del self._maxes[b]
+            self._rebuild_index()
+
+    def index(self, key):
+        """Position of a key that is present"""
+        b = bisect.bisect_left(self._maxes, key)
+        return self._count_before(b) + bisect.bisect_left(self._buckets[b], key)
+
+    def _locate(self, index):
+        """(bucket, offset in it) of position `index`, walking down the Fenwick tree"""
+        b, step = 0, 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            if b + step < len(self._tree) and self._tree[b + step] <= index:
+                b += step
+                index -= self._tree[b]
+            step >>= 1
+        return b, index
+
+    def __getitem__(self, index):
+        if not 0 <= index < self._len:
+            raise IndexError(index)
+        b, offset = self._locate(index)
+        return self._buckets[b][offset]
+
+    def islice(self, start, stop):
+        """Keys at positions start..stop-1, locating only the first one"""
+        start, stop = max(0, start), min(stop, self._len)
+        if start >= stop:
+            return
+        b, offset = self._locate(start)
+        for _ in range(stop - start):
+            if offset == len(self._buckets[b]):
+                b, offset = b + 1, 0
+            yield self._buckets[b][offset]
+            offset += 1
+
+
+class Board:
+    """One leaderboard window, kept sorted in memory"""
+
+    def __init__(self, rows=()):
+        self._by_user = {}    # user_id -> key
+        self._names = {}      # user_id -> nickname
+        for user_id, nickname, score, achieved_at in rows:
+            self._by_user[user_id] = (-score, achieved_at, user_id)
+            self._names[user_id] = nickname
+        self._keys = SortedKeys(self._by_user.values())  # (-score, achieved_at, user_id)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def update(self, user_id, nickname, score, achieved_at):
+        """Record a score; only a new personal best changes the board"""
+        self._names[user_id] = nickname
+        old = self._by_user.get(user_id)
+        if old is not None:
+            if score <= -old[0]:
+                return False
+            self._keys.remove(old)
+        key = (-score, achieved_at, user_id)
+        self._keys.add(key)
+        self._by_user[user_id] = key
+        return True
+
+    def _entries(self, start, stop):
+        start = max(0, start)
+        return [
+            {"rank": rank, "nickname": self._names.get(user_id), "score": -score, "user_id": user_id}
+            for rank, (score, _, user_id) in enumerate(self._keys.islice(start, stop), start + 1)
+        ]
+
+    def top(self, n):
+        return self._entries(0, n)
+
+    def rank_of(self, user_id):
+        """1-based rank, or None if the user has no score here"""
+        key = self._by_user.get(user_id)
+        if key is None:
+            return None
+        return self._keys.index(key) + 1
+
+    def around(self, user_id, count):
+        """Entries from `count` places above to `count` below the user"""
+        rank = self.rank_of(user_id)
+        if rank is None:
+            return []
+        return self._entries(rank - 1 - count, rank + count)
+
+
+class LeaderboardStore:
+    """Loads boards from best_scores on first read and keeps them up to date on submit"""
+
+    def __init__(self, pool, max_boards=32):
+        self.pool = pool
+        self.max_boards = max_boards
+        self._boards = OrderedDict()  # (game_id, period, period_key) -> Board
+        self._loading = {}            # same key -> Future[Board]
+        self.loads = 0
+
+    async def _load(self, board_id):
+        def fetch_rows(conn):
+            return conn.execute("""
+                SELECT b.user_id, u.nickname, b.score, b.achieved_at
+                FROM best_scores b JOIN users u ON u.id = b.user_id
+                WHERE b.game_id = ? AND b.period = ? AND b.period_key = ?
+            """, board_id).fetchall()
+
+        board = Board(await self.pool.run(fetch_rows))
+        self._boards[board_id] = board
+        self.loads += 1
+        while len(self._boards) > self.max_boards:
+            self._boards.popitem(last=False)
+        return board
+
+    async def board(self, game_id, period='all', key=None):
+        """The Board for a game and window (current window unless `key` is given)"""
+        board_id = (game_id, period, period_key(period) if key is None else key)
+        board = self._boards.get(board_id)
+        if board is not None:
+            self._boards.move_to_end(board_id)
+            return board
+        pending = self._loading.get(board_id)
+        if pending is None:
+            pending = asyncio.ensure_future(self._load(board_id))
+            self._loading[board_id] = pending
+            pending.add_done_callback(lambda _: self._loading.pop(board_id, None))
+        return await pending
+
+    async def submit(self, user_id, game_id, score):
+        """
+        Store a score in the history and every window's best.
+        Returns (True if it beat the all-time best, the entry other workers apply()).
+        """
+        now = datetime.now(KST)
+        achieved_at = now.strftime('%Y-%m-%d %H:%M:%S')
+        keys = {period: period_key(period, now) for period in PERIODS}
+        # Load first so a board never misses a write that lands while it is loading
+        boards = {period: await self.board(game_id, period, keys[period]) for period in PERIODS}
+
+        def write_score(conn):
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO leaderboard (user_id, game_id, score) VALUES (?, ?, ?)",
+                (user_id, game_id, score)
+            )
+            for period in PERIODS:
+                cursor.execute("""
+                    INSERT INTO best_scores (game_id, period, period_key, user_id, score, achieved_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (game_id, period, period_key, user_id)
+                    DO UPDATE SET score = excluded.score, achieved_at = excluded.achieved_at
+                    WHERE excluded.score > best_scores.score
+                """, (game_id, period, keys[period], user_id, score, achieved_at))
+            row = cursor.execute("SELECT nickname FROM users WHERE id = ?", (user_id,)).fetchone()
+            return row[0] if row else None
+
+        nickname = await self.pool.run(write_score)
+        improved = {period: board.update(user_id, nickname, score, achieved_at) for period, board in boards.items()}
+        entry = {'game_id': game_id, 'keys': keys, 'user_id': user_id, 'nickname': nickname,
+                 'score': score, 'achieved_at': achieved_at}
+        return improved['all'], entry
+
+    def apply(self, game_id, keys, user_id, nickname, score, achieved_at):
+        """A score another worker stored (submit's entry): update the boards loaded (or loading) here"""
+        def update_loaded(done):
+            if not done.cancelled() and not done.exception():
+                done.result().update(user_id, nickname, score, achieved_at)
+
+        for period, key in keys.items():
+            board_id = (game_id, period, key)
+            board = self._boards.get(board_id)
+            if board is not None:
+                board.update(user_id, nickname, score, achieved_at)
+            elif board_id in self._loading:
+                # The load may have read the table before the score was written
+                self._loading[board_id].add_done_callback(update_loaded)
+
+    def stats(self):
+        return {
+            'boards': len(self._boards),
+            'entries': sum(len(board) for board in self._boards.values()),
+            'loads': self.loads,
+        }
@@ -0,0 +1,242 @@
+"""Prometheus metrics, served as text at /metrics.
+
+A small in-process registry (no prometheus_client dependency) in the text
+exposition format 0.0.4:
+    - counters and histograms updated on the hot paths: Socket.IO events
+      (MeteredServer), outbound emits (MeteredPacket), HTTP routes
+      (HttpMetricsMiddleware), tick durations and SQLite calls (observe
+      callbacks on TickScheduler / SQLitePool)
+    - gauges read when /metrics is scraped, from callbacks or from the
+      stats() dicts the caches and stores already keep
+
+Every process keeps its own numbers; scrape each worker separately.
+"""
+import bisect
+import time
+
+import socketio
+from socketio import packet
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, (bool, int)):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic count per label set: counter.inc('label', ..., amount=1)"""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}  # label values -> total
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def families(self):
+        yield self.name, self.help, 'counter', [
+            (self.name, self.label_names, values, total) for values, total in self._values.items()
+        ]
+
+
+class Histogram:
+    """Distribution per label set: histogram.observe(seconds, 'label', ...)"""
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [count per bucket..., count above, sum]
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def families(self):
+        le_names = self.label_names + ('le',)
+        samples = []
+        for values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', le_names, values + (_number(bound),), cumulative))
+            samples.append((f'{self.name}_sum', self.label_names, values, series[-1]))
+            samples.append((f'{self.name}_count', self.label_names, values, cumulative))
+        yield self.name, self.help, 'histogram', samples
+
+
+class CallbackGauge:
+    """Gauge read at scrape time: fn() returns a number, or {label value(s): number}"""
+
+    def __init__(self, name, help, fn, labels=()):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.label_names = tuple(labels)
+
+    def families(self):
+        value = self.fn()
+        if isinstance(value, dict):
+            samples = [(self.name, self.label_names, key if isinstance(key, tuple) else (key,), v)
+                       for key, v in value.items()]
+        else:
+            samples = [(self.name, (), (), value)]
+        yield self.name, self.help, 'gauge', samples
+
+
+class StatsGauges:
+    """
+    One gauge per numeric key of a stats() dict, named <prefix>_<key>.
+    With `label`, fn returns {label value: stats dict} (e.g. per event type).
+    """
+
+    def __init__(self, prefix, help, fn, label=None):
+        self.prefix = prefix
+        self.help = help
+        self.fn = fn
+        self.label = label
+
+    def families(self):
+        stats = self.fn()
+        rows = stats.items() if self.label else [(None, stats)]
+        by_name = {}
+        for label_value, row in rows:
+            for key, value in row.items():
+                if not isinstance(value, (int, float)):
+                    continue
+                name = f'{self.prefix}_{key}'
+                labels = ((self.label,), (label_value,)) if self.label else ((), ())
+                by_name.setdefault(name, []).append((name, *labels, value))
+        for name, samples in by_name.items():
+            yield name, f'{self.help} ({name[len(self.prefix) + 1:]})', 'gauge', samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, fn, labels=()):
+        return self._add(CallbackGauge(name, help, fn, labels))
+
+    def stats(self, prefix, help, fn, label=None):
+        return self._add(StatsGauges(prefix, help, fn, label))
+
+    def render(self):
+        """Everything in the Prometheus text format"""
+        lines = []
+        for metric in self._metrics:
+            try:
+                families = list(metric.families())
+            except Exception as e:
+                # One broken source must not take the whole scrape down
+                print(f"Metrics: could not collect {getattr(metric, 'name', None) or metric.prefix}: {e}")
+                continue
+            for name, help, kind, samples in families:
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                for sample_name, label_names, label_values, value in samples:
+                    lines.append(f'{sample_name}{_labels_text(label_names, label_values)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def metered_packet_class(metrics):
+    """Socket.IO packet class that counts outbound events and their encoded bytes"""
+    emits = metrics.counter('huey_socketio_emits_total',
+                            'Outbound Socket.IO events (once per emit, not per recipient)', ('event',))
+    emitted_bytes = metrics.counter('huey_socketio_emit_bytes_total',
+                                    'Encoded size of outbound Socket.IO events (once per emit)', ('event',))
+
+    class MeteredPacket(packet.Packet):
+        def encode(self):
+            encoded = super().encode()
+            if self.packet_type in (packet.EVENT, packet.BINARY_EVENT) and self.data:
+                parts = encoded if isinstance(encoded, list) else [encoded]
+                size = sum(len(p.encode('utf-8')) if isinstance(p, str) else len(p) for p in parts)
+                emits.inc(self.data[0])
+                emitted_bytes.inc(self.data[0], amount=size)
+            return encoded
+
+    return MeteredPacket
+
+
+class MeteredServer(socketio.AsyncServer):
+    """AsyncServer that times every handled event and counts outbound emits"""
+
+    def __init__(self, *args, metrics, **kwargs):
+        super().__init__(*args, serializer=metered_packet_class(metrics), **kwargs)
+        self._event_seconds = metrics.histogram('huey_socketio_event_seconds',
+                                                'Socket.IO event handler latency', ('event',))
+        self._event_errors = metrics.counter('huey_socketio_event_errors_total',
+                                             'Socket.IO event handlers that raised', ('event',))
+
+    async def _trigger_event(self, event, namespace, *args):
+        # Client-chosen names without a handler share one label (keeps the label set bounded)
+        label = event if event in self.handlers.get(namespace, {}) else 'unhandled'
+        start = time.perf_counter()
+        try:
+            return await super()._trigger_event(event, namespace, *args)
+        except Exception:
+            self._event_errors.inc(label)
+            raise
+        finally:
+            self._event_seconds.observe(time.perf_counter() - start, label)
+
+
+class HttpMetricsMiddleware:
+    """ASGI middleware: request count and latency per route template, method and status"""
+
+    def __init__(self, app, metrics):
+        self.app = app
+        self.requests = metrics.counter('huey_http_requests_total', 'HTTP requests', ('method', 'route', 'status'))
+        self.seconds = metrics.histogram('huey_http_request_seconds', 'HTTP request latency', ('method', 'route'))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Route template (/api/world/chunks/{cx}/{cy}) or mount prefix (/static), never the raw path
+            route = getattr(scope.get('route'), 'path', None) or scope.get('root_path') or 'unmatched'
+            self.seconds.observe(time.perf_counter() - start, scope['method'], route)
+            self.requests.inc(scope['method'], route, str(status[0]))
@@ -0,0 +1,121 @@
+"""Array-backed NPC simulation.
+
+NPC state is kept as a structure of NumPy arrays (one array per field, one
+slot per NPC) so a whole tick of movement and retargeting is a handful of
+vector operations instead of a Python loop over dicts.
+"""
+import numpy as np
+
+# Per-type tables: base speed (sent to clients) and the movement multiplier
+# applied on top of it every tick
+NPC_TYPE_SPEED = {'roach': 2.0, 'sheep': 1.0}
+NPC_TYPE_MOVE_SCALE = {'roach': 2.0, 'sheep': 1.2}
+
+ARRIVE_DISTANCE = 5      # Pick a new target once this close
+WANDER_RANGE = 200       # New targets are within +-WANDER_RANGE of the NPC
+SPAWN_TARGET_RANGE = 100
+
+
+class NpcStore:
+    """Structure-of-arrays store for all NPCs in the world"""
+
+    def __init__(self, count, types, map_size, seed=None):
+        self.types = list(types)
+        self.map_size = map_size
+        self.rng = np.random.default_rng(seed)
+
+        self.ids = [f"npc_{i}" for i in range(count)]
+        self.type_idx = self.rng.integers(0, len(self.types), size=count).astype(np.int8)
+        self.x = self.rng.integers(-map_size, map_size, size=count, endpoint=True).astype(np.float64)
+        self.y = self.rng.integers(-map_size, map_size, size=count, endpoint=True).astype(np.float64)
+        self.target_x = self.x + self.rng.integers(-SPAWN_TARGET_RANGE, SPAWN_TARGET_RANGE, size=count, endpoint=True)
+        self.target_y = self.y + self.rng.integers(-SPAWN_TARGET_RANGE, SPAWN_TARGET_RANGE, size=count, endpoint=True)
+
+        type_speed = np.array([NPC_TYPE_SPEED.get(t, 1.0) for t in self.types])
+        type_scale = np.array([NPC_TYPE_MOVE_SCALE.get(t, 1.0) for t in self.types])
+        self.speed = type_speed[self.type_idx]
+        self.step_size = self.speed * type_scale[self.type_idx]
+
+        self.hp = np.full(count, 100, dtype=np.int32)
+        self.max_hp = np.full(count, 100, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def step(self, mask=None):
+        """
+        Advance every NPC by one tick (move toward target or pick a new one).
+        With a boolean `mask` only those NPCs move (a region's own NPCs).
+        """
+        dx = self.target_x - self.x
+        dy = self.target_y - self.y
+        dist = np.hypot(dx, dy)
+
+        arrived = dist < ARRIVE_DISTANCE
+        if mask is not None:
+            arrived &= mask
+        n_arrived = int(np.count_nonzero(arrived))
+        if n_arrived:
+            jitter_x = self.rng.integers(-WANDER_RANGE, WANDER_RANGE, size=n_arrived, endpoint=True)
+            jitter_y = self.rng.integers(-WANDER_RANGE, WANDER_RANGE, size=n_arrived, endpoint=True)
+            self.target_x[arrived] = np.clip(self.x[arrived] + jitter_x, -self.map_size, self.map_size)
+            self.target_y[arrived] = np.clip(self.y[arrived] + jitter_y, -self.map_size, self.map_size)
+
+        # NPCs that just retargeted stand still this tick (same as the old loop)
+        moving = ~arrived if mask is None else mask & ~arrived
+        scale = np.divide(self.step_size, dist, out=np.zeros_like(dist), where=moving)
+        self.x += dx * scale
+        self.y += dy * scale
+
+    # --- Payload adapters ---
+
+    def roster(self):
+        """Fixed per-NPC data (ids, types, max hp) for the welcome bundle"""
+        return {
+            'types': self.types,
+            'ids': self.ids,
+            'type': self.type_idx.tolist(),
+            'max_hp': self.max_hp.tolist(),
+        }
+
+    def state(self):
+        """Changing per-NPC data in roster order, positions rounded to whole pixels"""
+        return {
+            'x': np.rint(self.x).astype(np.int32).tolist(),
+            'y': np.rint(self.y).astype(np.int32).tolist(),
+            'hp': self.hp.tolist(),
+        }
+
+    def handoff(self, index):
+        """Everything another process needs to take over simulating one NPC"""
+        return {
+            'index': int(index),
+            'x': float(self.x[index]), 'y': float(self.y[index]),
+            'target_x': float(self.target_x[index]), 'target_y': float(self.target_y[index]),
+            'hp': int(self.hp[index]),
+        }
+
+    def take_over(self, data):
+        """Apply a handoff() from another process"""
+        i = data['index']
+        self.x[i], self.y[i] = data['x'], data['y']
+        self.target_x[i], self.target_y[i] = data['target_x'], data['target_y']
+        self.hp[i] = data['hp']
+
+    def to_npc_data(self):
+        """Full NPC list in the `npc_data` format"""
+        return [
+            {
+                'id': self.ids[i],
+                'type': self.types[self.type_idx[i]],
+                'x': float(self.x[i]),
+                'y': float(self.y[i]),
+                'target_x': float(self.target_x[i]),
+                'target_y': float(self.target_y[i]),
+                'speed': float(self.speed[i]),
+                'hp': int(self.hp[i]),
+                'max_hp': int(self.max_hp[i]),
+                'last_move': 0
+            }
+            for i in range(len(self.ids))
+        ]
@@ -0,0 +1,99 @@
+"""Password hashing off the event loop.
+
+bcrypt with 12 rounds takes ~250 ms of CPU. Running it inside an async
+handler freezes NPC ticks and movement broadcasts for every player, so all
+hashing goes through PasswordHasher: a small dedicated worker pool (bcrypt
+releases the GIL while hashing) with a concurrency limit and a bounded
+wait queue. When the queue is full the request is rejected immediately
+instead of piling up during a login storm.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+BCRYPT_ROUNDS = 12
+
+
+def hash_password(password: str) -> str:
+    """Hash a password using bcrypt (blocking)"""
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """Verify a password against its hash (blocking)"""
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+
+class HasherBusy(Exception):
+    """Raised when too many hash requests are already waiting"""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded worker pool and keeps queue metrics"""
+
+    def __init__(self, max_workers=2, max_pending=64):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bcrypt')
+        self._slots = None  # asyncio.Semaphore, created on the running loop
+
+        # Metrics
+        self.waiting = 0          # queued, not yet hashing
+        self.in_flight = 0        # currently hashing
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0   # total time spent queued
+        self.hash_seconds = 0.0   # total time spent hashing
+
+    @property
+    def queue_depth(self):
+        return self.waiting + self.in_flight
+
+    async def _run(self, fn, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        if self.waiting >= self.max_pending:
+            self.rejected += 1
+            raise HasherBusy()
+
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        started_at = time.perf_counter()
+        self.wait_seconds += started_at - queued_at
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.hash_seconds += time.perf_counter() - started_at
+            self._slots.release()
+
+    async def hash(self, password):
+        return await self._run(hash_password, password)
+
+    async def verify(self, password, password_hash):
+        return await self._run(verify_password, password, password_hash)
+
+    def stats(self):
+        return {
+            'waiting': self.waiting,
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'avg_wait_ms': (self.wait_seconds / self.completed * 1000) if self.completed else 0.0,
+            'avg_hash_ms': (self.hash_seconds / self.completed * 1000) if self.completed else 0.0,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
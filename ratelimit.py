@@ -0,0 +1,81 @@
+"""Per-connection rate limits for inbound socket events.
+
+Every (sid, event) pair gets a token bucket: `rate` events per second with
+room for a `burst`. Events over budget are dropped, or coalesced by the
+caller (player_move holds them back for the next snapshot). Over-budget events
+also drain a second bucket that refills at `tolerance` per second; a client
+that empties it (flooding for about FLOOD_SECONDS beyond its tolerance)
+should be disconnected.
+
+Counts of allowed / dropped / coalesced events are kept per event type.
+"""
+import time
+
+ALLOW = 'allow'
+LIMITED = 'limited'
+FLOOD = 'flood'
+
+FLOOD_SECONDS = 5
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now):
+        """Spend one token if there is one"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class InputLimiter:
+    """Token buckets per sid and event type"""
+
+    def __init__(self, limits, clock=time.monotonic):
+        self.limits = limits  # event -> (rate, burst, tolerance)
+        self.clock = clock
+        self._buckets = {}  # sid -> {event: (budget, excess)}
+
+        # Metrics
+        self.counts = {event: {'allowed': 0, 'dropped': 0, 'coalesced': 0} for event in limits}
+        self.floods = 0
+
+    def check(self, sid, event, coalesce=False):
+        """ALLOW, LIMITED (over budget: drop or coalesce it) or FLOOD (disconnect the client)"""
+        now = self.clock()
+        buckets = self._buckets.setdefault(sid, {})
+        pair = buckets.get(event)
+        if pair is None:
+            rate, burst, tolerance = self.limits[event]
+            pair = buckets[event] = (TokenBucket(rate, burst, now),
+                                     TokenBucket(tolerance, tolerance * FLOOD_SECONDS, now))
+        budget, excess = pair
+
+        if budget.take(now):
+            self.counts[event]['allowed'] += 1
+            return ALLOW
+        if not excess.take(now):
+            self.counts[event]['dropped'] += 1
+            self.floods += 1
+            return FLOOD
+        self.counts[event]['coalesced' if coalesce else 'dropped'] += 1
+        return LIMITED
+
+    def forget(self, sid):
+        self._buckets.pop(sid, None)
+
+    def stats(self):
+        return {
+            'clients': len(self._buckets),
+            'floods': self.floods,
+            'events': {event: dict(counts) for event, counts in self.counts.items()},
+        }
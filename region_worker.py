@@ -0,0 +1,114 @@
+"""Simulation process for one region of the world (see regions.py).
+
+Every region runs its own NPC tick loop on its own core. NPCs that walk
+across a border are handed to the neighbouring region's process. Players
+stay with the gateways (server.py), which also check their movement.
+
+    python scripts/state_broker.py --port 6399
+    export HUEY_STATE_URL=redis://127.0.0.1:6399 HUEY_REGIONS=2x2
+    python region_worker.py            # one process per region
+    python region_worker.py --region 3 # or just one of them
+    uvicorn server:socket_app --port 8000
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+import wire
+from npc_engine import NpcStore
+from regions import npc_seed_from_env, region_grid_from_env
+from replication import DeltaReplicator
+from scheduler import TickScheduler
+from state_backend import create_backend
+
+# Same world as server.py
+MAP_SIZE = 900
+NPC_COUNT = int(os.environ.get('HUEY_NPC_COUNT', 10))
+NPC_TYPES = ['roach', 'sheep']
+NPC_KEYFRAME_EVERY = 50 # ticks (100ms each)
+TICK_SECONDS = 0.1
+
+
+class Region:
+    """NPCs of one region"""
+
+    def __init__(self, region, grid, backend):
+        self.region = region
+        self.grid = grid
+        self.backend = backend
+        self.npcs = NpcStore(NPC_COUNT, NPC_TYPES, MAP_SIZE, seed=npc_seed_from_env(grid))
+        # Everyone builds the same store, each region starts with the NPCs that spawned in it
+        self.owned = grid.regions_of(self.npcs.x, self.npcs.y) == region
+        self.replicator = DeltaReplicator(keyframe_every=NPC_KEYFRAME_EVERY)
+        self.emitter = backend.client_manager(write_only=True)
+
+    async def handle_message(self, message):
+        if message['op'] == 'npc_handoff':
+            self.npcs.take_over(message['npc'])
+            self.owned[message['npc']['index']] = True
+
+    async def tick(self):
+        self.npcs.step(self.owned)
+
+        # NPCs that walked out belong to the neighbour now
+        regions = self.grid.regions_of(self.npcs.x, self.npcs.y)
+        leaving = np.flatnonzero(self.owned & (regions != self.region))
+        for i in leaving:
+            self.owned[i] = False
+            await self.backend.publish({'op': 'npc_handoff', 'npc': self.npcs.handoff(i)},
+                                       self.grid.channel(int(regions[i])))
+
+        # Only our own NPCs go on the wire (the rest of the store is stale here)
+        changed, qx, qy, _ = self.replicator.frame(self.npcs.x, self.npcs.y)
+        changed = changed[self.owned[changed] | np.isin(changed, leaving)]
+        if not len(changed):
+            return
+        await self.emitter.emit('npcs_moved', wire.encode_npcs_json(self.npcs.ids, changed, qx, qy), room=wire.JSON_ROOM)
+        await self.emitter.emit('npcs_moved', wire.encode_npcs_binary(changed, qx, qy), room=wire.BINARY_ROOM)
+        # Gateways keep a copy for their welcome bundles
+        await self.backend.publish({
+            'op': 'npcs',
+            'index': changed.tolist(),
+            'x': qx[changed].tolist(),
+            'y': qy[changed].tolist(),
+            'hp': self.npcs.hp[changed].tolist()
+        })
+
+    async def run(self):
+        await self.backend.start(self.handle_message, channels=(self.grid.channel(self.region),))
+        print(f"Region {self.region}/{len(self.grid)}: simulating {int(self.owned.sum())} NPCs")
+        # Fixed timestep like the gateway's NPC loop. Never idles: players next door can see our NPCs.
+        scheduler = TickScheduler()
+        scheduler.add(f'region_{self.region}', self.tick, TICK_SECONDS, budget=0.02, catch_up=3)
+        await scheduler.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--region', type=int, help="region id (default: start one process per region)")
+    args = parser.parse_args()
+
+    grid = region_grid_from_env(MAP_SIZE)
+    url = os.environ.get('HUEY_STATE_URL')
+    if grid is None or not url:
+        sys.exit("Set HUEY_REGIONS (e.g. 2x2) and HUEY_STATE_URL")
+
+    if args.region is None:
+        procs = [subprocess.Popen([sys.executable, __file__, '--region', str(r)]) for r in range(len(grid))]
+        try:
+            for proc in procs:
+                proc.wait()
+        except KeyboardInterrupt:
+            for proc in procs:
+                proc.terminate()
+        return
+
+    asyncio.run(Region(args.region, grid, create_backend(url)).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Region sharding of the world simulation.
+
+With HUEY_REGIONS=<cols>x<rows> (e.g. 2x2) the NPC area is cut into a grid
+of regions and every region is simulated by its own `region_worker.py`
+process, so NPC ticks use one core per region instead of sharing the
+gateway's event loop. Everything goes through the state broker:
+
+    huey:region:<id>   NPCs handed over by neighbouring regions
+    huey:state         'npcs' updates so gateways can build welcome bundles
+
+NPCs move with npcs_moved emitted by the region that owns them. All processes
+build the NpcStore from the same seed (HUEY_NPC_SEED) so ids, types and
+start positions agree without a handshake; each region starts out owning
+the NPCs that spawned inside it.
+"""
+import math
+import os
+
+import numpy as np
+
+DEFAULT_NPC_SEED = 7
+
+
+class RegionGrid:
+    """cols x rows regions over the square [-half_size, half_size]"""
+
+    def __init__(self, cols, rows, half_size):
+        self.cols = cols
+        self.rows = rows
+        self.half_size = half_size
+        self.width = 2 * half_size / cols
+        self.height = 2 * half_size / rows
+
+    def __len__(self):
+        return self.cols * self.rows
+
+    def region_of(self, x, y):
+        """Region id owning x, y (positions outside the grid go to the nearest edge region)"""
+        col = min(max(math.floor((x + self.half_size) / self.width), 0), self.cols - 1)
+        row = min(max(math.floor((y + self.half_size) / self.height), 0), self.rows - 1)
+        return row * self.cols + col
+
+    def regions_of(self, xs, ys):
+        """region_of for whole arrays"""
+        cols = np.clip(np.floor((np.asarray(xs) + self.half_size) / self.width), 0, self.cols - 1)
+        rows = np.clip(np.floor((np.asarray(ys) + self.half_size) / self.height), 0, self.rows - 1)
+        return (rows * self.cols + cols).astype(np.int64)
+
+    def channel(self, region):
+        return f'huey:region:{region}'
+
+
+def region_grid_from_env(half_size):
+    """RegionGrid for HUEY_REGIONS ('2x2', or '4' for 4x1), None when unset"""
+    value = os.environ.get('HUEY_REGIONS', '').strip().lower()
+    if not value:
+        return None
+    cols, _, rows = value.partition('x')
+    return RegionGrid(int(cols), int(rows or 1), half_size)
+
+
+def npc_seed_from_env(grid):
+    """NpcStore seed: shared (and fixed) whenever regions are on, random otherwise"""
+    if 'HUEY_NPC_SEED' in os.environ:
+        return int(os.environ['HUEY_NPC_SEED'])
+    return DEFAULT_NPC_SEED if grid else None
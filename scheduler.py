@@ -0,0 +1,140 @@
+"""Fixed-timestep scheduler for the world systems.
+
+Every system (NPC tick, snapshot broadcast, world clock, inventory flush)
+runs at its own fixed interval on one loop. Deadlines are kept on a fixed
+grid (next = previous deadline + interval, never "now + interval"), so the
+rate doesn't drift with how long the work takes.
+
+A system that falls behind runs its missed ticks back to back, up to
+`catch_up` of them (a fixed-step simulation then still advances in step
+with wall time); beyond that the backlog is skipped and counted. Every run
+is timed against the system's budget and overruns are counted (and logged).
+While `is_idle()` is true (e.g. nobody is connected) systems that don't set
+`when_idle` are paused and the loop only wakes for the others (and to poll
+is_idle every IDLE_POLL seconds); paused systems restart on a fresh grid.
+"""
+import asyncio
+import math
+import time
+
+IDLE_POLL = 0.25  # s
+
+
+class System:
+    """One scheduled job and its timing metrics"""
+
+    def __init__(self, name, fn, interval, budget, catch_up, when_idle):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.budget = budget
+        self.catch_up = catch_up
+        self.when_idle = when_idle
+        self.next_due = None
+
+        # Metrics
+        self.runs = 0
+        self.overruns = 0
+        self.skipped = 0  # ticks dropped because we were too far behind
+        self.errors = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+
+
+class TickScheduler:
+    """Runs registered systems at fixed timesteps on one task"""
+
+    def __init__(self, is_idle=None, clock=time.monotonic, observe=None):
+        self.is_idle = is_idle or (lambda: False)
+        self.clock = clock
+        self.observe = observe  # callback(system name, seconds) after every run
+        self.systems = []
+        self.idle = False
+        self._running = False
+
+    def add(self, name, fn, interval, budget=None, catch_up=0, when_idle=False):
+        """
+        Schedule `await fn()` every `interval` seconds. `budget` (default: half
+        the interval) is how long a run may take before it counts as an overrun.
+        """
+        system = System(name, fn, interval, budget if budget is not None else interval / 2, catch_up, when_idle)
+        self.systems.append(system)
+        return system
+
+    async def _run_system(self, system):
+        start = self.clock()
+        try:
+            await system.fn()
+        except Exception as e:
+            system.errors += 1
+            print(f"Scheduler: {system.name} error: {e}")
+        duration = self.clock() - start
+        system.runs += 1
+        system.last_duration = duration
+        system.max_duration = max(system.max_duration, duration)
+        system.total_duration += duration
+        if self.observe:
+            self.observe(system.name, duration)
+        if duration > system.budget:
+            system.overruns += 1
+            if system.overruns == 1 or system.overruns % 100 == 0:
+                print(f"Scheduler: {system.name} took {duration * 1000:.1f}ms "
+                      f"(budget {system.budget * 1000:.1f}ms, {system.overruns} overruns)")
+
+    async def tick(self):
+        """Run whatever is due now, return when to wake up next"""
+        now = self.clock()
+        idle = self.is_idle()
+        if self.idle and not idle:
+            # Players are back: paused systems start over instead of catching up on the idle time
+            for system in self.systems:
+                if not system.when_idle:
+                    system.next_due = now
+        self.idle = idle
+
+        active = [s for s in self.systems if s.when_idle or not idle]
+        for system in sorted(active, key=lambda s: s.next_due):
+            if system.next_due > now:
+                continue
+            behind = math.floor((now - system.next_due) / system.interval)  # whole ticks missed on top of this one
+            if behind > system.catch_up:
+                # Too far behind: drop the backlog, stay on the grid
+                dropped = behind - system.catch_up
+                system.skipped += dropped
+                system.next_due += dropped * system.interval
+            await self._run_system(system)
+            system.next_due += system.interval
+            now = self.clock()
+
+        next_due = min((s.next_due for s in active), default=math.inf)
+        return min(next_due, now + IDLE_POLL) if idle else next_due
+
+    async def run(self):
+        start = self.clock()
+        for system in self.systems:
+            system.next_due = start + system.interval
+        self._running = True
+        while self._running:
+            next_due = await self.tick()
+            await asyncio.sleep(max(0.0, next_due - self.clock()))
+
+    def stop(self):
+        self._running = False
+
+    def stats(self):
+        return {
+            s.name: {
+                'interval': s.interval,
+                'budget': s.budget,
+                'runs': s.runs,
+                'overruns': s.overruns,
+                'skipped': s.skipped,
+                'paused': self.idle and not s.when_idle,
+                'errors': s.errors,
+                'last_ms': round(s.last_duration * 1000, 3),
+                'max_ms': round(s.max_duration * 1000, 3),
+                'avg_ms': round(s.total_duration / s.runs * 1000, 3) if s.runs else 0.0,
+            }
+            for s in self.systems
+        }
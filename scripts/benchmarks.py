@@ -0,0 +1,288 @@
+"""Micro-benchmarks for the server hot paths, each on its own.
+
+Imports server.py into a throwaway workspace (fresh databases, nothing is
+listening) and times the real functions:
+    - npc_tick[n]            one update_npcs() tick (step, delta frame, wire encoding)
+    - nickname_scan[n]       the duplicate-nickname check in set_nickname with n players online
+    - remove_object          POST /api/world/remove with 100k objects placed
+    - get_leaderboard_cold   GET /api/minigame/leaderboard loading the board from 1M score rows
+    - get_leaderboard_warm   the same with the board already in memory
+    - current_players[n]     Socket.IO encoding of a current_players payload with n players
+
+Every round runs a benchmark enough times to take at least MIN_ROUND_SECONDS
+(with the garbage collector off, like timeit). A benchmark regressed when
+even its fastest round is more than --threshold slower than the baseline's
+median round (noise only ever makes rounds slower, so this errs on the quiet
+side); it is then measured again (up to RERUNS times) and only reported as a
+regression (exit code 1) if it stays slow. The numbers depend on the
+machine, so save a baseline on the machine you compare on:
+
+    python scripts/benchmarks.py --save      # record scripts/benchmark_baseline.json
+    python scripts/benchmarks.py             # compare against it
+    python scripts/benchmarks.py --filter npc_tick --threshold 0.5
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import inspect
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, 'scripts', 'benchmark_baseline.json')
+
+NPC_COUNTS = (100, 1000, 10000)
+NICKNAME_PLAYERS = (1000, 10000)
+PLACED_OBJECTS = 100_000
+SCORE_ROWS = 1_000_000
+SCORE_PLAYERS = 100_000
+CURRENT_PLAYERS = (100, 1000)
+
+MIN_ROUND_SECONDS = 0.02
+RERUNS = 2
+
+
+def make_workspace():
+    """Temp dir with fresh databases and the static files, like a new install"""
+    path = tempfile.mkdtemp(prefix='huey-bench-')
+    os.makedirs(os.path.join(path, 'db', 'user'))
+    os.makedirs(os.path.join(path, 'db', 'world'))
+    os.symlink(os.path.join(ROOT, 'static'), os.path.join(path, 'static'))
+    for script in ('init_user_db.py', 'init_world_db.py'):
+        subprocess.run([sys.executable, os.path.join(ROOT, 'scripts', script)], cwd=path,
+                       check=True, stdout=subprocess.DEVNULL)
+    return path
+
+
+async def measure(fn, rounds, number=None):
+    """
+    Seconds per call: `rounds` samples of `number` calls each (fn may be async).
+    Without `number`, as many calls as fill MIN_ROUND_SECONDS (the calibration doubles as warmup).
+    """
+    async def timed(n):
+        start = time.perf_counter()
+        for _ in range(n):
+            result = fn()
+            if inspect.isawaitable(result):
+                await result
+        return time.perf_counter() - start
+
+    if number is None:
+        number = 1
+        while await timed(number) < MIN_ROUND_SECONDS:
+            number *= 2
+    else:
+        await timed(1)
+
+    samples = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            samples.append(await timed(number) / number)
+    finally:
+        gc.enable()
+    return {
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'max': max(samples),
+        'mean': statistics.fmean(samples),
+        'rounds': rounds,
+        'number': number,
+    }
+
+
+def is_slower(result, old, threshold):
+    """Best round now vs a typical round in the baseline"""
+    return old is not None and result['min'] > old['median'] * (1 + threshold)
+
+
+# --- benchmarks: each one yields (name, fn, rounds, number) after its setup ---
+
+def bench_npc_tick(server):
+    from npc_engine import NpcStore
+    from replication import DeltaReplicator
+    import wire
+    # Pretend clients of both protocols are connected so both encodings run
+    server.client_protocols.update({'bench-json': wire.PROTOCOL_JSON, 'bench-binary': wire.PROTOCOL_BINARY})
+    for count in NPC_COUNTS:
+        server.npc_store = NpcStore(count, server.NPC_TYPES, server.MAP_SIZE, seed=1)
+        server.npc_replicator = DeltaReplicator(keyframe_every=server.NPC_KEYFRAME_EVERY)
+        # One keyframe interval per round, so every round does the same work
+        yield f'npc_tick[{count}]', server.update_npcs, 10, server.NPC_KEYFRAME_EVERY
+    server.client_protocols.clear()
+
+
+def bench_nickname_scan(server):
+    for count in NICKNAME_PLAYERS:
+        server.players.clear()
+        server.players.update({f'sid{i}': {'nickname': f'Player{i}'} for i in range(count)})
+        # A free name is the worst case: every player is compared
+        yield f'nickname_scan[{count}]', lambda: server.nickname_taken('Newcomer', 'sid-new'), 30, None
+    server.players.clear()
+
+
+def bench_remove_object(server):
+    token, username = 'bench-token', 'bench'
+    server.session_cache.put(token, 1, username, datetime.now() + timedelta(days=1))
+    side = int(PLACED_OBJECTS ** 0.5) + 1
+    spots = [((i % side - side // 2) * server.BUILD_GRID, (i // side - side // 2) * server.BUILD_GRID)
+             for i in range(PLACED_OBJECTS)]
+    with sqlite3.connect(server.WORLD_DB_PATH) as conn:
+        conn.executemany(
+            "INSERT INTO placed_objects (type, x, y, owner_username, cell_x, cell_y) VALUES (?, ?, ?, ?, ?, ?)",
+            [('fence_wood', x, y, username, *server.grid_cell(x, y)) for x, y in spots]
+        )
+    # Every call removes a different object
+    random.Random(1).shuffle(spots)
+    targets = iter(spots)
+
+    def remove_next():
+        x, y = next(targets)
+        return server.remove_object(server.RemoveObjectRequest(token=token, x=x, y=y))
+
+    yield 'remove_object', remove_next, 30, None
+
+
+def bench_get_leaderboard(server):
+    rng = random.Random(1)
+    with sqlite3.connect(server.USER_DB_PATH) as conn:
+        conn.executemany(
+            "INSERT INTO users (id, username, password_hash, nickname) VALUES (?, ?, '', ?)",
+            [(i, f'scorer{i}', f'Scorer{i}') for i in range(1, SCORE_PLAYERS + 1)]
+        )
+        conn.executemany(
+            "INSERT INTO leaderboard (user_id, game_id, score) VALUES (?, 'cactus_dodge', ?)",
+            [(rng.randint(1, SCORE_PLAYERS), rng.randint(0, 100_000)) for _ in range(SCORE_ROWS)]
+        )
+        conn.execute("DELETE FROM best_scores")
+        server.migrate_best_scores(conn)
+
+    def cold():
+        server.leaderboards._boards.clear()
+        return server.get_leaderboard('cactus_dodge', 'all', 10)
+
+    yield 'get_leaderboard_cold', cold, 5, 1
+    yield 'get_leaderboard_warm', lambda: server.get_leaderboard('cactus_dodge', 'all', 10), 30, None
+
+
+def bench_current_players(server):
+    from socketio import packet
+    rng = random.Random(1)
+    for count in CURRENT_PLAYERS:
+        players = {
+            f'{i:020d}': {'x': rng.randint(-100, 100), 'y': rng.randint(-100, 100),
+                          'color': f'#{rng.randint(0, 0xFFFFFF):06x}', 'nickname': f'Player{i}',
+                          'skin': 'skin_fox', 'hp': 100, 'max_hp': 100, 'eid': i, 'user_id': i,
+                          'level': 1, 'exp': 0}
+            for i in range(count)
+        }
+        yield (f'current_players[{count}]',
+               lambda: server.sio.packet_class(packet.EVENT, data=['current_players', players]).encode(), 30, None)
+
+
+BENCHMARKS = (bench_npc_tick, bench_nickname_scan, bench_remove_object, bench_get_leaderboard, bench_current_players)
+
+
+async def run_benchmarks(server, name_filter, baseline, threshold):
+    results = {}
+    for bench in BENCHMARKS:
+        # Setup runs lazily, so filtered-out benchmarks skip their setup too
+        if name_filter and name_filter not in bench.__name__[len('bench_'):]:
+            continue
+        for name, fn, rounds, number in bench(server):
+            result = await measure(fn, rounds, number)
+            # A slow run has to reproduce before it counts (keep the fastest)
+            reruns = 0
+            while reruns < RERUNS and is_slower(result, baseline.get(name), threshold):
+                rerun = await measure(fn, rounds, number)
+                result = min(result, rerun, key=lambda r: r['min'])
+                reruns += 1
+            results[name] = {**result, 'reruns': reruns}
+    return results
+
+
+def fmt(seconds):
+    if seconds < 1e-3:
+        return f'{seconds * 1e6:.1f}us'
+    if seconds < 1:
+        return f'{seconds * 1e3:.2f}ms'
+    return f'{seconds:.2f}s'
+
+
+def compare(results, baseline, threshold):
+    """Print the results against the baseline, return the names that regressed"""
+    regressions = []
+    print(f"{'benchmark':<24} {'min':>10} {'median':>10} {'max':>10}  min vs baseline median")
+    for name, result in results.items():
+        old = baseline.get(name)
+        note = ''
+        if old:
+            note = f"{result['min'] / old['median']:.2f}x"
+            if is_slower(result, old, threshold):
+                note += '  REGRESSION'
+                regressions.append(name)
+        if result['reruns']:
+            note += f" ({result['reruns']} reruns)"
+        print(f"{name:<24} {fmt(result['min']):>10} {fmt(result['median']):>10} {fmt(result['max']):>10}  {note}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='flag benchmarks more than this fraction slower than the baseline')
+    parser.add_argument('--filter', help='only run benchmarks whose group name contains this')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    workspace = make_workspace()
+    os.chdir(workspace)
+    sys.path.insert(0, ROOT)
+    try:
+        # server.py logs with print(); keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            import server
+            # A new baseline is measured as is, no reruns against the old one
+            results = asyncio.run(run_benchmarks(server, args.filter, {} if args.save else baseline, args.threshold))
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                            'processor': platform.processor() or platform.machine()},
+                'saved_at': datetime.now().isoformat(timespec='seconds'),
+                'results': {**baseline, **results},
+            }, f, indent=2)
+            f.write('\n')
+        print(f"Saved baseline to {args.baseline}")
+    elif regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Two server workers sharing one broker: players on different workers see each other move.
+
+Starts scripts/state_broker.py and two `server:socket_app` processes on
+separate ports, connects one client to each and checks that
+    - each client learns about the other player (current_players / new_player)
+    - a move on one worker arrives in the other client's world_snapshot
+Run from the project root (the databases must exist):
+
+    python scripts/check_two_workers.py
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+class Player:
+    """Socket.IO client that records who it has seen and where"""
+
+    def __init__(self, name):
+        self.name = name
+        self.sio = socketio.AsyncClient()
+        self.seen = {}  # sid -> (x, y)
+
+        @self.sio.on('current_players')
+        async def on_current_players(players):
+            for sid, player in players.items():
+                self.seen[sid] = (player['x'], player['y'])
+
+        @self.sio.on('new_player')
+        async def on_new_player(data):
+            self.seen[data['sid']] = (data['player']['x'], data['player']['y'])
+
+        @self.sio.on('world_snapshot')
+        async def on_snapshot(data):
+            for sid, pos in data['players'].items():
+                self.seen[sid] = (pos['x'], pos['y'])
+
+    @property
+    def sid(self):
+        # The Socket.IO sid the server knows us by (client.sid is the Engine.IO one)
+        return self.sio.get_sid()
+
+    async def wait_until(self, check, timeout=5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if check():
+                return True
+            await asyncio.sleep(0.05)
+        return False
+
+
+async def check(port_a, port_b):
+    a, b = Player('A'), Player('B')
+    await a.sio.connect(f'http://127.0.0.1:{port_a}')
+    await b.sio.connect(f'http://127.0.0.1:{port_b}')
+    failures = []
+    try:
+        if not await b.wait_until(lambda: a.sid in b.seen):
+            failures.append("B (worker 2) never saw A (worker 1) join")
+        if not await a.wait_until(lambda: b.sid in a.seen):
+            failures.append("A (worker 1) never saw B (worker 2) join")
+
+        await a.sio.emit('player_move', {'x': 42, 'y': -17})
+        if not await b.wait_until(lambda: b.seen.get(a.sid) == (42, -17)):
+            failures.append(f"B did not see A move (last seen at {b.seen.get(a.sid)})")
+
+        await b.sio.emit('player_move', {'x': -8, 'y': 55})
+        if not await a.wait_until(lambda: a.seen.get(b.sid) == (-8, 55)):
+            failures.append(f"A did not see B move (last seen at {a.seen.get(b.sid)})")
+    finally:
+        await a.sio.disconnect()
+        await b.sio.disconnect()
+    return failures
+
+
+def main():
+    broker_port, port_a, port_b = free_port(), free_port(), free_port()
+    env = {**os.environ, 'HUEY_STATE_URL': f'redis://127.0.0.1:{broker_port}'}
+    procs = [subprocess.Popen([sys.executable, 'scripts/state_broker.py', '--port', str(broker_port)], cwd=ROOT)]
+    try:
+        wait_for_port(broker_port)
+        for port in (port_a, port_b):
+            procs.append(subprocess.Popen(
+                [sys.executable, '-m', 'uvicorn', 'server:socket_app', '--port', str(port), '--log-level', 'warning'],
+                cwd=ROOT, env=env, stdout=subprocess.DEVNULL
+            ))
+        wait_for_port(port_a)
+        wait_for_port(port_b)
+
+        failures = asyncio.run(check(port_a, port_b))
+    finally:
+        # Workers first so they can still unregister their players from the broker
+        for proc in reversed(procs):
+            proc.terminate()
+            proc.wait()
+
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+    print("OK: players on different workers see each other join and move")
+
+
+if __name__ == "__main__":
+    main()
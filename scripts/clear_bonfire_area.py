@@ -1,34 +1,52 @@
+"""Remove the trees around the bonfire from the terrain (World DB, restart the server afterwards)"""
 import json
 import math
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import terrain
+from collision import WORLD_BOUNDS
 
 # Bonfire position
 BONFIRE_X = 80
 BONFIRE_Y = 50
 CLEAR_RADIUS = 350  # About 10 steps
 
-# Load the map
-with open('db/map/forest.json', 'r') as f:
-    trees = json.load(f)
-
-print(f"Original tree count: {len(trees)}")
+# Same terrain settings as server.py
+MAP_SIZE = 900
+SAFE_RADIUS = 150
+spec = terrain.make_spec(terrain.load_world_seed('db/map/terrain.json'), limit=MAP_SIZE, safe_radius=SAFE_RADIUS)
 
-# Filter out trees too close to bonfire
-filtered_trees = []
-removed_count = 0
+conn = sqlite3.connect('db/world/world.db')
+chunks = terrain.chunks_within(WORLD_BOUNDS)
 
-for tree in trees:
-    distance = math.sqrt((tree['x'] - BONFIRE_X)**2 + (tree['y'] - BONFIRE_Y)**2)
-    if distance >= CLEAR_RADIUS:
-        filtered_trees.append(tree)
-    else:
-        removed_count += 1
-        print(f"Removed tree at ({tree['x']}, {tree['y']}) - distance: {distance:.1f}px")
+# Worlds the server hasn't started on yet still have their trees in forest.json
+legacy_trees = None
+if os.path.exists('db/map/forest.json'):
+    with open('db/map/forest.json', 'r') as f:
+        legacy_trees = json.load(f)
+terrain.migrate_terrain(conn, legacy_trees, chunks)
 
+removed_count = 0
+for chunk in chunks:
+    trees = terrain.read_chunk(conn, chunk, spec)
+
+    # Filter out trees too close to bonfire
+    filtered_trees = []
+    for tree in trees:
+        distance = math.sqrt((tree['x'] - BONFIRE_X)**2 + (tree['y'] - BONFIRE_Y)**2)
+        if distance >= CLEAR_RADIUS:
+            filtered_trees.append(tree)
+        else:
+            removed_count += 1
+            print(f"Removed tree at ({tree['x']}, {tree['y']}) - distance: {distance:.1f}px")
+
+    if len(filtered_trees) != len(trees):
+        terrain.save_chunk(conn, chunk, filtered_trees)
+
+conn.commit()
+conn.close()
 print(f"\nRemoved {removed_count} trees near bonfire")
-print(f"New tree count: {len(filtered_trees)}")
-
-# Save the updated map
-with open('db/map/forest.json', 'w') as f:
-    json.dump(filtered_trees, f, indent=2)
-
-print("\nMap updated successfully!")
+print("\nTerrain updated successfully!")
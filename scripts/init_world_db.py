@@ -18,13 +18,19 @@ CREATE TABLE IF NOT EXISTS placed_objects (
     x REAL NOT NULL,
     y REAL NOT NULL,
     owner_username TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    cell_x INTEGER,
+    cell_y INTEGER
 )
 ''')
 
 # Index for spatial lookups (though basic for now)
 cursor.execute('CREATE INDEX IF NOT EXISTS idx_coords ON placed_objects(x, y)')
 
+# Grid cell lookups (48px build grid), one structure per cell (drops can share)
+cursor.execute('CREATE INDEX IF NOT EXISTS idx_cell ON placed_objects(cell_x, cell_y)')
+cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_cell_structure ON placed_objects(cell_x, cell_y) WHERE type NOT LIKE 'drop_%'")
+
 conn.commit()
 conn.close()
 
@@ -0,0 +1,395 @@
+"""Headless load test: simulated players against server.py (or server_3d.py).
+
+Every simulated player does what a browser client does:
+    - signs up (first run only) and logs in through /api/login
+    - connects over Socket.IO and joins with set_nickname (+ session token)
+    - walks random paths with player_move
+    - posts to the guestbook now and then
+    - places a fence next to itself and removes it again (server.py only;
+      it grants itself the wood first, like a client that went chopping)
+
+and the run ends with a report:
+    - join time: connect + set_nickname until the server acknowledged it
+    - move -> peer latency (p50/p99): from emitting player_move to another
+      player receiving that position (world_snapshot on server.py,
+      player_moved on server_3d.py)
+    - bytes per client: Socket.IO payloads received / sent, per second
+    - server CPU (only when the harness starts the server or gets --server-pid;
+      read from /proc, so Linux only)
+
+Needs the dev requirements (pip install -r requirements-dev.txt). By default
+the harness starts its own `<module>:socket_app` on a free port (run from the
+project root, the databases must exist):
+
+    python scripts/load_test.py --clients 50 --duration 60
+    python scripts/load_test.py --module server_3d --clients 20
+    python scripts/load_test.py --url http://127.0.0.1:8000 --server-pid 1234
+
+All clients share one process and event loop; the harness's own CPU use is
+reported too so you can tell when the load generator is the bottleneck.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import aiohttp
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'loadtest'
+WALK_SPEED = 150  # px/s, roughly the browser client's
+FENCE_COST = 2  # wood, see BUILD_COSTS in server.py
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, round(p / 100 * (len(values) - 1)))]
+
+
+def ms(seconds):
+    return '-' if seconds is None else f'{seconds * 1000:.1f}ms'
+
+
+def payload_size(data):
+    return len(data.encode('utf-8')) if isinstance(data, str) else len(data)
+
+
+class ProcessCPU:
+    """CPU seconds (user + system) another process has used so far, from /proc/<pid>/stat"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.ticks_per_second = os.sysconf('SC_CLK_TCK')
+
+    def seconds(self):
+        try:
+            with open(f'/proc/{self.pid}/stat') as f:
+                # The command name may contain spaces; the fields after it are fixed
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            return None
+        return (int(fields[11]) + int(fields[12])) / self.ticks_per_second
+
+
+class Stats:
+    """Numbers shared by all simulated players"""
+
+    def __init__(self):
+        self.login_times = []
+        self.join_times = []
+        self.move_latencies = []
+        self.sent_moves = {}  # (sid, x, y) -> time the move was emitted
+        self.joined = 0
+        self.corrections = 0
+        self.guestbook_posts = 0
+        self.placed = 0
+        self.removed = 0
+        self.errors = {}  # what -> count
+
+    def error(self, what):
+        self.errors[what] = self.errors.get(what, 0) + 1
+
+    def saw_position(self, observer_sid, sid, x, y):
+        if sid == observer_sid:
+            return
+        sent = self.sent_moves.get((sid, x, y))
+        if sent is not None:
+            self.move_latencies.append(time.perf_counter() - sent)
+
+    def forget_old_moves(self, max_age=10):
+        cutoff = time.perf_counter() - max_age
+        self.sent_moves = {key: t for key, t in self.sent_moves.items() if t > cutoff}
+
+
+class SimulatedPlayer:
+    """One account, one Socket.IO connection, a random walk and some chores"""
+
+    def __init__(self, index, url, http, stats, args):
+        self.username = f'{args.prefix}{index:04d}'
+        self.url = url
+        self.http = http
+        self.stats = stats
+        self.args = args
+        self.token = None
+        self.x = self.y = 0.0
+        self.joined = asyncio.Event()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.connected_at = None
+        self.disconnected_at = None
+
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self._count_bytes()
+
+        @self.sio.on('welcome')
+        async def on_welcome(data):
+            self._place_self(data.get('players', {}))
+
+        @self.sio.on('current_players')
+        async def on_current_players(players):
+            self._place_self(players)
+            # server_3d.py has no nickname_success: our own entry with our name is the ack
+            if players.get(self.sid, {}).get('nickname') == self.username:
+                self.joined.set()
+
+        @self.sio.on('nickname_success')
+        async def on_nickname_success(data):
+            self.joined.set()
+
+        @self.sio.on('nickname_error')
+        async def on_nickname_error(data):
+            self.stats.error('nickname_error')
+
+        @self.sio.on('world_snapshot')
+        async def on_snapshot(data):
+            for sid, pos in data['players'].items():
+                self.stats.saw_position(self.sid, sid, pos['x'], pos['y'])
+
+        @self.sio.on('player_moved')
+        async def on_player_moved(data):
+            self.stats.saw_position(self.sid, data['sid'], data['x'], data['y'])
+
+        @self.sio.on('position_correction')
+        async def on_correction(data):
+            self.stats.corrections += 1
+            self.x, self.y = data['x'], data['y']
+
+    def _count_bytes(self):
+        # Wrap the Engine.IO transport so we count what actually crosses the wire
+        handle_message = self.sio._handle_eio_message
+        send = self.sio.eio.send
+
+        async def counted_message(data):
+            self.bytes_in += payload_size(data)
+            await handle_message(data)
+
+        async def counted_send(data):
+            self.bytes_out += payload_size(data)
+            await send(data)
+
+        self.sio.eio.on('message', counted_message)
+        self.sio.eio.send = counted_send
+
+    @property
+    def sid(self):
+        return self.sio.get_sid()
+
+    def _place_self(self, players):
+        me = players.get(self.sid)
+        if me:
+            self.x, self.y = me['x'], me['y']
+
+    async def post(self, path, body):
+        """POST JSON, returns (status, json body or None)"""
+        async with self.http.post(self.url + path, json=body) as response:
+            try:
+                return response.status, await response.json()
+            except (aiohttp.ContentTypeError, ValueError):
+                return response.status, None
+
+    async def login(self):
+        status, _ = await self.post('/api/signup', {'username': self.username, 'password': PASSWORD,
+                                                    'nickname': self.username})
+        if status not in (200, 400):  # 400: the account is left over from an earlier run
+            self.stats.error(f'signup {status}')
+        start = time.perf_counter()
+        for attempt in range(10):
+            status, body = await self.post('/api/login', {'username': self.username, 'password': PASSWORD,
+                                                          'remember_me': True})
+            if status != 503:  # 503: bcrypt pool is full, back off like a user would
+                break
+            await asyncio.sleep(0.2 * (attempt + 1))
+        if status != 200:
+            self.stats.error(f'login {status}')
+            return False
+        self.token = body['token']
+        self.stats.login_times.append(time.perf_counter() - start)
+        return True
+
+    async def join(self):
+        start = time.perf_counter()
+        # server_3d.py's connect handler takes no auth
+        auth = {'welcome': 2} if self.args.module == 'server' else None
+        await self.sio.connect(self.url, transports=['websocket'], auth=auth)
+        self.connected_at = time.perf_counter()
+        await self.sio.emit('set_nickname', {'nickname': self.username, 'token': self.token})
+        try:
+            await asyncio.wait_for(self.joined.wait(), 10)
+        except asyncio.TimeoutError:
+            self.stats.error('join timeout')
+            return False
+        self.stats.join_times.append(time.perf_counter() - start)
+        self.stats.joined += 1
+        return True
+
+    async def walk(self, deadline):
+        step = WALK_SPEED / self.args.move_hz
+        target = None
+        while time.perf_counter() < deadline:
+            if target is None or abs(target[0] - self.x) + abs(target[1] - self.y) < step:
+                target = (random.uniform(-self.args.radius, self.args.radius),
+                          random.uniform(-self.args.radius, self.args.radius))
+            dx, dy = target[0] - self.x, target[1] - self.y
+            dist = max((dx * dx + dy * dy) ** 0.5, 1e-9)
+            self.x = round(self.x + dx / dist * min(step, dist), 2)
+            self.y = round(self.y + dy / dist * min(step, dist), 2)
+            self.stats.sent_moves[(self.sid, self.x, self.y)] = time.perf_counter()
+            await self.sio.emit('player_move', {'x': self.x, 'y': self.y})
+            await asyncio.sleep(1 / self.args.move_hz)
+
+    async def chatter(self, deadline):
+        while True:
+            await asyncio.sleep(random.uniform(5, 30))
+            if time.perf_counter() >= deadline:
+                return
+            await self.sio.emit('add_guestbook_post', {'message': f'{self.username} was here'})
+            self.stats.guestbook_posts += 1
+
+    async def build(self, deadline):
+        status, _ = await self.post('/api/inventory/update', {
+            'token': self.token, 'items': [{'item_id': 'wood', 'quantity': FENCE_COST * 10, 'slot_index': 0}]
+        })
+        if status != 200:
+            self.stats.error(f'inventory/update {status}')
+            return
+        while True:
+            await asyncio.sleep(random.uniform(5, 10))
+            if time.perf_counter() >= deadline:
+                return
+            # Two grid cells away so we don't wall ourselves in
+            spot = {'token': self.token, 'x': round(self.x + 96, 2), 'y': round(self.y, 2)}
+            status, _ = await self.post('/api/world/place', {**spot, 'type': 'fence_wood'})
+            if status != 200:
+                self.stats.error(f'place {status}')
+                continue
+            self.stats.placed += 1
+            await asyncio.sleep(3)
+            status, _ = await self.post('/api/world/remove', spot)
+            if status == 200:
+                self.stats.removed += 1
+            else:
+                self.stats.error(f'remove {status}')
+                if status in (404, 405):  # server_3d.py can't remove
+                    return
+
+    async def run(self, start_delay, deadline):
+        await asyncio.sleep(start_delay)
+        try:
+            if not await self.login() or not await self.join():
+                return
+            chores = [self.walk(deadline), self.chatter(deadline)]
+            if not self.args.no_build:
+                chores.append(self.build(deadline))
+            await asyncio.gather(*chores)
+        except Exception as e:
+            self.stats.error(type(e).__name__)
+            print(f"{self.username}: {e}")
+        finally:
+            self.disconnected_at = time.perf_counter()
+            if self.sio.connected:
+                await self.sio.disconnect()
+
+
+async def run_load(url, args, cpu):
+    stats = Stats()
+    async with aiohttp.ClientSession() as http:
+        start = time.perf_counter()
+        deadline = start + args.ramp + args.duration
+        clients = [SimulatedPlayer(i, url, http, stats, args) for i in range(args.clients)]
+        tasks = [asyncio.create_task(c.run(args.ramp * i / args.clients, deadline)) for i, c in enumerate(clients)]
+
+        # Server CPU is measured over the steady state (everyone ramped up)
+        await asyncio.sleep(args.ramp)
+        cpu_start, steady_start, own_cpu_start = cpu and cpu.seconds(), time.perf_counter(), time.process_time()
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(1)
+            stats.forget_old_moves()
+        cpu_end, steady_end, own_cpu_end = cpu and cpu.seconds(), time.perf_counter(), time.process_time()
+        await asyncio.gather(*tasks)
+
+    report(stats, clients, args, url)
+    steady = steady_end - steady_start
+    if cpu_start is not None and cpu_end is not None:
+        print(f"  server CPU    {(cpu_end - cpu_start) / steady * 100:.0f}% of one core (steady state)")
+    print(f"  harness CPU   {(own_cpu_end - own_cpu_start) / steady * 100:.0f}% of one core")
+
+
+def report(stats, clients, args, url):
+    connected = [c for c in clients if c.connected_at]
+    seconds = sum((c.disconnected_at - c.connected_at) for c in connected) or 1
+    print(f"Load test: {args.clients} clients for {args.duration}s (ramp {args.ramp}s) against {url}")
+    print(f"  joined        {stats.joined}/{args.clients}")
+    print(f"  login         p50 {ms(percentile(stats.login_times, 50))}  p99 {ms(percentile(stats.login_times, 99))}")
+    print(f"  join          p50 {ms(percentile(stats.join_times, 50))}  p99 {ms(percentile(stats.join_times, 99))}")
+    print(f"  move -> peer  p50 {ms(percentile(stats.move_latencies, 50))}  "
+          f"p99 {ms(percentile(stats.move_latencies, 99))}  ({len(stats.move_latencies)} samples)")
+    print(f"  corrections   {stats.corrections}")
+    print(f"  guestbook     {stats.guestbook_posts} posts sent")
+    print(f"  objects       {stats.placed} placed, {stats.removed} removed")
+    print(f"  per client    {sum(c.bytes_in for c in connected) / seconds / 1024:.1f} KB/s in, "
+          f"{sum(c.bytes_out for c in connected) / seconds / 1024:.1f} KB/s out")
+    if stats.errors:
+        print(f"  errors        {', '.join(f'{what}: {n}' for what, n in sorted(stats.errors.items()))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30, help='seconds of steady state after the ramp')
+    parser.add_argument('--ramp', type=float, default=5, help='seconds over which clients join')
+    parser.add_argument('--move-hz', type=float, default=20, help='player_move events per second per client')
+    parser.add_argument('--radius', type=float, default=400, help='clients walk within this distance of the origin')
+    parser.add_argument('--module', default='server', help='server module to start, or the one behind --url (server or server_3d)')
+    parser.add_argument('--url', help='use a running server instead of starting one')
+    parser.add_argument('--server-pid', type=int, help='measure the CPU of a running server')
+    parser.add_argument('--prefix', default='load', help='username prefix of the test accounts')
+    parser.add_argument('--no-build', action='store_true', help='skip placing and removing objects')
+    args = parser.parse_args()
+
+    proc = None
+    url = args.url
+    if not url:
+        port = free_port()
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', f'{args.module}:socket_app', '--port', str(port), '--log-level', 'warning'],
+            cwd=ROOT, stdout=subprocess.DEVNULL
+        )
+        wait_for_port(port)
+        url = f'http://127.0.0.1:{port}'
+    pid = proc.pid if proc else args.server_pid
+    cpu = ProcessCPU(pid) if pid and os.path.exists(f'/proc/{pid}') else None
+
+    try:
+        asyncio.run(run_load(url, args, cpu))
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Local stand-in for Redis, for running several server workers without one.
+
+Speaks just the RESP subset state_backend.py uses (GET, SET [NX] [PX], INCR,
+HSET, HDEL, HGETALL, PUBLISH, SUBSCRIBE, PING). Everything is in memory.
+
+    python scripts/state_broker.py --port 6399
+    HUEY_STATE_URL=redis://127.0.0.1:6399 uvicorn server:socket_app --port 8001
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from state_backend import read_reply
+
+values = {}       # key -> (value, expires_at or None)
+hashes = {}       # key -> {field: value}
+subscribers = {}  # channel -> set of writers
+
+
+def ok():
+    return b'+OK\r\n'
+
+
+def bulk(value):
+    if value is None:
+        return b'$-1\r\n'
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+def array(items):
+    return b'*%d\r\n' % len(items) + b''.join(bulk(item) for item in items)
+
+
+def get_value(key):
+    entry = values.get(key)
+    if entry is None:
+        return None
+    value, expires_at = entry
+    if expires_at is not None and expires_at <= time.monotonic():
+        del values[key]
+        return None
+    return value
+
+
+def run_command(args, writer):
+    name = args[0].upper()
+    if name == b'PING':
+        return b'+PONG\r\n'
+    if name == b'GET':
+        return bulk(get_value(args[1]))
+    if name == b'SET':
+        key, value = args[1], args[2]
+        options = [a.upper() for a in args[3:]]
+        if b'NX' in options and get_value(key) is not None:
+            return bulk(None)
+        expires_at = None
+        if b'PX' in options:
+            expires_at = time.monotonic() + int(args[3 + options.index(b'PX') + 1]) / 1000
+        values[key] = (value, expires_at)
+        return ok()
+    if name == b'INCR':
+        value = int(get_value(args[1]) or 0) + 1
+        values[args[1]] = (str(value).encode(), None)
+        return b':%d\r\n' % value
+    if name == b'HSET':
+        fields = hashes.setdefault(args[1], {})
+        added = 0
+        for i in range(2, len(args), 2):
+            added += args[i] not in fields
+            fields[args[i]] = args[i + 1]
+        return b':%d\r\n' % added
+    if name == b'HDEL':
+        fields = hashes.get(args[1], {})
+        removed = sum(fields.pop(field, None) is not None for field in args[2:])
+        return b':%d\r\n' % removed
+    if name == b'HGETALL':
+        flat = []
+        for field, value in hashes.get(args[1], {}).items():
+            flat += [field, value]
+        return array(flat)
+    if name == b'PUBLISH':
+        message = array([b'message', args[1], args[2]])
+        receivers = subscribers.get(args[1], set())
+        for other in receivers:
+            other.write(message)
+        return b':%d\r\n' % len(receivers)
+    if name == b'SUBSCRIBE':
+        reply = b''
+        for i, channel in enumerate(args[1:], 1):
+            subscribers.setdefault(channel, set()).add(writer)
+            reply += b'*3\r\n' + bulk(b'subscribe') + bulk(channel) + b':%d\r\n' % i
+        return reply
+    return b'-ERR unknown command\r\n'
+
+
+async def handle_client(reader, writer):
+    try:
+        while True:
+            args = await read_reply(reader)
+            writer.write(run_command(args, writer))
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        for receivers in subscribers.values():
+            receivers.discard(writer)
+        writer.close()
+
+
+async def main(host, port):
+    server = await asyncio.start_server(handle_client, host, port)
+    print(f"State broker listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6399)
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port))
@@ -1,30 +1,66 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import List, Optional
 import socketio
-import bcrypt
 import secrets
+import os
+
+# Shared state between worker processes (in-process unless HUEY_STATE_URL is set, see state_backend.py)
+from state_backend import create_backend
+shared_state = create_backend(os.environ.get('HUEY_STATE_URL'))
+
+# Metrics: counters and latency histograms for the hot paths, Prometheus text at /metrics (see metrics.py)
+from metrics import MetricsRegistry, MeteredServer, HttpMetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE
+metrics = MetricsRegistry()
 
 # 1. Create Socket.IO Server (Async)
-sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+# With a broker, emits to rooms and sids reach clients connected to any worker
+sio = MeteredServer(async_mode='asgi', cors_allowed_origins='*', client_manager=shared_state.client_manager(), metrics=metrics)
 
 # 2. Wrap with ASGI Application
 from contextlib import asynccontextmanager
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Start NPC loop and Time loop
-    print("Server: Starting NPC movement loop...")
-    asyncio.create_task(update_npcs_loop())
-    print("Server: Starting World Time loop...")
-    asyncio.create_task(update_world_time_loop())
+    # Startup: Join the other workers, then schedule the world systems (see scheduler.py)
+    global world_time_start
+    await shared_state.start(handle_state_message)
+    await load_remote_players()
+    # The first worker to start sets the clock for everyone
+    world_time_start = await shared_state.setdefault('world_time_start', time.time())
+
+    if region_grid:
+        if not shared_state.shared:
+            raise RuntimeError("HUEY_REGIONS needs a state broker (HUEY_STATE_URL)")
+        print(f"Server: NPCs are simulated by {len(region_grid)} region workers (region_worker.py)")
+    else:
+        # Fixed-step simulation: missed ticks are caught up so NPCs keep wall-clock speed
+        scheduler.add('npcs', update_npcs, NPC_TICK_SECONDS, budget=0.02, catch_up=3)
+    scheduler.add('snapshots', broadcast_snapshot, 1 / SNAPSHOT_HZ, budget=0.02)
+    scheduler.add('world_time', update_world_time, TIME_SYNC_SECONDS, budget=0.01, when_idle=True)
+    scheduler.add('inventory_flush', flush_inventories, INVENTORY_FLUSH_SECONDS, budget=0.5, when_idle=True)
+    print("Server: Scheduling " + ", ".join(f"{s.name} every {s.interval:g}s" for s in scheduler.systems))
+    scheduler_task = asyncio.create_task(scheduler.run())
     yield
 
     # Shutdown logic (optional)
     print("Server: Shutting down...")
+    scheduler.stop()
+    scheduler_task.cancel()
+    try:
+        for sid in list(client_protocols):
+            await shared_state.drop_player(sid)
+    except Exception as e:
+        print(f"Could not unregister players: {e}")
+    await shared_state.close()
+    await inventories.flush()
+    for pool in (user_db, world_db, guestbook_db):
+        pool.close()
+    password_hasher.close()
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(HttpMetricsMiddleware, metrics=metrics)
 socket_app = socketio.ASGIApp(sio, app)
 
 
@@ -32,7 +68,7 @@ socket_app = socketio.ASGIApp(sio, app)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # 4. Route for index.html
-from starlette.responses import FileResponse
+from starlette.responses import FileResponse, JSONResponse
 
 @app.get("/")
 async def read_index():
@@ -92,10 +128,39 @@ class InventoryDropRequest(BaseModel):
     x: float
     y: float
 
+class InventoryOperation(BaseModel):
+    op: str # 'move' | 'use' | 'drop' | 'split'
+    slot_index: Optional[int] = None # use / drop
+    slot_from: Optional[int] = None  # move / split
+    slot_to: Optional[int] = None    # move / split
+    quantity: int = 1                # split / drop
+    x: Optional[float] = None        # drop position
+    y: Optional[float] = None
+
+class InventoryBatchRequest(BaseModel):
+    token: str
+    operations: List[InventoryOperation]
+
 # User Database Path
 USER_DB_PATH = 'db/user/users.db'
 WORLD_DB_PATH = 'db/world/world.db'
 
+# Pooled WAL-mode connections, blocking work runs off the event loop (see database.py)
+from database import SQLitePool
+sqlite_seconds = metrics.histogram('huey_sqlite_call_seconds', 'SQLite pool.run latency per call site (pool wait included)', ('db', 'site'))
+
+def sqlite_observer(db):
+    return lambda site, seconds: sqlite_seconds.observe(seconds, db, site)
+
+user_db = SQLitePool(USER_DB_PATH, observe=sqlite_observer('users'))
+world_db = SQLitePool(WORLD_DB_PATH, observe=sqlite_observer('world'))
+
+
+# Consumables: item_id -> HP restored
+HEAL_AMOUNTS = {
+    'forest_apple': 10,
+    'desert_fruit': 20
+}
 
 # Building Costs Map
 BUILD_COSTS = {
@@ -103,26 +168,87 @@ BUILD_COSTS = {
     'wall_stone': {'snow_crystal': 2},
     'bonfire': {'wood': 1, 'cactus_fiber': 1}
 }
-def hash_password(password: str) -> str:
-    """Hash a password using bcrypt"""
-    salt = bcrypt.gensalt(rounds=12)
-    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
-def verify_password(password: str, password_hash: str) -> bool:
-    """Verify a password against its hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+# Placed objects are keyed by integer grid cell (see world_grid.py)
+from world_grid import grid_cell, migrate_placed_objects, BUILD_GRID, CHUNK_SIZE, ChunkVersions, chunk_of, fetch_chunk
+# bcrypt runs on a bounded worker pool so logins never block the game loop
+from passwords import PasswordHasher, HasherBusy
+password_hasher = PasswordHasher()
+
+# Inventories live in memory while players are online and are flushed in batches (see inventory.py)
+from inventory import InventoryStore, INVENTORY_SLOTS
+INVENTORY_BATCH_LIMIT = 64 # operations per /api/inventory/batch call
+INVENTORY_HANDOVER_SECONDS = 3.0 # how long to wait for another worker to flush an inventory we need
+inventory_handovers = {} # user_id -> Future resolved when the previous owner has let go
+
+async def claim_inventory(user_id):
+    """
+    Runs before this worker loads an inventory. With several workers, whichever
+    one had it loaded flushes and drops it first, so two workers never change
+    the same inventory (whichever worker the socket or the REST call lands on).
+    """
+    if not shared_state.shared:
+        return
+    previous = await shared_state.swap(f'inventory_owner:{user_id}', shared_state.worker_id)
+    if previous in (None, shared_state.worker_id):
+        return
+    released = asyncio.get_running_loop().create_future()
+    inventory_handovers[user_id] = released
+    try:
+        await shared_state.publish({'op': 'inventory_claim', 'user_id': user_id, 'owner': previous})
+        await asyncio.wait_for(released, INVENTORY_HANDOVER_SECONDS)
+    except asyncio.TimeoutError:
+        print(f"Inventory handover: worker {previous} did not release user {user_id}, loading anyway")
+    finally:
+        if inventory_handovers.get(user_id) is released:
+            del inventory_handovers[user_id]
+
+async def hand_over_inventory(user_id, claimer):
+    """Another worker needs this inventory: flush it, forget it, tell them"""
+    await inventories.hand_over(user_id)
+    await shared_state.publish({'op': 'inventory_released', 'user_id': user_id, 'claimer': claimer})
+
+inventories = InventoryStore(user_db, before_load=claim_inventory)
+
+# Session tokens are resolved through an in-memory LRU/TTL cache (see sessions.py)
+from sessions import SessionCache
+session_cache = SessionCache()
 
 def generate_token() -> str:
     """Generate a secure random token"""
     return secrets.token_urlsafe(32)
 
 def get_user_db():
-    """Get database connection for users"""
-    return sqlite3.connect(USER_DB_PATH)
+    """Get a pooled connection for users (use as a context manager)"""
+    return user_db.connection()
 
 def get_world_db():
-    """Get database connection for world state"""
-    return sqlite3.connect(WORLD_DB_PATH)
+    """Get a pooled connection for world state (use as a context manager)"""
+    return world_db.connection()
+
+async def authenticate(token):
+    """Resolve a session token to a Session(user_id, username, expires_at), or None"""
+    if not token:
+        return None
+    session = session_cache.get(token)
+    if session:
+        return session
+
+    def fetch_session(conn):
+        return conn.execute(
+            "SELECT s.user_id, u.username, s.expires_at FROM sessions s JOIN users u ON s.user_id = u.id WHERE s.token = ? AND s.expires_at > ?",
+            (token, datetime.now().isoformat())
+        ).fetchone()
+
+    row = await user_db.run(fetch_session)
+    if not row:
+        return None
+    return session_cache.put(token, *row)
+
+async def revoke_session(token):
+    """Drop a deleted session from this worker's cache and every other worker's"""
+    session_cache.invalidate(token)
+    await shared_state.publish({'op': 'session_revoked', 'token': token})
 
 # Authentication Endpoints
 @app.post("/api/signup")
@@ -137,29 +263,35 @@ async def signup(request: SignupRequest):
         if len(request.nickname) < 1:
             raise HTTPException(status_code=400, detail="Nickname is required")
         
-        conn = get_user_db()
-        cursor = conn.cursor()
-        
         # Check if username already exists
-        cursor.execute("SELECT id FROM users WHERE username = ?", (request.username,))
-        if cursor.fetchone():
-            conn.close()
+        def username_taken(conn):
+            return conn.execute("SELECT id FROM users WHERE username = ?", (request.username,)).fetchone() is not None
+
+        if await user_db.run(username_taken):
             raise HTTPException(status_code=400, detail="Username already exists")
         
         # Hash password and create user
-        password_hash = hash_password(request.password)
-        cursor.execute(
-            "INSERT INTO users (username, password_hash, nickname, last_login) VALUES (?, ?, ?, ?)",
-            (request.username, password_hash, request.nickname, datetime.now().isoformat())
-        )
-        conn.commit()
-        user_id = cursor.lastrowid
-        conn.close()
+        password_hash = await password_hasher.hash(request.password)
+
+        def create_user(conn):
+            cursor = conn.execute(
+                "INSERT INTO users (username, password_hash, nickname, last_login) VALUES (?, ?, ?, ?)",
+                (request.username, password_hash, request.nickname, datetime.now().isoformat())
+            )
+            return cursor.lastrowid
+
+        try:
+            user_id = await user_db.run(create_user)
+        except sqlite3.IntegrityError:
+            # Lost a race with another signup for the same name
+            raise HTTPException(status_code=400, detail="Username already exists")
         
         return {"success": True, "message": "Account created successfully", "user_id": user_id}
     
     except HTTPException:
         raise
+    except HasherBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please try again")
     except Exception as e:
         print(f"Signup error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -168,39 +300,41 @@ async def signup(request: SignupRequest):
 async def login(request: LoginRequest):
     """Authenticate user and optionally create session token"""
     try:
-        conn = get_user_db()
-        cursor = conn.cursor()
-        
-        # Get user by username with stats
-        cursor.execute(
-            "SELECT id, username, password_hash, nickname, skin, hp, max_hp, level, exp FROM users WHERE username = ?",
-            (request.username,)
-        )
-        user = cursor.fetchone()
+        def fetch_user(conn):
+            # Get user by username with stats
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, username, password_hash, nickname, skin, hp, max_hp, level, exp FROM users WHERE username = ?",
+                (request.username,)
+            )
+            return cursor.fetchone()
+
+        user = await user_db.run(fetch_user)
         
-        if not user or not verify_password(request.password, user[2]):
-            conn.close()
+        if not user or not await password_hasher.verify(request.password, user[2]):
             raise HTTPException(status_code=401, detail="Invalid username or password")
         
         user_id, username, _, nickname, skin, hp, max_hp, level, exp = user
         
-        # Update last login
-        cursor.execute("UPDATE users SET last_login = ? WHERE id = ?", 
-                      (datetime.now().isoformat(), user_id))
-        conn.commit()
-        
         # Generate token if remember_me is true
-        token = None
-        if request.remember_me:
-            token = generate_token()
-            expires_at = (datetime.now() + timedelta(days=30)).isoformat()
-            cursor.execute(
-                "INSERT INTO sessions (token, user_id, expires_at) VALUES (?, ?, ?)",
-                (token, user_id, expires_at)
-            )
-            conn.commit()
-        
-        conn.close()
+        token = generate_token() if request.remember_me else None
+        expires_at = (datetime.now() + timedelta(days=30)).isoformat()
+
+        def record_login(conn):
+            cursor = conn.cursor()
+            # Update last login
+            cursor.execute("UPDATE users SET last_login = ? WHERE id = ?", 
+                          (datetime.now().isoformat(), user_id))
+            if token:
+                cursor.execute(
+                    "INSERT INTO sessions (token, user_id, expires_at) VALUES (?, ?, ?)",
+                    (token, user_id, expires_at)
+                )
+
+        await user_db.run(record_login)
+        if token:
+            session_cache.put(token, user_id, username, expires_at)
+        inventories.preload(user_id)
         
         return {
             "success": True,
@@ -219,6 +353,8 @@ async def login(request: LoginRequest):
     
     except HTTPException:
         raise
+    except HasherBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please try again")
     except Exception as e:
         print(f"Login error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -227,39 +363,44 @@ async def login(request: LoginRequest):
 async def verify_token(request: TokenRequest):
     """Verify auto-login token and return user data"""
     try:
-        conn = get_user_db()
-        cursor = conn.cursor()
-        
-        # Get session and check expiry with stats
-        cursor.execute(
-            """SELECT s.user_id, s.expires_at, u.username, u.nickname, u.skin, 
-                      u.hp, u.max_hp, u.level, u.exp 
-               FROM sessions s 
-               JOIN users u ON s.user_id = u.id 
-               WHERE s.token = ?""",
-            (request.token,)
-        )
-        session = cursor.fetchone()
+        def check_session(conn):
+            cursor = conn.cursor()
+            # Get session and check expiry with stats
+            cursor.execute(
+                """SELECT s.user_id, s.expires_at, u.username, u.nickname, u.skin, 
+                          u.hp, u.max_hp, u.level, u.exp 
+                   FROM sessions s 
+                   JOIN users u ON s.user_id = u.id 
+                   WHERE s.token = ?""",
+                (request.token,)
+            )
+            session = cursor.fetchone()
+            if not session:
+                return None, False
+            
+            # Check if token expired (cached copies expire on their own at the same time)
+            if datetime.fromisoformat(session[1]) < datetime.now():
+                # Clean up expired token
+                cursor.execute("DELETE FROM sessions WHERE token = ?", (request.token,))
+                return session, True
+            
+            # Update last login
+            cursor.execute("UPDATE users SET last_login = ? WHERE id = ?",
+                          (datetime.now().isoformat(), session[0]))
+            return session, False
+
+        session, expired = await user_db.run(check_session)
         
         if not session:
-            conn.close()
+            session_cache.invalidate(request.token)
             raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user_id, expires_at, username, nickname, skin, hp, max_hp, level, exp = session
-        
-        # Check if token expired
-        if datetime.fromisoformat(expires_at) < datetime.now():
-            # Clean up expired token
-            cursor.execute("DELETE FROM sessions WHERE token = ?", (request.token,))
-            conn.commit()
-            conn.close()
+        if expired:
+            session_cache.invalidate(request.token)
             raise HTTPException(status_code=401, detail="Token expired")
         
-        # Update last login
-        cursor.execute("UPDATE users SET last_login = ? WHERE id = ?",
-                      (datetime.now().isoformat(), user_id))
-        conn.commit()
-        conn.close()
+        user_id, expires_at, username, nickname, skin, hp, max_hp, level, exp = session
+        session_cache.put(request.token, user_id, username, expires_at)
+        inventories.preload(user_id)
         
         return {
             "success": True,
@@ -286,33 +427,13 @@ async def verify_token(request: TokenRequest):
 async def get_inventory(request: TokenRequest):
     """Fetch user's inventory by session token"""
     try:
-        conn = get_user_db()
-        cursor = conn.cursor()
-        
         # Verify token
-        cursor.execute(
-            "SELECT user_id FROM sessions WHERE token = ? AND expires_at > ?",
-            (request.token, datetime.now().isoformat())
-        )
-        session = cursor.fetchone()
+        session = await authenticate(request.token)
         if not session:
-            conn.close()
             raise HTTPException(status_code=401, detail="Invalid or expired token")
         
-        user_id = session[0]
-        
-        # Get inventory items
-        cursor.execute(
-            "SELECT item_id, quantity, slot_index FROM inventory WHERE user_id = ?",
-            (user_id,)
-        )
-        items = cursor.fetchall()
-        conn.close()
-        
-        inventory_data = [
-            {"item_id": i[0], "quantity": i[1], "slot_index": i[2]} 
-            for i in items
-        ]
+        inv = await inventories.get(session.user_id)
+        inventory_data = inv.items()
         
         return {"success": True, "inventory": inventory_data}
         
@@ -326,34 +447,14 @@ async def get_inventory(request: TokenRequest):
 async def update_inventory(request: InventoryUpdateRequest):
     """Batch update user's inventory"""
     try:
-        conn = get_user_db()
-        cursor = conn.cursor()
-        
         # Verify token
-        cursor.execute(
-            "SELECT user_id FROM sessions WHERE token = ? AND expires_at > ?",
-            (request.token, datetime.now().isoformat())
-        )
-        session = cursor.fetchone()
+        session = await authenticate(request.token)
         if not session:
-            conn.close()
             raise HTTPException(status_code=401, detail="Invalid or expired token")
         
-        user_id = session[0]
-        
-        # Start transaction
-        # Delete existing inventory for this user
-        cursor.execute("DELETE FROM inventory WHERE user_id = ?", (user_id,))
-        
-        # Insert new items
-        for item in request.items:
-            cursor.execute(
-                "INSERT INTO inventory (user_id, item_id, quantity, slot_index) VALUES (?, ?, ?, ?)",
-                (user_id, item.item_id, item.quantity, item.slot_index)
-            )
-            
-        conn.commit()
-        conn.close()
+        # Applied in memory, written to users.db by the next flush
+        async with inventories.using(session.user_id) as inv:
+            inv.replace([(item.item_id, item.quantity, item.slot_index) for item in request.items])
         
         return {"success": True}
         
@@ -365,39 +466,36 @@ async def update_inventory(request: InventoryUpdateRequest):
 
 
 # Minigame & Leaderboard Endpoints
+# Best scores are materialized per game and window, reads are served from memory (see leaderboard.py)
+from leaderboard import LeaderboardStore, PERIODS, migrate_best_scores
+leaderboards = LeaderboardStore(user_db)
+
 class ScoreSubmitRequest(BaseModel):
     token: str
     game_id: str
     score: int
 
+class RankRequest(BaseModel):
+    token: str
+    game_id: str = 'cactus_dodge'
+    period: str = 'all'
+    around: int = 5
+
 @app.post("/api/minigame/submit")
 async def submit_score(request: ScoreSubmitRequest):
     """Securely submit a minigame score for a specific game"""
     try:
-        conn = get_user_db()
-        cursor = conn.cursor()
-        
-        # Verify token (matching naive string format used in login/verify-token)
-        cursor.execute(
-            "SELECT user_id FROM sessions WHERE token = ? AND expires_at > ?",
-            (request.token, datetime.now().isoformat())
-        )
-        session = cursor.fetchone()
+        # Verify token
+        session = await authenticate(request.token)
         if not session:
-            conn.close()
             raise HTTPException(status_code=401, detail="Invalid or expired token")
         
-        user_id = session[0]
-        
-        # Insert score with game_id
-        cursor.execute(
-            "INSERT INTO leaderboard (user_id, game_id, score) VALUES (?, ?, ?)",
-            (user_id, request.game_id, request.score)
-        )
-        conn.commit()
-        conn.close()
+        # History row + best score per window, in one transaction
+        new_best, entry = await leaderboards.submit(session.user_id, request.game_id, request.score)
+        # Other workers update the boards they have loaded too
+        await shared_state.publish({'op': 'score', **entry})
         
-        return {"success": True, "message": "Score submitted"}
+        return {"success": True, "message": "Score submitted", "new_best": new_best}
     except HTTPException:
         raise
     except Exception as e:
@@ -405,41 +503,57 @@ async def submit_score(request: ScoreSubmitRequest):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @app.get("/api/minigame/leaderboard")
-async def get_leaderboard(game_id: str = 'cactus_dodge'):
-    """Fetch global top 10 scores for a specific game"""
+async def get_leaderboard(game_id: str = 'cactus_dodge', period: str = 'all', limit: int = 10):
+    """Fetch top scores for a specific game (period: all / day / week)"""
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail="Unknown period")
     try:
-        conn = get_user_db()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT u.nickname, MAX(l.score) as high_score 
-            FROM leaderboard l
-            JOIN users u ON l.user_id = u.id
-            WHERE l.game_id = ?
-            GROUP BY l.user_id
-            ORDER BY high_score DESC
-            LIMIT 10
-        """, (game_id,))
-        rows = cursor.fetchall()
-        conn.close()
-        
+        board = await leaderboards.board(game_id, period)
         leaderboard = [
-            {"nickname": r[0], "score": r[1]} for r in rows
+            {"rank": e["rank"], "nickname": e["nickname"], "score": e["score"]}
+            for e in board.top(max(1, min(limit, 100)))
         ]
-        return {"success": True, "leaderboard": leaderboard}
+        return {"success": True, "period": period, "leaderboard": leaderboard}
     except Exception as e:
         print(f"Get leaderboard error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.post("/api/minigame/rank")
+async def get_my_rank(request: RankRequest):
+    """The caller's rank and the players just above and below them"""
+    if request.period not in PERIODS:
+        raise HTTPException(status_code=400, detail="Unknown period")
+    try:
+        session = await authenticate(request.token)
+        if not session:
+            raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+        board = await leaderboards.board(request.game_id, request.period)
+        rank = board.rank_of(session.user_id)
+        if rank is None:
+            return {"success": True, "rank": None, "total": len(board), "neighbours": []}
+
+        neighbours = [
+            {"rank": e["rank"], "nickname": e["nickname"], "score": e["score"], "me": e["user_id"] == session.user_id}
+            for e in board.around(session.user_id, max(0, min(request.around, 25)))
+        ]
+        return {"success": True, "rank": rank, "total": len(board), "neighbours": neighbours}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Get rank error: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 
 @app.post("/api/logout")
 async def logout(request: TokenRequest):
     """Invalidate session token"""
     try:
-        conn = get_user_db()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM sessions WHERE token = ?", (request.token,))
-        conn.commit()
-        conn.close()
+        def delete_session(conn):
+            conn.execute("DELETE FROM sessions WHERE token = ?", (request.token,))
+
+        await user_db.run(delete_session)
+        await revoke_session(request.token)
         return {"success": True, "message": "Logged out successfully"}
     except Exception as e:
         print(f"Logout error: {e}")
@@ -449,13 +563,12 @@ async def logout(request: TokenRequest):
 # World Building Endpoints
 @app.get("/api/world/objects")
 async def get_world_objects():
-    """Fetch all placed objects in the world"""
+    """Fetch all placed objects in the world (legacy, new clients stream chunks)"""
     try:
-        conn = get_world_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT type, x, y, owner_username FROM placed_objects")
-        rows = cursor.fetchall()
-        conn.close()
+        def fetch_objects(conn):
+            return conn.execute("SELECT type, x, y, owner_username FROM placed_objects").fetchall()
+
+        rows = await world_db.run(fetch_objects)
         
         objs = [
             {"type": r[0], "x": r[1], "y": r[2], "owner": r[3]} for r in rows
@@ -465,69 +578,97 @@ async def get_world_objects():
         print(f"Get world objects error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+def chunk_entry(chunk):
+    # 'seed' chunks have untouched terrain the client generates itself, 'stored' ones come with their trees
+    terrain_source = "stored" if chunk in terrain_store.edited else "seed"
+    return {"chunk": list(chunk), "version": chunk_versions.get(chunk), "terrain": terrain_source}
+
+@app.get("/api/world/chunks")
+async def get_world_chunks(x: float = 0, y: float = 0):
+    """Chunks (and their versions) around a position"""
+    chunks = sorted(chunk_interest.neighbourhood(chunk_of(x, y)))
+    return {"success": True, "chunk_size": CHUNK_SIZE, "chunks": [chunk_entry(c) for c in chunks]}
+
+@app.get("/api/world/chunks/{cx}/{cy}")
+async def get_world_chunk(cx: int, cy: int, request: Request):
+    """Placed objects in one chunk, 304 if the client's ETag is still current"""
+    try:
+        chunk = (cx, cy)
+        version = chunk_versions.get(chunk)
+        etag = chunk_versions.etag(chunk)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+
+        rows = await world_db.run(fetch_chunk, chunk)
+        objs = [
+            {"type": r[0], "x": r[1], "y": r[2], "owner": r[3]} for r in rows
+        ]
+        data = {"success": True, "chunk": [cx, cy], "version": version, "objects": objs}
+        if chunk in terrain_store.edited:
+            await terrain_store.ensure([chunk])
+            data["trees"] = terrain_store.get(chunk)
+        return JSONResponse(data, headers=headers)
+    except Exception as e:
+        print(f"Get world chunk error: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @app.post("/api/world/place")
 async def place_object(request: PlaceObjectRequest):
     """Place a new object in the world, deducting resources"""
     try:
-        # 1. Verify Authentication
-        user_conn = get_user_db()
-        user_cursor = user_conn.cursor()
-        
-        user_cursor.execute(
-            "SELECT u.id, u.username FROM sessions s JOIN users u ON s.user_id = u.id WHERE s.token = ? AND s.expires_at > ?",
-            (request.token, datetime.now().isoformat())
-        )
-        user_session = user_cursor.fetchone()
-        
-        if not user_session:
-            user_conn.close()
-            raise HTTPException(status_code=401, detail="Unauthorized")
-            
-        user_id, username = user_session
-        
-        # 2. Check Costs
+        # 1. Check Costs
         if request.type not in BUILD_COSTS:
-            user_conn.close()
             raise HTTPException(status_code=400, detail="Unknown object type")
             
         costs = BUILD_COSTS[request.type]
-        
-        # Check if user has enough items
-        for item_id, qty in costs.items():
-            user_cursor.execute(
-                "SELECT quantity FROM inventory WHERE user_id = ? AND item_id = ?",
-                (user_id, item_id)
-            )
-            item_row = user_cursor.fetchone()
-            if not item_row or item_row[0] < qty:
-                user_conn.close()
-                raise HTTPException(status_code=400, detail=f"Not enough {item_id}")
-        
-        # 3. Deduct Items
-        for item_id, qty in costs.items():
-            user_cursor.execute(
-                "UPDATE inventory SET quantity = quantity - ? WHERE user_id = ? AND item_id = ?",
-                (qty, user_id, item_id)
-            )
-            # Remove row if quantity is 0
-            user_cursor.execute("DELETE FROM inventory WHERE quantity <= 0")
+
+        # 2. Verify Authentication
+        session = await authenticate(request.token)
+        if not session:
+            raise HTTPException(status_code=401, detail="Unauthorized")
             
-        user_conn.commit()
-        user_conn.close()
-        
-        # 4. Record to World DB
-        world_conn = get_world_db()
-        world_cursor = world_conn.cursor()
-        world_cursor.execute(
-            "INSERT INTO placed_objects (type, x, y, owner_username) VALUES (?, ?, ?, ?)",
-            (request.type, request.x, request.y, username)
-        )
-        world_conn.commit()
-        world_conn.close()
-        
-        # 5. Broadcast via Socket.IO
+        user_id, username = session.user_id, session.username
+
+        # Quick check before touching the World DB
+        async with inventories.using(user_id) as inv: # held across the World DB awaits until it is charged
+            missing = inv.missing(costs)
+            if missing:
+                raise HTTPException(status_code=400, detail=f"Not enough {missing}")
+
+            # 3. Claim the grid cell in the World DB (one structure per cell)
+            cell_x, cell_y = grid_cell(request.x, request.y)
+
+            def insert_object(conn):
+                return conn.execute(
+                    "INSERT INTO placed_objects (type, x, y, owner_username, cell_x, cell_y) VALUES (?, ?, ?, ?, ?, ?)",
+                    (request.type, request.x, request.y, username, cell_x, cell_y)
+                ).lastrowid
+
+            try:
+                obj_id = await world_db.run(insert_object)
+            except sqlite3.IntegrityError:
+                raise HTTPException(status_code=409, detail="Something is already built here")
+            chunk = chunk_of(request.x, request.y)
+            await bump_chunk(chunk)
+
+            def release_cell(conn):
+                conn.execute("DELETE FROM placed_objects WHERE id = ?", (obj_id,))
+
+            # 4. Deduct Items (in memory; re-checked, the inventory may have changed meanwhile)
+            missing = inv.missing(costs)
+            if missing:
+                # Couldn't pay: free the cell again
+                await world_db.run(release_cell)
+                await bump_chunk(chunk)
+                raise HTTPException(status_code=400, detail=f"Not enough {missing}")
+            inv.remove_items(costs)
+        structure_changed(request.type, request.x, request.y, True)
+        await shared_state.publish({'op': 'structure', 'type': request.type, 'x': request.x, 'y': request.y, 'built': True})
+        
+        # 5. Broadcast to everyone who has the chunk loaded
         new_obj = {"type": request.type, "x": request.x, "y": request.y, "owner": username}
-        await sio.emit('object_placed', new_obj)
+        await sio.emit('object_placed', new_obj, room=chunk_interest.room(chunk))
         
         return {"success": True, "object": new_obj}
         
@@ -542,85 +683,54 @@ async def remove_object(request: RemoveObjectRequest):
     """Remove an object from the world and refund resources"""
     try:
         # 1. Verify Authentication
-        user_conn = get_user_db()
-        user_cursor = user_conn.cursor()
-        
-        user_cursor.execute(
-            "SELECT u.id, u.username FROM sessions s JOIN users u ON s.user_id = u.id WHERE s.token = ? AND s.expires_at > ?",
-            (request.token, datetime.now().isoformat())
-        )
-        user_session = user_cursor.fetchone()
+        session = await authenticate(request.token)
         
-        if not user_session:
-            user_conn.close()
+        if not session:
             raise HTTPException(status_code=401, detail="Unauthorized")
             
-        user_id, username = user_session
-        
-        # 2. Find Object and Check Ownership
-        world_conn = get_world_db()
-        world_cursor = world_conn.cursor()
-        # Find object at target coordinates (allow small epsilon for float precision)
-        # Using ABS diff < 1.0 ensures we hit the grid point even if stored as 48.00001
-        world_cursor.execute(
-            "SELECT type, owner_username FROM placed_objects WHERE ABS(x - ?) < 1.0 AND ABS(y - ?) < 1.0",
-            (request.x, request.y)
-        )
-        obj_row = world_cursor.fetchone()
+        user_id, username = session.user_id, session.username
         
-        if not obj_row:
-            user_conn.close()
-            world_conn.close()
-            raise HTTPException(status_code=404, detail="Object not found at these coordinates")
+        # 2. Find Object, Check Ownership and Delete (one world transaction)
+        cell_x, cell_y = grid_cell(request.x, request.y)
+
+        def take_object(conn):
+            cursor = conn.cursor()
+            # Indexed lookup by grid cell, then the old epsilon check for float precision
+            # (ABS diff < 1.0 still hits the grid point even if stored as 48.00001)
+            cursor.execute(
+                "SELECT id, type, owner_username FROM placed_objects WHERE cell_x = ? AND cell_y = ? AND ABS(x - ?) < 1.0 AND ABS(y - ?) < 1.0",
+                (cell_x, cell_y, request.x, request.y)
+            )
+            obj_row = cursor.fetchone()
             
-        obj_type, owner = obj_row
-        
-        # Ownership check
-        if owner != username:
-             user_conn.close()
-             world_conn.close()
-             raise HTTPException(status_code=403, detail="You do not own this object")
+            if not obj_row:
+                raise HTTPException(status_code=404, detail="Object not found at these coordinates")
+                
+            obj_id, obj_type, owner = obj_row
+            
+            # Ownership check
+            if owner != username:
+                 raise HTTPException(status_code=403, detail="You do not own this object")
+
+            # Delete from World DB (by primary key)
+            cursor.execute("DELETE FROM placed_objects WHERE id = ?", (obj_id,))
+            return obj_type
+
+        obj_type = await world_db.run(take_object)
+        chunk = chunk_of(request.x, request.y)
+        await bump_chunk(chunk)
+        structure_changed(obj_type, request.x, request.y, False)
+        await shared_state.publish({'op': 'structure', 'type': obj_type, 'x': request.x, 'y': request.y, 'built': False})
 
         # 3. Refund Resources
         if obj_type in BUILD_COSTS:
-            costs = BUILD_COSTS[obj_type]
-            for item_id, qty in costs.items():
-                # Add back to inventory
-                # Check if user has item row already
-                user_cursor.execute(
-                    "SELECT quantity FROM inventory WHERE user_id = ? AND item_id = ?",
-                    (user_id, item_id)
-                )
-                item_row = user_cursor.fetchone()
-                if item_row:
-                    user_cursor.execute(
-                        "UPDATE inventory SET quantity = quantity + ? WHERE user_id = ? AND item_id = ?",
-                        (qty, user_id, item_id)
-                    )
-                else:
-                    # Find empty slot
-                    user_cursor.execute("SELECT slot_index FROM inventory WHERE user_id = ?", (user_id,))
-                    slots = [r[0] for r in user_cursor.fetchall()]
-                    target_slot = 0
-                    for i in range(40):
-                        if i not in slots:
-                            target_slot = i
-                            break
-                    user_cursor.execute(
-                        "INSERT INTO inventory (user_id, item_id, quantity, slot_index) VALUES (?, ?, ?, ?)",
-                        (user_id, item_id, qty, target_slot)
-                    )
+            async with inventories.using(user_id) as inv:
+                for item_id, qty in BUILD_COSTS[obj_type].items():
+                    if not inv.add(item_id, qty):
+                        print(f"Refund lost for user {user_id}: inventory full ({item_id} x{qty})")
         
-        # 4. Delete from World DB (using same fuzzy check)
-        world_cursor.execute("DELETE FROM placed_objects WHERE ABS(x - ?) < 1.0 AND ABS(y - ?) < 1.0", (request.x, request.y))
-        
-        user_conn.commit()
-        world_conn.commit()
-        user_conn.close()
-        world_conn.close()
-        
-        # 5. Broadcast removal
-        await sio.emit('object_removed', {"x": request.x, "y": request.y})
+        # 4. Broadcast removal
+        await sio.emit('object_removed', {"x": request.x, "y": request.y}, room=chunk_interest.room(chunk))
         
         return {"success": True, "message": "Object removed and materials refunded"}
         
@@ -635,47 +745,18 @@ async def remove_object(request: RemoveObjectRequest):
 @app.post("/api/inventory/move")
 async def move_inventory_item(request: InventoryMoveRequest):
     try:
-        conn = get_user_db()
-        cursor = conn.cursor()
-        
         # Verify user
-        cursor.execute("SELECT user_id FROM sessions WHERE token = ?", (request.token,))
-        session = cursor.fetchone()
+        session = await authenticate(request.token)
         if not session:
-            conn.close()
             raise HTTPException(status_code=401, detail="Unauthorized")
-        user_id = session[0]
-        
-        # Get items at source and dest slots
-        cursor.execute("SELECT item_id, quantity FROM inventory WHERE user_id = ? AND slot_index = ?", (user_id, request.slot_from))
-        src_item = cursor.fetchone()
-        
-        cursor.execute("SELECT item_id, quantity FROM inventory WHERE user_id = ? AND slot_index = ?", (user_id, request.slot_to))
-        dst_item = cursor.fetchone()
-        
-        if not src_item:
-            conn.close()
-            # Nothing to move
-            return {"success": False, "message": "Source slot empty"}
-            
-        # Perform Swap
-        # 1. Delete both rows (temporarily)
-        cursor.execute("DELETE FROM inventory WHERE user_id = ? AND (slot_index = ? OR slot_index = ?)", 
-                      (user_id, request.slot_from, request.slot_to))
-        
-        # 2. Insert Src -> Dest
-        cursor.execute("INSERT INTO inventory (user_id, item_id, quantity, slot_index) VALUES (?, ?, ?, ?)",
-                      (user_id, src_item[0], src_item[1], request.slot_to))
-                      
-        # 3. Insert Dest -> Src (if existed)
-        if dst_item:
-           cursor.execute("INSERT INTO inventory (user_id, item_id, quantity, slot_index) VALUES (?, ?, ?, ?)",
-                      (user_id, dst_item[0], dst_item[1], request.slot_from))
-                      
-        conn.commit()
-        conn.close()
+        async with inventories.using(session.user_id) as inv:
+            if not inv.move(request.slot_from, request.slot_to):
+                # Nothing to move
+                return {"success": False, "message": "Source slot empty"}
         return {"success": True}
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Move item error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -683,55 +764,43 @@ async def move_inventory_item(request: InventoryMoveRequest):
 @app.post("/api/inventory/use")
 async def use_inventory_item(request: InventoryUseRequest):
     try:
-        conn = get_user_db()
-        cursor = conn.cursor()
-        
         # Verify user
-        cursor.execute("SELECT user_id FROM sessions WHERE token = ?", (request.token,))
-        session = cursor.fetchone()
+        session = await authenticate(request.token)
         if not session:
-            conn.close()
             raise HTTPException(status_code=401, detail="Unauthorized")
-        user_id = session[0]
-        
-        # Get item
-        cursor.execute("SELECT item_id, quantity FROM inventory WHERE user_id = ? AND slot_index = ?", (user_id, request.slot_index))
-        item = cursor.fetchone()
-        if not item:
-            conn.close()
-            return {"success": False, "message": "Slot empty"}
-            
-        item_id, qty = item
-        
-        # Logic: Heal
-        heal_amount = 0
-        if item_id == 'forest_apple':
-            heal_amount = 10
-        elif item_id == 'desert_fruit':
-            heal_amount = 20
-        else:
-             conn.close()
-             return {"success": False, "message": "Item matches no usage effect"}
-             
-        # Apply Heal
-        cursor.execute("UPDATE users SET hp = min(max_hp, hp + ?) WHERE id = ?", (heal_amount, user_id))
-        
-        # Reduce Quantity
-        if qty > 1:
-            cursor.execute("UPDATE inventory SET quantity = quantity - 1 WHERE user_id = ? AND slot_index = ?", (user_id, request.slot_index))
-        else:
-            cursor.execute("DELETE FROM inventory WHERE user_id = ? AND slot_index = ?", (user_id, request.slot_index))
-            
-        conn.commit()
-        
-        # Fetch updated stats to return
-        cursor.execute("SELECT hp, max_hp FROM users WHERE id = ?", (user_id,))
-        new_stats = cursor.fetchone()
-        
-        conn.close()
-        
+        user_id = session.user_id
+
+        async with inventories.using(user_id) as inv: # held across the heal, the item may be given back
+            item = inv.get(request.slot_index)
+            if not item:
+                return {"success": False, "message": "Slot empty"}
+
+            # Logic: Heal
+            item_id = item[0]
+            heal_amount = HEAL_AMOUNTS.get(item_id)
+            if not heal_amount:
+                return {"success": False, "message": "Item matches no usage effect"}
+
+            # Reduce Quantity (in memory)
+            inv.take(request.slot_index, 1)
+
+            def apply_heal(conn):
+                cursor = conn.cursor()
+                cursor.execute("UPDATE users SET hp = min(max_hp, hp + ?) WHERE id = ?", (heal_amount, user_id))
+                # Fetch updated stats to return
+                cursor.execute("SELECT hp, max_hp FROM users WHERE id = ?", (user_id,))
+                return cursor.fetchone()
+
+            try:
+                new_stats = await user_db.run(apply_heal)
+            except Exception:
+                inv.add(item_id, 1) # Give the item back
+                raise
+
         return {"success": True, "hp": new_stats[0], "max_hp": new_stats[1], "healed": heal_amount}
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Use item error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -739,61 +808,162 @@ async def use_inventory_item(request: InventoryUseRequest):
 @app.post("/api/inventory/drop")
 async def drop_inventory_item(request: InventoryDropRequest):
     try:
-        user_conn = get_user_db()
-        cursor = user_conn.cursor()
-        
         # Verify
-        cursor.execute("SELECT u.id, u.username FROM sessions s JOIN users u ON s.user_id = u.id WHERE s.token = ?", (request.token,))
-        res = cursor.fetchone()
-        if not res:
-            user_conn.close()
+        session = await authenticate(request.token)
+        if not session:
             raise HTTPException(status_code=401, detail="Unauthorized")
-        user_id, username = res
-        
-        # Get Item
-        cursor.execute("SELECT item_id, quantity FROM inventory WHERE user_id = ? AND slot_index = ?", (user_id, request.slot_index))
-        item = cursor.fetchone()
-        if not item:
-            user_conn.close()
-            return {"success": False, "message": "No item to drop"}
-            
-        item_id, qty = item
-        drop_qty = 1 # Force drop 1 for now implementation simplicity
-        
-        # Remove from Inv
-        if qty > drop_qty:
-            cursor.execute("UPDATE inventory SET quantity = quantity - ? WHERE user_id = ? AND slot_index = ?", (drop_qty, user_id, request.slot_index))
-        else:
-            cursor.execute("DELETE FROM inventory WHERE user_id = ? AND slot_index = ?", (user_id, request.slot_index))
-            
-        user_conn.commit()
-        user_conn.close()
+        user_id, username = session.user_id, session.username
+
+        # Remove from Inv (in memory)
+        async with inventories.using(user_id) as inv:
+            drop_qty = 1 # Force drop 1 for now implementation simplicity
+            taken = inv.take(request.slot_index, drop_qty)
+            if not taken:
+                return {"success": False, "message": "No item to drop"}
+        item_id = taken[0]
         
         # Add to World
-        world_conn = get_world_db()
-        w_cursor = world_conn.cursor()
-        
         drop_type = f"drop_{item_id}"
-        
-        w_cursor.execute("INSERT INTO placed_objects (type, x, y, owner_username) VALUES (?, ?, ?, ?)",
-                        (drop_type, request.x, request.y, username))
-        world_conn.commit()
-        world_conn.close()
+
+        cell_x, cell_y = grid_cell(request.x, request.y)
+
+        def insert_drop(conn):
+            conn.execute("INSERT INTO placed_objects (type, x, y, owner_username, cell_x, cell_y) VALUES (?, ?, ?, ?, ?, ?)",
+                         (drop_type, request.x, request.y, username, cell_x, cell_y))
+
+        await world_db.run(insert_drop)
+        chunk = chunk_of(request.x, request.y)
+        await bump_chunk(chunk)
         
         # Broadcast
         new_obj = {"type": drop_type, "x": request.x, "y": request.y, "owner": username}
-        await sio.emit('object_placed', new_obj)
+        await sio.emit('object_placed', new_obj, room=chunk_interest.room(chunk))
         
         return {"success": True}
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Drop item error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+def apply_inventory_operation(inv, op, effects):
+    """Apply one batch operation in memory. Returns an error message or None."""
+    if op.op in ('move', 'split'):
+        if op.slot_from is None or op.slot_to is None:
+            return "slot_from and slot_to are required"
+        if not (0 <= op.slot_to < INVENTORY_SLOTS):
+            return "Invalid target slot"
+        if op.op == 'move':
+            return None if inv.move(op.slot_from, op.slot_to) else "Source slot empty"
+        return None if inv.split(op.slot_from, op.slot_to, op.quantity) else "Cannot split here"
+
+    if op.op == 'use':
+        item = inv.get(op.slot_index)
+        if not item:
+            return "Slot empty"
+        heal_amount = HEAL_AMOUNTS.get(item[0])
+        if not heal_amount:
+            return "Item matches no usage effect"
+        inv.take(op.slot_index, 1)
+        effects['healed'] += heal_amount
+        return None
+
+    if op.op == 'drop':
+        if op.x is None or op.y is None:
+            return "x and y are required"
+        if op.quantity <= 0:
+            return "Invalid quantity"
+        taken = inv.take(op.slot_index, op.quantity)
+        if not taken:
+            return "No item to drop"
+        # Every dropped unit becomes its own world item, like the single drop endpoint
+        effects['drops'].extend([(f"drop_{taken[0]}", op.x, op.y)] * taken[1])
+        return None
+
+    return "Unknown operation"
+
+@app.post("/api/inventory/batch")
+async def inventory_batch(request: InventoryBatchRequest):
+    """
+    Apply an ordered list of move/use/drop/split operations with one auth check.
+    All or nothing: if any operation fails none are applied.
+    Returns the inventory diff ({"changed": [...], "removed": [slot, ...]}).
+    """
+    try:
+        # 1. Verify user (once for the whole batch)
+        session = await authenticate(request.token)
+        if not session:
+            raise HTTPException(status_code=401, detail="Unauthorized")
+        user_id, username = session.user_id, session.username
+
+        if len(request.operations) > INVENTORY_BATCH_LIMIT:
+            raise HTTPException(status_code=400, detail=f"Too many operations (max {INVENTORY_BATCH_LIMIT})")
+
+        # 2. Apply everything in memory (no awaits in between, so no other request interleaves)
+        async with inventories.using(user_id) as inv:
+            before = inv.snapshot()
+            effects = {'healed': 0, 'drops': []}
+            for i, op in enumerate(request.operations):
+                error = apply_inventory_operation(inv, op, effects)
+                if error:
+                    inv.restore(before)
+                    raise HTTPException(status_code=400, detail=f"Operation {i} ({op.op}): {error}")
+            applied_version = inv.version
+            diff = inv.diff(before)
+
+            # 3. Side effects outside the inventory: drops (World DB) and heal (Users DB), one transaction each.
+            # The heal goes last: it is the only step that can't simply be undone, so nothing can fail after it.
+            def insert_drops(conn):
+                cursor = conn.cursor()
+                ids = []
+                for drop_type, x, y in effects['drops']:
+                    cursor.execute(
+                        "INSERT INTO placed_objects (type, x, y, owner_username, cell_x, cell_y) VALUES (?, ?, ?, ?, ?, ?)",
+                        (drop_type, x, y, username, *grid_cell(x, y))
+                    )
+                    ids.append(cursor.lastrowid)
+                return ids
+
+            def remove_drops(conn, ids):
+                conn.executemany("DELETE FROM placed_objects WHERE id = ?", [(obj_id,) for obj_id in ids])
+
+            def apply_heal(conn):
+                cursor = conn.cursor()
+                cursor.execute("UPDATE users SET hp = min(max_hp, hp + ?) WHERE id = ?", (effects['healed'], user_id))
+                cursor.execute("SELECT hp, max_hp FROM users WHERE id = ?", (user_id,))
+                return cursor.fetchone()
+
+            result = {"success": True, "diff": diff}
+            drop_ids = []
+            try:
+                if effects['drops']:
+                    drop_ids = await world_db.run(insert_drops)
+                if effects['healed']:
+                    hp, max_hp = await user_db.run(apply_heal)
+                    result.update({"hp": hp, "max_hp": max_hp, "healed": effects['healed']})
+            except Exception:
+                # Take the drops back out and roll the inventory back too, unless another request already built on it
+                if drop_ids:
+                    await world_db.run(remove_drops, drop_ids)
+                if inv.version == applied_version:
+                    inv.restore(before)
+                raise
+
+        # 4. Broadcast drops to everyone who has the chunk loaded: one version bump and one event per chunk
+        drops_by_chunk = {}
+        for drop_type, x, y in effects['drops']:
+            drops_by_chunk.setdefault(chunk_of(x, y), []).append({"type": drop_type, "x": x, "y": y, "owner": username})
+        for chunk, objects in drops_by_chunk.items():
+            await bump_chunk(chunk)
+            await sio.emit('objects_placed', {'objects': objects}, room=chunk_interest.room(chunk))
+
+        return result
+
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Remove object error: {e}")
+        print(f"Inventory batch error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
@@ -801,13 +971,56 @@ async def drop_inventory_item(request: InventoryDropRequest):
 players = {}
 
 # Game World Data (Trees)
+import math
 import random
 import sqlite3
 import os
 import json
-import math
 from datetime import datetime, timedelta, timezone
 
+# Area of Interest: players only receive events from the cells around them
+from interest import InterestGrid
+AOI_CELL_SIZE = 600 # Roughly one screen; 3x3 cells covers the camera with margin
+interest = InterestGrid(cell_size=AOI_CELL_SIZE)
+
+# Chunk Streaming: placed objects are loaded per chunk around the player (see world_grid.py).
+# Chunk rooms line up with grid cells, so object events only reach clients that have the chunk
+CHUNK_VIEW_RADIUS = 1 # 3x3 chunks of 768px
+chunk_interest = InterestGrid(cell_size=CHUNK_SIZE, radius=CHUNK_VIEW_RADIUS, prefix='chunk', origin=BUILD_GRID / 2)
+chunk_versions = ChunkVersions()
+
+async def bump_chunk(chunk):
+    """New version for a changed chunk, on every worker"""
+    chunk_versions.bump(chunk)
+    await shared_state.publish({'op': 'chunk', 'chunk': list(chunk)})
+
+# Movement Snapshots: player_move only records the latest position,
+# a fixed tick sends one world_snapshot per recipient with everything that moved
+SNAPSHOT_HZ = float(os.environ.get('HUEY_SNAPSHOT_HZ', 15))
+moved_players = set() # sids that moved since the last snapshot
+snapshot_tick = 0
+
+# Input Rate Limits: per-sid token buckets on inbound events, flooders get disconnected (see ratelimit.py)
+from ratelimit import InputLimiter, ALLOW, FLOOD
+INPUT_RATE_LIMITS = {
+    # event: (events per second, burst, tolerated excess per second)
+    'player_move': (60, 120, 240), # clients send at most 30 per second while moving (socket.manager.js)
+    'show_emoji': (2, 5, 5),
+    'add_guestbook_post': (0.2, 3, 1),
+    'set_nickname': (0.5, 3, 1),
+}
+input_limiter = InputLimiter(INPUT_RATE_LIMITS)
+pending_moves = {} # sid -> [(x, y), ...], over-budget moves in order (applied on the next snapshot tick)
+MAX_PENDING_MOVES = 32 # per client; beyond that the oldest waypoints are dropped
+
+# Inventory write-behind: dirty inventories are flushed this often (and when a player leaves)
+INVENTORY_FLUSH_SECONDS = float(os.environ.get('HUEY_INVENTORY_FLUSH_SECONDS', 5))
+INVENTORY_IDLE_SECONDS = 600 # Clean inventories of users who aren't online are dropped after this
+
+# Wire Protocol: clients opt into packed binary frames in the handshake (see wire.py)
+import wire
+client_protocols = {} # sid -> wire.PROTOCOL_JSON / wire.PROTOCOL_BINARY (only sids connected to this worker)
+
 
 MAP_DIR = 'db/map'
 MAP_FILE = os.path.join(MAP_DIR, 'forest.json')
@@ -815,39 +1028,34 @@ MAP_FILE = os.path.join(MAP_DIR, 'forest.json')
 
 MAP_SIZE = 900
 SAFE_RADIUS = 150
-TREE_COUNT = 120
-world_trees = []
+world_trees = [] # every tree inside the world bounds, for legacy clients (map_data / welcome v1)
 
-# NPC Data
-NPC_COUNT = 10
-npcs = {}
+# NPC Data (array-backed, see npc_engine.py)
+from npc_engine import NpcStore
+NPC_COUNT = int(os.environ.get('HUEY_NPC_COUNT', 10))
 NPC_TYPES = ['roach', 'sheep']
 
-def init_npcs():
-    global npcs
-    for i in range(NPC_COUNT):
-        npc_id = f"npc_{i}"
-        npc_type = random.choice(NPC_TYPES)
-        npcs[npc_id] = {
-            'id': npc_id,
-            'type': npc_type,
-            'x': random.randint(-MAP_SIZE, MAP_SIZE),
-            'y': random.randint(-MAP_SIZE, MAP_SIZE),
-            'target_x': 0,
-            'target_y': 0,
-            'speed': 2.0 if npc_type == 'roach' else 1.0,
-            'hp': 100,
-            'max_hp': 100,
-            'last_move': 0
-        }
-        # Set initial target
-        npcs[npc_id]['target_x'] = npcs[npc_id]['x'] + random.randint(-100, 100)
-        npcs[npc_id]['target_y'] = npcs[npc_id]['y'] + random.randint(-100, 100)
+# Region sharding: with HUEY_REGIONS the NPCs live in region_worker.py processes (see regions.py)
+from regions import region_grid_from_env, npc_seed_from_env
+region_grid = region_grid_from_env(MAP_SIZE)
+npc_store = NpcStore(NPC_COUNT, NPC_TYPES, MAP_SIZE, seed=npc_seed_from_env(region_grid))
 
-init_npcs()
+# NPC Replication: only quantized position changes go out, full keyframe every 5s
+from replication import DeltaReplicator
+NPC_TICK_SECONDS = 0.1
+NPC_KEYFRAME_EVERY = 50 # ticks (100ms each)
+NPC_LEASE_SECONDS = 1.0 # One worker simulates the NPCs; another takes over if it stops renewing
+npc_replicator = DeltaReplicator(keyframe_every=NPC_KEYFRAME_EVERY)
 
 # Database setup
 DB_PATH = 'db/guestbook.db'
+guestbook_db = SQLitePool(DB_PATH, size=2, observe=sqlite_observer('guestbook'))
+
+# Newest guestbook posts are served from memory (write-through, see guestbook.py)
+from guestbook import GuestbookBuffer
+GUESTBOOK_BUFFER_SIZE = 200
+GUESTBOOK_PAGE_SIZE = 20 # Sent on connect, older pages via /api/guestbook
+guestbook_buffer = GuestbookBuffer(GUESTBOOK_BUFFER_SIZE)
 
 def init_db():
     # Ensure directory exists
@@ -855,58 +1063,97 @@ def init_db():
     if not os.path.exists(db_dir):
         os.makedirs(db_dir)
         
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    # Note: timestamp column exists from previous schema (DATETIME DEFAULT CURRENT_TIMESTAMP)
-    # We will explicit insert timestamp now, so schema change isn't strictly necessary for new rows.
-    c.execute('''CREATE TABLE IF NOT EXISTS messages
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                  nickname TEXT, 
-                  message TEXT, 
-                  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
-    conn.commit()
-    conn.close()
+    with guestbook_db.connection() as conn:
+        c = conn.cursor()
+        # Note: timestamp column exists from previous schema (DATETIME DEFAULT CURRENT_TIMESTAMP)
+        # We will explicit insert timestamp now, so schema change isn't strictly necessary for new rows.
+        c.execute('''CREATE TABLE IF NOT EXISTS messages
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, 
+                      nickname TEXT, 
+                      message TEXT, 
+                      timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
 
 def get_kst_now_str():
     # UTC+9
     now_kst = datetime.now(timezone.utc) + timedelta(hours=9)
     return now_kst.strftime('%Y-%m-%d %H:%M:%S')
 
-def add_message_to_db(nickname, message, timestamp_str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO messages (nickname, message, timestamp) VALUES (?, ?, ?)", (nickname, message, timestamp_str))
-    conn.commit()
-    conn.close()
+def add_message_to_db(conn, nickname, message, timestamp_str):
+    cursor = conn.execute("INSERT INTO messages (nickname, message, timestamp) VALUES (?, ?, ?)", (nickname, message, timestamp_str))
+    return cursor.lastrowid
 
-def get_messages_from_db():
-    conn = sqlite3.connect(DB_PATH)
+def get_messages_from_db(conn, before=None, limit=50):
+    """Newest first, optionally only messages older than id `before`"""
     c = conn.cursor()
-    c.execute("SELECT nickname, message, timestamp FROM messages ORDER BY id DESC LIMIT 50")
+    if before is None:
+        c.execute("SELECT id, nickname, message, timestamp FROM messages ORDER BY id DESC LIMIT ?", (limit,))
+    else:
+        c.execute("SELECT id, nickname, message, timestamp FROM messages WHERE id < ? ORDER BY id DESC LIMIT ?", (before, limit))
     rows = c.fetchall()
-    conn.close()
-    return [{'nickname': r[0], 'message': r[1], 'timestamp': r[2]} for r in rows]
+    return [{'id': r[0], 'nickname': r[1], 'message': r[2], 'timestamp': r[3]} for r in rows]
+
+def load_guestbook_buffer():
+    """Fill the in-memory ring buffer with the newest posts"""
+    with guestbook_db.connection() as conn:
+        # One extra row tells us whether anything older is left in the DB
+        messages = get_messages_from_db(conn, limit=GUESTBOOK_BUFFER_SIZE + 1)
+    guestbook_buffer.load(messages[::-1], complete=len(messages) <= GUESTBOOK_BUFFER_SIZE)
+
+@app.get("/api/map/{map_hash}")
+async def get_map(map_hash: str, request: Request):
+    """Tree map by content hash. The bytes for a hash never change, so clients cache them forever."""
+    part = welcome_static['map']
+    if map_hash != part.hash:
+        raise HTTPException(status_code=404, detail="Unknown map version")
+    headers = {
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": f'"{part.hash}"',
+        "Vary": "Accept-Encoding"
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(part.gzipped, media_type="application/json", headers={**headers, "Content-Encoding": "gzip"})
+    return Response(part.json, media_type="application/json", headers=headers)
+
+@app.get("/api/guestbook")
+async def get_guestbook(before: Optional[int] = None, limit: int = GUESTBOOK_PAGE_SIZE):
+    """Guestbook history page, newest first. Pass next_cursor as `before` for the next page."""
+    try:
+        limit = max(1, min(limit, 100))
+        messages = guestbook_buffer.page(before, limit)
+        if messages is None:
+            # Older than the buffer: indexed id range on the DB
+            messages = await guestbook_db.run(get_messages_from_db, before, limit)
+        next_cursor = messages[-1]['id'] if len(messages) == limit else None
+        return {"success": True, "messages": messages, "next_cursor": next_cursor}
+    except Exception as e:
+        print(f"Get guestbook error: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
 
 # Day/Night Cycle State
+import time
 CYCLE_DURATION = 300 # 5 minutes in seconds
 world_time = 0.0 # 0.0 to 1.0
+world_time_start = time.time() # replaced by the shared start time on startup
+TIME_SYNC_SECONDS = 5
 
-async def update_world_time_loop():
+async def emit_time_update():
+    """Send world_time to this worker's clients, encoded once per protocol (every worker runs the clock)"""
+    await sio.emit('time_update', wire.encode_time_json(world_time), room=wire.JSON_ROOM, ignore_queue=True)
+    if wire.PROTOCOL_BINARY in client_protocols.values():
+        await sio.emit('time_update', wire.encode_time_binary(world_time), room=wire.BINARY_ROOM, ignore_queue=True)
+
+async def update_world_time():
     global world_time
-    import time
-    start_time = time.time()
-    while True:
-        elapsed = time.time() - start_time
-        world_time = (elapsed % CYCLE_DURATION) / CYCLE_DURATION
-        # Broadcast roughly every 5 seconds to keep synced
-        await sio.emit('time_update', {'world_time': world_time})
-        await asyncio.sleep(5)
+    elapsed = time.time() - world_time_start
+    world_time = (elapsed % CYCLE_DURATION) / CYCLE_DURATION
+    # Broadcast every TIME_SYNC_SECONDS to keep clients synced
+    await emit_time_update()
 
 def init_rpg_columns():
     """Migrate DB to include RPG stats columns"""
     print("Migrating User DB for RPG Stats...")
-    conn = get_user_db()
-    c = conn.cursor()
     columns = [
         ("hp", "INTEGER DEFAULT 100"),
         ("max_hp", "INTEGER DEFAULT 100"),
@@ -916,95 +1163,310 @@ def init_rpg_columns():
         ("level", "INTEGER DEFAULT 1")
     ]
     
-    for col, dtype in columns:
-        try:
-            c.execute(f"ALTER TABLE users ADD COLUMN {col} {dtype}")
-            print(f"Added column: {col}")
-        except Exception:
-            # Column likely exists
-            pass
-            
-    conn.commit()
-    conn.close()
+    with get_user_db() as conn:
+        c = conn.cursor()
+        for col, dtype in columns:
+            try:
+                c.execute(f"ALTER TABLE users ADD COLUMN {col} {dtype}")
+                print(f"Added column: {col}")
+            except Exception:
+                # Column likely exists
+                pass
     print("RPG Stats Migration Complete.")
 
+def init_leaderboard():
+    """Migrate User DB to materialized best scores"""
+    with get_user_db() as conn:
+        migrate_best_scores(conn)
+
+def init_world_grid():
+    """Migrate World DB placed_objects to indexed grid cells"""
+    with get_world_db() as conn:
+        migrate_placed_objects(conn)
+
 init_db()
+load_guestbook_buffer()
 init_rpg_columns()
+init_world_grid()
+init_leaderboard()
 
 
-def load_or_generate_map():
-    global world_trees
-    
-    # Ensure directory exists
-    if not os.path.exists(MAP_DIR):
-        os.makedirs(MAP_DIR)
-        
-    # Implement persistence
-    if os.path.exists(MAP_FILE):
-        try:
-            with open(MAP_FILE, 'r', encoding='utf-8') as f:
-                world_trees = json.load(f)
-            print(f"Loaded map with {len(world_trees)} trees from {MAP_FILE}.")
-            return
-        except Exception as e:
-            print(f"Failed to load map: {e}. Regenerating...")
-
-    # Generate if not found or failed
-    world_trees = []
-    for _ in range(TREE_COUNT):
-        while True:
-            x = random.randint(-MAP_SIZE, MAP_SIZE)
-            y = random.randint(-MAP_SIZE, MAP_SIZE)
-            dist = math.hypot(x, y)
-
-            if dist > SAFE_RADIUS:
-                world_trees.append({'x': x, 'y': y})
-                break
-    
-    # Save to file
+def load_legacy_map():
+    """Tree list of worlds made before chunked terrain (imported into terrain_chunks once), or None"""
+    if not os.path.exists(MAP_FILE):
+        return None
     try:
-        with open(MAP_FILE, 'w', encoding='utf-8') as f:
-            json.dump(world_trees, f, indent=2)
-        print(f"Generated and saved map with {len(world_trees)} trees to {MAP_FILE}.")
+        with open(MAP_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
     except Exception as e:
-        print(f"Failed to save map: {e}")
-
-load_or_generate_map()
+        print(f"Failed to load legacy map: {e}")
+        return None
+
+# Server-side collision: trees and structures in a spatial hash, every player_move is checked (see collision.py)
+from collision import CollisionGrid, tree_box, blocks_movement, STRUCTURE_HALF, WORLD_BOUNDS
+collision_grid = CollisionGrid()
+
+def add_tree_boxes(chunk, trees):
+    for i, tree in enumerate(trees):
+        collision_grid.add(('tree', *chunk, i), *tree_box(tree))
+
+def remove_tree_boxes(chunk, trees):
+    for i in range(len(trees)):
+        collision_grid.remove(('tree', *chunk, i))
+
+# Terrain: trees are generated per chunk from the world seed, only edited chunks are stored (see terrain.py)
+import terrain
+TERRAIN_SEED_FILE = os.path.join(MAP_DIR, 'terrain.json')
+TERRAIN_CACHE_CHUNKS = 256 # LRU of generated / loaded chunks (chunks in someone's view are never evicted)
+os.makedirs(MAP_DIR, exist_ok=True)
+terrain_spec = terrain.make_spec(terrain.load_world_seed(TERRAIN_SEED_FILE), limit=MAP_SIZE, safe_radius=SAFE_RADIUS)
+terrain_store = terrain.TerrainStore(world_db, terrain_spec, max_chunks=TERRAIN_CACHE_CHUNKS,
+                                     on_load=add_tree_boxes, on_evict=remove_tree_boxes)
+
+def init_terrain():
+    """Import the legacy map, then load every chunk inside the (client-bounded) world"""
+    global world_trees
+    world_chunks = terrain.chunks_within(WORLD_BOUNDS)
+    with get_world_db() as conn:
+        terrain.migrate_terrain(conn, load_legacy_map(), world_chunks)
+        terrain_store.load_edited_index(conn)
+        terrain_store.preload(conn, world_chunks)
+    world_trees = [tree for chunk in world_chunks for tree in terrain_store.get(chunk)]
+    print(f"Terrain: seed {terrain_spec['seed']}, {len(world_trees)} trees in {len(world_chunks)} chunks "
+          f"({len(terrain_store.edited)} stored)")
+
+def watched_chunks():
+    """Chunks in view of any player on this worker"""
+    return set().union(*(chunk_interest.neighbourhood(c) for c in chunk_interest.cells.values()))
+
+def init_collision_grid():
+    """Fill the collision grid with the structures in the World DB (trees come with their terrain chunks)"""
+    with get_world_db() as conn:
+        rows = conn.execute("SELECT type, x, y FROM placed_objects WHERE type NOT LIKE 'drop_%'").fetchall()
+    for obj_type, x, y in rows:
+        if blocks_movement(obj_type):
+            collision_grid.add(('structure', *grid_cell(x, y)), x, y, STRUCTURE_HALF, STRUCTURE_HALF)
+    print(f"Collision grid: {len(collision_grid)} boxes")
+
+init_terrain()
+init_collision_grid()
+
+def structure_changed(obj_type, x, y, built):
+    """Keep the collision grid in step with a structure being built or removed"""
+    if not blocks_movement(obj_type):
+        return
+    key = ('structure', *grid_cell(x, y))
+    if built:
+        collision_grid.add(key, x, y, STRUCTURE_HALF, STRUCTURE_HALF)
+    else:
+        collision_grid.remove(key)
+
+# Welcome Bundle: terrain, map and NPC roster are fixed after startup, serialized + compressed once (see welcome.py)
+import welcome
+welcome_static = {
+    'terrain': welcome.StaticPart(terrain_spec),
+    'map': welcome.StaticPart(world_trees),
+    'npc_roster': welcome.StaticPart(npc_store.roster()),
+}
 
 import asyncio
 
-async def update_npcs_loop():
-    while True:
-        updates = {}
-        for nid, npc in npcs.items():
-            # Move towards target
-            dx = npc['target_x'] - npc['x']
-            dy = npc['target_y'] - npc['y']
-            dist = math.hypot(dx, dy)
-            
-            if dist < 5:
-                # Pick new target
-                npc['target_x'] = max(-MAP_SIZE, min(MAP_SIZE, npc['x'] + random.randint(-200, 200)))
-                npc['target_y'] = max(-MAP_SIZE, min(MAP_SIZE, npc['y'] + random.randint(-200, 200)))
-            else:
-                # Move
-                speed = npc['speed'] * (2.0 if npc['type'] == 'roach' else 1.2) # Faster movement
-                npc['x'] += (dx / dist) * speed
-                npc['y'] += (dy / dist) * speed
-            
-            updates[nid] = {'x': npc['x'], 'y': npc['y']}
-        
-        await sio.emit('npcs_moved', updates)
-        await asyncio.sleep(0.1) # 10 FPS sync
+# World systems (NPCs, snapshots, clock, inventory flush) run on one fixed-timestep
+# scheduler; NPCs and snapshots pause while nobody is on (see scheduler.py)
+from scheduler import TickScheduler
+tick_seconds = metrics.histogram('huey_tick_seconds', 'Duration of one scheduled run per system', ('system',))
+scheduler = TickScheduler(is_idle=lambda: not players, observe=lambda name, seconds: tick_seconds.observe(seconds, name))
+
+async def update_npcs():
+    try:
+        # Only the lease holder simulates; its emits reach every worker's clients
+        simulating = await shared_state.claim('npcs', NPC_LEASE_SECONDS)
+    except Exception as e:
+        print(f"NPC lease error: {e}")
+        simulating = False
+
+    if simulating:
+        npc_store.step()
+
+        # Delta against what clients already have (idle NPCs are skipped)
+        changed, qx, qy, _ = npc_replicator.frame(npc_store.x, npc_store.y)
+        if len(changed):
+            # Other workers may have clients of either protocol
+            protocols = {wire.PROTOCOL_JSON, wire.PROTOCOL_BINARY} if shared_state.shared else set(client_protocols.values())
+            if wire.PROTOCOL_JSON in protocols:
+                await sio.emit('npcs_moved', wire.encode_npcs_json(npc_store.ids, changed, qx, qy), room=wire.JSON_ROOM)
+            if wire.PROTOCOL_BINARY in protocols:
+                await sio.emit('npcs_moved', wire.encode_npcs_binary(changed, qx, qy), room=wire.BINARY_ROOM)
+            # Followers keep a copy for their welcome bundles
+            await shared_state.publish({'op': 'npcs', **npc_store.state()})
 
 # Removed old on_event startup logic
 
+async def apply_pending_moves():
+    """Over-budget moves were held back per client, apply each client's path now"""
+    moves = list(pending_moves.items())
+    pending_moves.clear()
+    for sid, path in moves:
+        if sid in players:
+            await apply_move(sid, *path[-1], path=path[:-1])
+
+async def broadcast_snapshot():
+    """Send every player one frame with the latest positions of movers in range"""
+    global snapshot_tick
+    await apply_pending_moves()
+    if not moved_players:
+        return
+    snapshot_tick += 1
+
+    changes = {}
+    for sid in moved_players:
+        if sid in players:
+            changes[sid] = {'x': players[sid]['x'], 'y': players[sid]['y']}
+    moved_players.clear()
+
+    # Our own movers go to the other workers once per tick (theirs arrive via handle_state_message)
+    if shared_state.shared:
+        local_moves = {sid: [pos['x'], pos['y']] for sid, pos in changes.items() if sid in client_protocols}
+        if local_moves:
+            await shared_state.publish({'op': 'moves', 'moves': local_moves})
+            await shared_state.put_players({sid: players[sid] for sid in local_moves})
+
+    eids = {sid: players[sid]['eid'] for sid in changes}
+    for recipients, frame in interest.frames(changes):
+        # Encode once per protocol, reuse the payload for every recipient in the cell
+        # Each worker only sends to its own clients (ignore_queue keeps frames off the broker)
+        json_sids = [r for r in recipients if client_protocols.get(r) == wire.PROTOCOL_JSON]
+        binary_sids = [r for r in recipients if client_protocols.get(r) == wire.PROTOCOL_BINARY]
+        if json_sids:
+            await sio.emit('world_snapshot', wire.encode_snapshot_json(snapshot_tick, frame), to=json_sids, ignore_queue=True)
+        if binary_sids:
+            await sio.emit('world_snapshot', wire.encode_snapshot_binary(snapshot_tick, frame, eids), to=binary_sids, ignore_queue=True)
+
+async def flush_inventories():
+    await inventories.flush()
+    online = {p.get('user_id') for p in players.values()}
+    inventories.evict_idle(online, INVENTORY_IDLE_SECONDS)
+
+async def share_player(sid):
+    """Publish a local player's current record to the other workers"""
+    await shared_state.put_players({sid: players[sid]})
+    await shared_state.publish({'op': 'join', 'sid': sid, 'player': players[sid]})
+
+def mirror_player(sid, player):
+    """Add or update another worker's player (its own worker sends all the events)"""
+    players[sid] = player
+    interest.place(sid, player['x'], player['y'])
+
+async def load_remote_players():
+    """Mirror everyone already connected to other workers"""
+    for sid, player in (await shared_state.load_players()).items():
+        if sid not in client_protocols:
+            mirror_player(sid, player)
+    if players:
+        print(f"Server: Mirrored {len(players)} players from other workers")
+
+async def handle_state_message(message):
+    """Apply a change published by another worker"""
+    op = message['op']
+    if op == 'join':
+        mirror_player(message['sid'], message['player'])
+    elif op == 'moves':
+        for sid, (x, y) in message['moves'].items():
+            if sid in players:
+                players[sid]['x'] = x
+                players[sid]['y'] = y
+                interest.place(sid, x, y)
+                moved_players.add(sid) # Our clients get it in the next snapshot
+    elif op == 'leave':
+        sid = message['sid']
+        players.pop(sid, None)
+        interest.remove(sid)
+        moved_players.discard(sid)
+    elif op == 'npcs':
+        # Everything from the NPC lease holder, or one region's changed NPCs
+        index = message.get('index', slice(None))
+        npc_store.x[index] = message['x']
+        npc_store.y[index] = message['y']
+        npc_store.hp[index] = message['hp']
+    elif op == 'chunk':
+        chunk_versions.bump(tuple(message['chunk']))
+    elif op == 'structure':
+        structure_changed(message['type'], message['x'], message['y'], message['built'])
+    elif op == 'guestbook':
+        guestbook_buffer.append(message['post'])
+    elif op == 'session_revoked':
+        session_cache.invalidate(message['token'])
+    elif op == 'inventory_claim':
+        if message['owner'] == shared_state.worker_id:
+            # Not awaited: it waits for our requests on that inventory, other messages keep flowing
+            asyncio.create_task(hand_over_inventory(message['user_id'], message['worker']))
+    elif op == 'inventory_released':
+        released = inventory_handovers.get(message['user_id'])
+        if message['claimer'] == shared_state.worker_id and released and not released.done():
+            released.set_result(True)
+    elif op == 'score':
+        leaderboards.apply(message['game_id'], message['keys'], message['user_id'], message['nickname'],
+                           message['score'], message['achieved_at'])
+
+async def update_interest(sid):
+    """Move sid's AOI subscriptions to its current cell and exchange enter/leave events"""
+    player = players[sid]
+    rooms_to_join, rooms_to_leave, entered, left = interest.place(sid, player['x'], player['y'])
+
+    for room in rooms_to_leave:
+        await sio.leave_room(sid, room)
+    for room in rooms_to_join:
+        await sio.enter_room(sid, room)
+
+    # Both sides of a new pair need to learn about each other
+    for other_sid in entered:
+        if other_sid not in players:
+            continue
+        await sio.emit('player_entered', {'sid': other_sid, 'player': players[other_sid]}, to=sid)
+        await sio.emit('player_entered', {'sid': sid, 'player': player}, to=other_sid)
+
+    for other_sid in left:
+        await sio.emit('player_left', other_sid, to=sid)
+        await sio.emit('player_left', sid, to=other_sid)
+
+async def update_chunks(sid):
+    """Move sid's chunk subscriptions and tell it which chunks to load and unload"""
+    player = players[sid]
+    old_chunk = chunk_interest.cells.get(sid)
+    rooms_to_join, rooms_to_leave, _, _ = chunk_interest.place(sid, player['x'], player['y'])
+    if not rooms_to_join and not rooms_to_leave:
+        return
+
+    for room in rooms_to_leave:
+        await sio.leave_room(sid, room)
+    for room in rooms_to_join:
+        await sio.enter_room(sid, room)
+
+    old_view = chunk_interest.neighbourhood(old_chunk) if old_chunk is not None else set()
+    new_view = chunk_interest.neighbourhood(chunk_interest.cells[sid])
+
+    # Terrain (and its collision boxes) for the chunks the player walks towards
+    await terrain_store.ensure(new_view)
+    if len(terrain_store) > TERRAIN_CACHE_CHUNKS:
+        terrain_store.trim(watched_chunks())
+    await sio.emit('world_chunks', {
+        'chunk_size': CHUNK_SIZE,
+        'enter': [chunk_entry(c) for c in sorted(new_view - old_view)],
+        'leave': [list(c) for c in sorted(old_view - new_view)]
+    }, to=sid)
+
+
 
 
 @sio.event
-async def connect(sid, environ):
+async def connect(sid, environ, auth=None):
     print(f"Client connected: {sid}")
     import random
+    # Wire protocol negotiated in the handshake (JSON unless the client asks for binary)
+    protocol = wire.protocol_from_auth(auth)
+    client_protocols[sid] = protocol
+    await sio.enter_room(sid, wire.room_for(protocol))
+
     # Random position in safe zone (center area) and color
     players[sid] = {
         'x': random.randint(-100, 100),
@@ -1013,35 +1475,72 @@ async def connect(sid, environ):
         'nickname': 'Unknown',
         'skin': 'skin_fox',
         'hp': 100,
-        'max_hp': 100
+        'max_hp': 100,
+        'eid': await shared_state.next_id('eid') # numeric player id used by binary frames, unique across workers
     }
 
     print(f"Assigning {sid} -> {players[sid]}")
-
-    # Send current players to the new guy
-    await sio.emit('current_players', players, to=sid)
-    
-    # Send Map Data (Trees)
-    await sio.emit('map_data', world_trees, to=sid)
-    
-    # Send Guestbook Data
-    messages = get_messages_from_db()
-    await sio.emit('guestbook_data', messages, to=sid)
-    
-    # Send NPC Data
-    await sio.emit('npc_data', list(npcs.values()), to=sid)
-    
-    # Send Current Time
-    await sio.emit('time_init', {'world_time': world_time}, to=sid)
+    await share_player(sid)
+
+    # Subscribe to the AOI rooms around the spawn point
+    rooms_to_join, _, _, _ = interest.place(sid, players[sid]['x'], players[sid]['y'])
+    for room in rooms_to_join:
+        await sio.enter_room(sid, room)
+
+    # Current players (only the ones in range), including the new guy
+    nearby = {other_sid: players[other_sid] for other_sid in interest.visible_to(sid) if other_sid in players}
+    nearby[sid] = players[sid]
+    guestbook_page = guestbook_buffer.page(None, GUESTBOOK_PAGE_SIZE)
+
+    welcome_version = welcome.welcome_version(auth)
+    if welcome_version:
+        # One message: precompressed terrain (or map for v1) + NPC roster, plus this join's state
+        await sio.emit('welcome', welcome.bundle(
+            welcome_static,
+            version=welcome_version,
+            skip=welcome.cached_parts(auth, welcome_static), # e.g. the map the client already has
+            players=nearby,
+            npcs=npc_store.state(),
+            guestbook=guestbook_page,
+            world_time=world_time
+        ), to=sid)
+    else:
+        # Legacy clients: one event per part
+        await sio.emit('current_players', nearby, to=sid)
+        await sio.emit('map_data', world_trees, to=sid)
+        await sio.emit('guestbook_data', guestbook_page, to=sid)
+        await sio.emit('npc_data', npc_store.to_npc_data(), to=sid)
+        await sio.emit('time_init', {'world_time': world_time}, to=sid)
+
+    # Placed objects: the client fetches the chunks around the spawn point
+    await update_chunks(sid)
     
-    # Tell everyone else about the new guy
+    # Tell everyone nearby about the new guy
+    await sio.emit('new_player', {'sid': sid, 'player': players[sid]},
+                   room=interest.room_at(players[sid]['x'], players[sid]['y']), skip_sid=sid)
+
+    print(f"Broadcasted new_player and welcome data for {sid}")
 
-    await sio.emit('new_player', {'sid': sid, 'player': players[sid]})
+async def allow_input(sid, event, coalesce=False):
+    """Rate limit an inbound event: True if it may be handled now. Flooding clients are disconnected."""
+    verdict = input_limiter.check(sid, event, coalesce)
+    if verdict == FLOOD:
+        print(f"Disconnecting {sid}: flooding {event} ({input_limiter.stats()['events'][event]})")
+        await sio.disconnect(sid)
+    return verdict == ALLOW
 
-    print(f"Broadcasted new_player and map_data for {sid}")
+
+def nickname_taken(name, sid):
+    """Whether another player already goes by this nickname (case-insensitive)"""
+    for other_sid, other_player in players.items():
+        if other_sid != sid and other_player.get('nickname', '').lower() == name.lower():
+            return True
+    return False
 
 @sio.event
 async def set_nickname(sid, data):
+    if not await allow_input(sid, 'set_nickname'):
+        return
     if sid in players:
         # Check if internal data is a dict or just a string
         if isinstance(data, dict):
@@ -1058,16 +1557,15 @@ async def set_nickname(sid, data):
         # Verify token if present
         if token:
             try:
-                conn = get_user_db()
-                cursor = conn.cursor()
-                cursor.execute(
-                    """SELECT s.user_id, u.nickname, u.hp, u.max_hp, u.level, u.exp 
-                       FROM sessions s 
-                       JOIN users u ON s.user_id = u.id 
-                       WHERE s.token = ? AND s.expires_at > ?""",
-                    (token, datetime.now().isoformat())
-                )
-                result = cursor.fetchone()
+                session = await authenticate(token)
+
+                def fetch_user_stats(conn):
+                    return conn.execute(
+                        "SELECT id, nickname, hp, max_hp, level, exp FROM users WHERE id = ?",
+                        (session.user_id,)
+                    ).fetchone()
+
+                result = await user_db.run(fetch_user_stats) if session else None
                 if result:
                     user_id, db_nickname, db_hp, db_max_hp, db_lvl, db_exp = result
                     # Force the authenticated nickname if user is logged in
@@ -1077,20 +1575,14 @@ async def set_nickname(sid, data):
                     players[sid]['max_hp'] = db_max_hp
                     players[sid]['level'] = db_lvl
                     players[sid]['exp'] = db_exp
+                    inventories.preload(user_id)
                     
                     print(f"Server: Authenticated join for {name} (HP: {db_hp}/{db_max_hp})")
-                conn.close()
             except Exception as e:
                 print(f"Token verification error during join: {e}")
 
         # Nickname validation: Uniqueness check
-        is_duplicate = False
-        for other_sid, other_player in players.items():
-            if other_sid != sid and other_player.get('nickname', '').lower() == name.lower():
-                is_duplicate = True
-                break
-        
-        if is_duplicate:
+        if nickname_taken(name, sid):
             print(f"Server: Rejected duplicate nickname '{name}' from {sid}")
             await sio.emit('nickname_error', {'message': 'Nickname already taken!'}, to=sid)
             return
@@ -1106,67 +1598,151 @@ async def set_nickname(sid, data):
         # Save skin preference to DB if authenticated
         if user_id:
             try:
-                conn = get_user_db()
-                cursor = conn.cursor()
-                cursor.execute("UPDATE users SET skin = ? WHERE id = ?", (skin, user_id))
-                conn.commit()
-                conn.close()
+                def save_skin(conn):
+                    conn.execute("UPDATE users SET skin = ? WHERE id = ?", (skin, user_id))
+
+                await user_db.run(save_skin)
             except Exception as e:
                 print(f"Error saving skin for user {user_id}: {e}")
             
         print(f"Server: Player joined/updated: {sid} -> {name} ({skin})")
         
+        await share_player(sid)
+
         # Notify success to the client that requested it
         await sio.emit('nickname_success', {'nickname': name, 'skin': skin}, to=sid)
 
-        # Broadcast update to ALL players
+        # Broadcast update to everyone in range (others get it via player_entered later)
         await sio.emit('update_player_info', {
             'sid': sid, 
             'nickname': name,
             'skin': skin
-        })
+        }, room=interest.room_at(players[sid]['x'], players[sid]['y']))
 
 
 @sio.event
 async def add_guestbook_post(sid, data):
+    if not await allow_input(sid, 'add_guestbook_post'):
+        return
     if sid in players:
         nickname = players[sid]['nickname']
         message = data.get('message', '').strip()
         if message:
             print(f"Guestbook Post: {nickname}: {message}")
             timestamp = get_kst_now_str()
-            add_message_to_db(nickname, message, timestamp)
-            # Broadcast to everyone
-            new_post = {'nickname': nickname, 'message': message, 'timestamp': timestamp}
+            post_id = await guestbook_db.run(add_message_to_db, nickname, message, timestamp)
+            # Write-through: DB first, then the buffer, then broadcast to everyone
+            new_post = {'id': post_id, 'nickname': nickname, 'message': message, 'timestamp': timestamp}
+            guestbook_buffer.append(new_post)
+            await shared_state.publish({'op': 'guestbook', 'post': new_post})
             await sio.emit('new_guestbook_post', new_post)
 
 @sio.event
 async def disconnect(sid):
     print(f"Client disconnected: {sid}")
     if sid in players:
+        room = interest.room_at(players[sid]['x'], players[sid]['y'])
+        user_id = players[sid].get('user_id')
         del players[sid]
-        await sio.emit('player_disconnected', sid)
+        interest.remove(sid)
+        chunk_interest.remove(sid)
+        moved_players.discard(sid)
+        pending_moves.pop(sid, None)
+        await shared_state.drop_player(sid)
+        await shared_state.publish({'op': 'leave', 'sid': sid})
+        await sio.emit('player_disconnected', sid, room=room, skip_sid=sid)
+        # Write their inventory now instead of waiting for the next flush
+        if user_id and not any(p.get('user_id') == user_id for p in players.values()):
+            try:
+                await inventories.release(user_id)
+            except Exception as e:
+                print(f"Inventory release error for user {user_id}: {e}")
+    client_protocols.pop(sid, None)
+    input_limiter.forget(sid)
+
+async def apply_move(sid, x, y, path=()):
+    # Server-authoritative: a move into a tree or a wall is refused and the client snapped back.
+    # Held-back moves are checked leg by leg along `path` (the positions before x, y), so a
+    # curve around a tree isn't mistaken for a straight line through it.
+    px, py = players[sid]['x'], players[sid]['y']
+    for wx, wy in (*path, (x, y)):
+        if collision_grid.blocked(px, py, wx, wy):
+            await sio.emit('position_correction', {'x': players[sid]['x'], 'y': players[sid]['y']}, to=sid)
+            return
+        px, py = wx, wy
+    players[sid]['x'] = x
+    players[sid]['y'] = y
+    # Crossing a cell border changes who can see us
+    await update_interest(sid)
+    await update_chunks(sid)
+    # Sent with the next world_snapshot (coalesces 60 Hz input into one update per tick)
+    moved_players.add(sid)
+
+def move_target(data):
+    """(x, y) of a player_move payload, or None unless both are finite numbers"""
+    try:
+        x, y = float(data['x']), float(data['y'])
+    except (TypeError, KeyError, ValueError):
+        return None
+    if not (math.isfinite(x) and math.isfinite(y)):
+        return None
+    return x, y
 
 @sio.event
-async def player_move(sid, data):
+async def player_move(sid, data=None):
     # print(f"Move: {sid} {data}") # Debug logging
     if sid in players:
-        players[sid]['x'] = data['x']
-        players[sid]['y'] = data['y']
-        # Broadcast move to others (Sending to all now, client filters self)
-        await sio.emit('player_moved', {'sid': sid, 'x': data['x'], 'y': data['y']})
+        target = move_target(data)
+        if target is None:
+            return # Malformed, NaN or infinite: never reaches the limiter or the collision grid
+        x, y = target
+        if not await allow_input(sid, 'player_move', coalesce=True):
+            # Over budget: hold it back, it is applied (and sent) with the next snapshot
+            if sid in players:
+                path = pending_moves.setdefault(sid, [])
+                path.append((x, y))
+                if len(path) > MAX_PENDING_MOVES:
+                    del path[0]
+            return
+        # Held-back moves came first: walk through them on the way here
+        await apply_move(sid, x, y, path=pending_moves.pop(sid, ()))
     else:
         print(f"Ignored move from unknown SID: {sid}")
 
 @sio.on('show_emoji')
 async def show_emoji(sid, data):
     # data expected: { 'emoji': '❤️' }
+    if not await allow_input(sid, 'show_emoji'):
+        return
     if sid in players:
-        # Broadcast emoji to all OTHER players
+        # Broadcast emoji to all OTHER players in range
         await sio.emit('show_emoji', {
             'sid': sid,
             'emoji': data.get('emoji')
-        }, skip_sid=sid)
+        }, room=interest.room_at(players[sid]['x'], players[sid]['y']), skip_sid=sid)
+
+
+# Metrics read at scrape time (the stores and caches keep their own stats)
+metrics.gauge('huey_players_connected', 'Players connected to this worker', lambda: len(client_protocols))
+metrics.gauge('huey_players_known', 'Players on all workers (mirrored ones included)', lambda: len(players))
+metrics.gauge('huey_npcs', 'NPCs in the world', lambda: len(npc_store))
+metrics.gauge('huey_bcrypt_queue_depth', 'bcrypt jobs queued or hashing', lambda: password_hasher.queue_depth)
+metrics.stats('huey_password_hasher', 'bcrypt worker pool', password_hasher.stats)
+metrics.stats('huey_session_cache', 'Session token cache', session_cache.stats)
+metrics.stats('huey_inventory', 'Inventory write-behind cache', inventories.stats)
+metrics.stats('huey_leaderboard', 'In-memory leaderboards', leaderboards.stats)
+metrics.stats('huey_collision', 'Collision grid', collision_grid.stats)
+metrics.stats('huey_terrain', 'Terrain chunk cache', terrain_store.stats)
+metrics.stats('huey_input', 'Input rate limiter',
+              lambda: {k: v for k, v in input_limiter.stats().items() if k != 'events'})
+metrics.stats('huey_input_events', 'Inbound events by rate limit outcome',
+              lambda: input_limiter.stats()['events'], label='event')
+metrics.stats('huey_scheduler', 'Tick scheduler', scheduler.stats, label='system')
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,8 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import List, Optional
 import socketio
-import bcrypt
 import secrets
 import sqlite3
 import os
@@ -11,11 +10,15 @@ import json
 import math
 import asyncio
 from datetime import datetime, timedelta, timezone
-from starlette.responses import FileResponse
+from starlette.responses import FileResponse, JSONResponse
+
+# Shared state between worker processes (see state_backend.py)
+from state_backend import create_backend
+shared_state = create_backend(os.environ.get('HUEY_STATE_URL'))
 
 # 1. Create Socket.IO Server (Async)
 # We need to handle 3D coordinates (x, y, z)
-sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*', client_manager=shared_state.client_manager())
 
 # 2. Wrap with ASGI Application
 from contextlib import asynccontextmanager
@@ -29,6 +32,12 @@ async def lifespan(app: FastAPI):
     asyncio.create_task(update_world_time_loop())
     yield
     print("Huey3D: Powering down...")
+    for sid in list(players):
+        await shared_state.drop_player(sid)
+    await shared_state.close()
+    user_db.close()
+    world_db.close()
+    password_hasher.close()
 
 app = FastAPI(lifespan=lifespan, title="Huey3D Integrated Server")
 socket_app = socketio.ASGIApp(sio, app)
@@ -93,6 +102,17 @@ class ScoreSubmitRequest(BaseModel):
 USER_DB_PATH = 'db/user/users.db'
 WORLD_DB_PATH = 'db/world/world.db'
 
+# Same pooled, off-loop SQLite layer as server.py
+from database import SQLitePool
+user_db = SQLitePool(USER_DB_PATH)
+world_db = SQLitePool(WORLD_DB_PATH)
+
+from world_grid import grid_cell, migrate_placed_objects, CHUNK_SIZE, ChunkVersions, chunk_of, fetch_chunk
+
+# Chunk streaming, same API as server.py (clients pull the chunks around them)
+CHUNK_VIEW_RADIUS = 1
+chunk_versions = ChunkVersions()
+
 BUILD_COSTS = {
     'fence_wood': {'wood': 2},
     'wall_stone': {'snow_crystal': 2},
@@ -100,21 +120,24 @@ BUILD_COSTS = {
     'voxel_box': {'wood': 1} # New for 3D prototype
 }
 
-def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt(rounds=12)
-    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
-
-def verify_password(password: str, password_hash: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+from passwords import PasswordHasher, HasherBusy
+password_hasher = PasswordHasher()
 
 def generate_token() -> str:
     return secrets.token_urlsafe(32)
 
 def get_user_db():
-    return sqlite3.connect(USER_DB_PATH)
+    return user_db.connection()
 
 def get_world_db():
-    return sqlite3.connect(WORLD_DB_PATH)
+    return world_db.connection()
+
+def init_world_grid():
+    """Same placed_objects migration as server.py (cell columns + one structure per cell)"""
+    with get_world_db() as conn:
+        migrate_placed_objects(conn)
+
+init_world_grid()
 
 # --- Endpoints (Exact mirror of server.py) ---
 
@@ -124,121 +147,163 @@ async def signup(request: SignupRequest):
         if len(request.username) < 3 or len(request.password) < 6:
             raise HTTPException(status_code=400, detail="Invalid length")
         
-        conn = get_user_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM users WHERE username = ?", (request.username,))
-        if cursor.fetchone():
-            conn.close()
+        def username_taken(conn):
+            return conn.execute("SELECT id FROM users WHERE username = ?", (request.username,)).fetchone() is not None
+        if await user_db.run(username_taken):
             raise HTTPException(status_code=400, detail="Username exists")
         
-        cursor.execute("INSERT INTO users (username, password_hash, nickname, last_login) VALUES (?, ?, ?, ?)",
-                       (request.username, hash_password(request.password), request.nickname, datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
+        password_hash = await password_hasher.hash(request.password)
+        def create_user(conn):
+            conn.execute("INSERT INTO users (username, password_hash, nickname, last_login) VALUES (?, ?, ?, ?)",
+                         (request.username, password_hash, request.nickname, datetime.now().isoformat()))
+        await user_db.run(create_user)
         return {"success": True}
+    except HTTPException:
+        raise
+    except HasherBusy:
+        raise HTTPException(status_code=503, detail="Server busy")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/login")
 async def login(request: LoginRequest):
-    conn = get_user_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, username, password_hash, nickname, skin FROM users WHERE username = ?", (request.username,))
-    user = cursor.fetchone()
-    if not user or not verify_password(request.password, user[2]):
-        conn.close()
+    def fetch_user(conn):
+        return conn.execute("SELECT id, username, password_hash, nickname, skin FROM users WHERE username = ?", (request.username,)).fetchone()
+    user = await user_db.run(fetch_user)
+    try:
+        valid = bool(user) and await password_hasher.verify(request.password, user[2])
+    except HasherBusy:
+        raise HTTPException(status_code=503, detail="Server busy")
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     user_id, username, _, nickname, skin = user
     token = None
     if request.remember_me:
         token = generate_token()
-        cursor.execute("INSERT INTO sessions (token, user_id, expires_at) VALUES (?, ?, ?)",
-                       (token, user_id, (datetime.now() + timedelta(days=30)).isoformat()))
-    conn.commit()
-    conn.close()
+        def create_session(conn):
+            conn.execute("INSERT INTO sessions (token, user_id, expires_at) VALUES (?, ?, ?)",
+                         (token, user_id, (datetime.now() + timedelta(days=30)).isoformat()))
+        await user_db.run(create_session)
     return {"success": True, "user": {"id": user_id, "username": username, "nickname": nickname, "skin": skin or "skin_fox"}, "token": token}
 
 @app.post("/api/verify-token")
 async def verify_token(request: TokenRequest):
-    conn = get_user_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT s.user_id, s.expires_at, u.username, u.nickname, u.skin FROM sessions s JOIN users u ON s.user_id = u.id WHERE s.token = ?", (request.token,))
-    session = cursor.fetchone()
+    def fetch_session(conn):
+        return conn.execute("SELECT s.user_id, s.expires_at, u.username, u.nickname, u.skin FROM sessions s JOIN users u ON s.user_id = u.id WHERE s.token = ?", (request.token,)).fetchone()
+    session = await user_db.run(fetch_session)
     if not session or datetime.fromisoformat(session[1]) < datetime.now():
-        conn.close()
         raise HTTPException(status_code=401, detail="Expired")
-    conn.close()
     return {"success": True, "user": {"id": session[0], "username": session[2], "nickname": session[3], "skin": session[4] or "skin_fox"}}
 
 @app.post("/api/inventory/get")
 async def get_inventory(request: TokenRequest):
-    conn = get_user_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id FROM sessions WHERE token = ?", (request.token,))
-    session = cursor.fetchone()
-    if not session: raise HTTPException(status_code=401)
-    cursor.execute("SELECT item_id, quantity, slot_index FROM inventory WHERE user_id = ?", (session[0],))
-    data = [{"item_id": i[0], "quantity": i[1], "slot_index": i[2]} for i in cursor.fetchall()]
-    conn.close()
+    def fetch_inventory(conn):
+        cursor = conn.cursor()
+        cursor.execute("SELECT user_id FROM sessions WHERE token = ?", (request.token,))
+        session = cursor.fetchone()
+        if not session: raise HTTPException(status_code=401)
+        cursor.execute("SELECT item_id, quantity, slot_index FROM inventory WHERE user_id = ?", (session[0],))
+        return [{"item_id": i[0], "quantity": i[1], "slot_index": i[2]} for i in cursor.fetchall()]
+    data = await user_db.run(fetch_inventory)
     return {"success": True, "inventory": data}
 
 @app.post("/api/inventory/update")
 async def update_inventory(request: InventoryUpdateRequest):
-    conn = get_user_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id FROM sessions WHERE token = ?", (request.token,))
-    sess = cursor.fetchone()
-    if not sess: raise HTTPException(status_code=401)
-    cursor.execute("DELETE FROM inventory WHERE user_id = ?", (sess[0],))
-    for i in request.items:
-        cursor.execute("INSERT INTO inventory (user_id, item_id, quantity, slot_index) VALUES (?, ?, ?, ?)", (sess[0], i.item_id, i.quantity, i.slot_index))
-    conn.commit(); conn.close()
+    def replace_inventory(conn):
+        cursor = conn.cursor()
+        cursor.execute("SELECT user_id FROM sessions WHERE token = ?", (request.token,))
+        sess = cursor.fetchone()
+        if not sess: raise HTTPException(status_code=401)
+        cursor.execute("DELETE FROM inventory WHERE user_id = ?", (sess[0],))
+        cursor.executemany("INSERT INTO inventory (user_id, item_id, quantity, slot_index) VALUES (?, ?, ?, ?)",
+                           [(sess[0], i.item_id, i.quantity, i.slot_index) for i in request.items])
+    await user_db.run(replace_inventory)
     return {"success": True}
 
 @app.get("/api/world/objects")
 async def get_world_objects():
-    conn = get_world_db()
-    cursor = conn.cursor()
-    # Update for 3D coords if table supports it, else use 0 for Z
-    try:
-        cursor.execute("SELECT type, x, y, z, owner_username FROM placed_objects")
-        rows = cursor.fetchall()
-        objs = [{"type": r[0], "x": r[1], "y": r[2], "z": r[3], "owner": r[4]} for r in rows]
-    except:
-        cursor.execute("SELECT type, x, y, owner_username FROM placed_objects")
-        rows = cursor.fetchall()
-        objs = [{"type": r[0], "x": r[1], "y": r[2], "z": 0, "owner": r[3]} for r in rows]
-    conn.close()
+    def fetch_objects(conn):
+        cursor = conn.cursor()
+        # Update for 3D coords if table supports it, else use 0 for Z
+        try:
+            cursor.execute("SELECT type, x, y, z, owner_username FROM placed_objects")
+            rows = cursor.fetchall()
+            return [{"type": r[0], "x": r[1], "y": r[2], "z": r[3], "owner": r[4]} for r in rows]
+        except sqlite3.OperationalError:
+            cursor.execute("SELECT type, x, y, owner_username FROM placed_objects")
+            rows = cursor.fetchall()
+            return [{"type": r[0], "x": r[1], "y": r[2], "z": 0, "owner": r[3]} for r in rows]
+    objs = await world_db.run(fetch_objects)
     return {"success": True, "objects": objs}
 
+def fetch_chunk_objects(conn, chunk):
+    try:
+        rows = fetch_chunk(conn, chunk, 'type, x, y, z, owner_username')
+        return [{"type": r[0], "x": r[1], "y": r[2], "z": r[3], "owner": r[4]} for r in rows]
+    except sqlite3.OperationalError:
+        rows = fetch_chunk(conn, chunk)
+        return [{"type": r[0], "x": r[1], "y": r[2], "z": 0, "owner": r[3]} for r in rows]
+
+@app.get("/api/world/chunks")
+async def get_world_chunks(x: float = 0, y: float = 0):
+    cx, cy = chunk_of(x, y)
+    r = CHUNK_VIEW_RADIUS
+    chunks = [(cx + dx, cy + dy) for dx in range(-r, r + 1) for dy in range(-r, r + 1)]
+    return {"success": True, "chunk_size": CHUNK_SIZE,
+            "chunks": [{"chunk": list(c), "version": chunk_versions.get(c)} for c in chunks]}
+
+@app.get("/api/world/chunks/{cx}/{cy}")
+async def get_world_chunk(cx: int, cy: int, request: Request):
+    chunk = (cx, cy)
+    version = chunk_versions.get(chunk)
+    etag = chunk_versions.etag(chunk)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    objs = await world_db.run(fetch_chunk_objects, chunk)
+    return JSONResponse({"success": True, "chunk": [cx, cy], "version": version, "objects": objs}, headers=headers)
+
 @app.post("/api/world/place")
 async def place_object(request: PlaceObjectRequest):
     # Simplified validation from server.py
-    user_conn = get_user_db()
-    user_cursor = user_conn.cursor()
-    user_cursor.execute("SELECT u.id, u.username FROM sessions s JOIN users u ON s.user_id = u.id WHERE s.token = ?", (request.token,))
-    session = user_cursor.fetchone()
+    def fetch_session(conn):
+        return conn.execute("SELECT u.id, u.username FROM sessions s JOIN users u ON s.user_id = u.id WHERE s.token = ?", (request.token,)).fetchone()
+    session = await user_db.run(fetch_session)
     if not session: raise HTTPException(status_code=401)
-    
-    # Cost check
-    costs = BUILD_COSTS.get(request.type, {})
-    for item_id, qty in costs.items():
-        user_cursor.execute("SELECT quantity FROM inventory WHERE user_id =? AND item_id =?", (session[0], item_id))
-        row = user_cursor.fetchone()
-        if not row or row[0] < qty: raise HTTPException(status_code=400, detail=f"No {item_id}")
-        user_cursor.execute("UPDATE inventory SET quantity = quantity - ? WHERE user_id =? AND item_id =?", (qty, session[0], item_id))
-
-    user_conn.commit(); user_conn.close()
-    
-    world_conn = get_world_db()
-    world_cursor = world_conn.cursor()
-    # Try to insert Z if column exists
+
+    # Claim the grid cell first (one structure per cell), then pay for it
+    cell_x, cell_y = grid_cell(request.x, request.y)
+    def insert_object(conn):
+        # Try to insert Z if column exists
+        try:
+            return conn.execute("INSERT INTO placed_objects (type, x, y, z, owner_username, cell_x, cell_y) VALUES (?, ?, ?, ?, ?, ?, ?)", (request.type, request.x, request.y, request.z, session[1], cell_x, cell_y)).lastrowid
+        except sqlite3.OperationalError:
+            return conn.execute("INSERT INTO placed_objects (type, x, y, owner_username, cell_x, cell_y) VALUES (?, ?, ?, ?, ?, ?)", (request.type, request.x, request.y, session[1], cell_x, cell_y)).lastrowid
     try:
-        world_cursor.execute("INSERT INTO placed_objects (type, x, y, z, owner_username) VALUES (?, ?, ?, ?, ?)", (request.type, request.x, request.y, request.z, session[1]))
-    except:
-        world_cursor.execute("INSERT INTO placed_objects (type, x, y, owner_username) VALUES (?, ?, ?, ?)", (request.type, request.x, request.y, session[1]))
-    world_conn.commit(); world_conn.close()
+        obj_id = await world_db.run(insert_object)
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=409, detail="Cell occupied")
+
+    def pay_for_object(conn):
+        cursor = conn.cursor()
+        costs = BUILD_COSTS.get(request.type, {})
+        for item_id, qty in costs.items():
+            cursor.execute("SELECT quantity FROM inventory WHERE user_id =? AND item_id =?", (session[0], item_id))
+            row = cursor.fetchone()
+            if not row or row[0] < qty: raise HTTPException(status_code=400, detail=f"No {item_id}")
+            cursor.execute("UPDATE inventory SET quantity = quantity - ? WHERE user_id =? AND item_id =?", (qty, session[0], item_id))
+
+    def release_cell(conn):
+        conn.execute("DELETE FROM placed_objects WHERE id = ?", (obj_id,))
+
+    try:
+        await user_db.run(pay_for_object)
+    except Exception:
+        # Couldn't pay (or the charge failed): free the cell again
+        await world_db.run(release_cell)
+        raise
+    chunk_versions.bump(chunk_of(request.x, request.y))
     
     new_obj = {"type": request.type, "x": request.x, "y": request.y, "z": request.z, "owner": session[1]}
     await sio.emit('object_placed', new_obj)
@@ -255,7 +320,8 @@ async def update_world_time_loop():
     import time
     while True:
         world_time = (time.time() % 300) / 300
-        await sio.emit('time_update', {'world_time': world_time})
+        # Wall-clock based, so every worker agrees; each one only tells its own clients
+        await sio.emit('time_update', {'world_time': world_time}, ignore_queue=True)
         await asyncio.sleep(5)
 
 async def update_npcs_loop():
@@ -270,13 +336,26 @@ async def connect(sid, environ):
 @sio.on('set_nickname')
 async def on_set_nickname(sid, data):
     players[sid].update({'nickname': data.get('nickname', 'Fox'), 'skin': data.get('skin', 'skin_fox')})
+    await shared_state.put_players({sid: players[sid]})
     await sio.emit('new_player', {'sid': sid, 'player': players[sid]})
-    await sio.emit('current_players', players)
+    # Players connected to other workers come from the shared registry
+    await sio.emit('current_players', {**await shared_state.load_players(), **players})
+
+@sio.event
+async def disconnect(sid):
+    if players.pop(sid, None) is not None:
+        await shared_state.drop_player(sid)
 
 @sio.on('player_move')
-async def on_player_move(sid, data):
+async def on_player_move(sid, data=None):
     if sid in players:
-        players[sid].update({'x': data['x'], 'y': data['y'], 'z': data.get('z', 0)})
+        try:
+            x, y, z = float(data['x']), float(data['y']), float(data.get('z', 0))
+        except (AttributeError, TypeError, KeyError, ValueError):
+            return
+        if not all(math.isfinite(v) for v in (x, y, z)):
+            return # NaN / infinite coordinates would poison every client's scene
+        players[sid].update({'x': x, 'y': y, 'z': z})
         await sio.emit('player_moved', {'sid': sid, **players[sid]})
 
 if __name__ == "__main__":
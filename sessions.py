@@ -0,0 +1,68 @@
+"""In-memory cache for session token lookups.
+
+Almost every authenticated call starts by resolving its token. Caching
+token -> (user_id, username, expires_at) saves a SQLite round trip per
+request. Entries are evicted LRU-first when the cache is full, expire at
+the session's own expiry, and are never trusted for longer than `ttl`
+seconds. With several workers a logout is also published on the state
+channel (`session_revoked`) so every worker drops the token at once.
+"""
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+Session = namedtuple('Session', ['user_id', 'username', 'expires_at'])
+
+
+class SessionCache:
+    """LRU + TTL cache of session tokens"""
+
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (Session, cached_at)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, token):
+        """Cached Session for token, or None (expired entries are dropped)"""
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        session, cached_at = entry
+        if time.monotonic() - cached_at > self.ttl or session.expires_at <= datetime.now():
+            del self._entries[token]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return session
+
+    def put(self, token, user_id, username, expires_at):
+        if isinstance(expires_at, str):
+            expires_at = datetime.fromisoformat(expires_at)
+        session = Session(user_id, username, expires_at)
+        self._entries[token] = (session, time.monotonic())
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return session
+
+    def invalidate(self, token):
+        self._entries.pop(token, None)
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,284 @@
+"""Shared state and pub/sub between server processes.
+
+`players`, the NPCs and `world_time` used to live only in module globals, so
+the game could only ever run as one process. The server now talks to a
+backend instead:
+
+    LocalBackend   everything stays in this process (the default)
+    BrokerBackend  a message broker speaking the Redis protocol (RESP); set
+                   HUEY_STATE_URL=redis://host:port. Works against a real
+                   Redis or the stand-in in scripts/state_broker.py.
+
+With a broker every worker:
+    - broadcasts Socket.IO events through BrokerManager, so `sio.emit` to a
+      room or sid reaches clients connected to any worker
+    - keeps its own sids authoritative and mirrors everyone else's from the
+      `huey:players` hash plus the `huey:state` channel (join / moves / leave)
+    - draws entity ids from one shared counter and leases single-owner jobs
+      (the NPC simulation) with `claim`
+    - records which worker has each user's inventory loaded (`swap`), so the
+      next one can ask it to flush and let go first
+
+Only the commands the stand-in implements are used: GET, SET [NX] [PX],
+INCR, HSET, HDEL, HGETALL, PUBLISH and SUBSCRIBE.
+"""
+import asyncio
+import itertools
+import json
+import uuid
+from urllib.parse import urlparse
+
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+STATE_CHANNEL = 'huey:state'
+SOCKETIO_CHANNEL = 'huey:socketio'
+PLAYERS_KEY = 'huey:players'
+
+
+class BrokerError(Exception):
+    """Error reply from the broker"""
+
+
+def encode_command(*args):
+    """RESP array of bulk strings"""
+    out = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        out.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(out)
+
+
+async def read_reply(reader):
+    """One RESP reply (bytes, int, list or None). Error replies raise BrokerError."""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Broker closed the connection")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b'+':
+        return rest
+    if kind == b'-':
+        raise BrokerError(rest.decode())
+    if kind == b':':
+        return int(rest)
+    if kind == b'$':
+        length = int(rest)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b'*':
+        count = int(rest)
+        if count < 0:
+            return None
+        return [await read_reply(reader) for _ in range(count)]
+    raise BrokerError(f"Bad reply from broker: {line!r}")
+
+
+class BrokerConnection:
+    """One request/response connection, reconnected on demand"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()  # one command in flight at a time
+
+    async def command(self, *args):
+        async with self._lock:
+            if self._writer is None:
+                self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                self._writer.write(encode_command(*args))
+                await self._writer.drain()
+                return await read_reply(self._reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                raise
+
+    async def subscribe(self, *channels):
+        """Yield (channel, data) forever. Uses this connection exclusively."""
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._writer.write(encode_command('SUBSCRIBE', *channels))
+        await self._writer.drain()
+        while True:
+            reply = await read_reply(self._reader)
+            if isinstance(reply, list) and reply[0] == b'message':
+                yield reply[1].decode(), reply[2]
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class BrokerManager(AsyncPubSubManager):
+    """Socket.IO client manager that fans emits out through the broker"""
+    name = 'huey-broker'
+
+    def __init__(self, host, port, channel=SOCKETIO_CHANNEL, write_only=False):
+        # write_only: emit to clients from a process without a Socket.IO server (region workers)
+        super().__init__(channel=channel, write_only=write_only)
+        self._conn = BrokerConnection(host, port)
+        self._sub = BrokerConnection(host, port)
+
+    async def _publish(self, data):
+        await self._conn.command('PUBLISH', self.channel, self.json.dumps(data))
+
+    async def _listen(self):
+        while True:
+            try:
+                async for _, data in self._sub.subscribe(self.channel):
+                    yield data
+            except (ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+                print(f"Socket.IO broker subscription lost ({e}), retrying...")
+                self._sub.close()
+                await asyncio.sleep(1)
+
+
+class LocalBackend:
+    """Single process: the module globals are the shared state, nothing to publish"""
+    shared = False
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex[:8]
+        self._counters = {}
+        self._values = {}
+
+    def client_manager(self):
+        return None  # Socket.IO's default in-memory manager
+
+    async def start(self, on_message, channels=None):
+        pass
+
+    async def close(self):
+        pass
+
+    async def publish(self, message, channel=None):
+        pass
+
+    async def put_players(self, players):
+        pass
+
+    async def drop_player(self, sid):
+        pass
+
+    async def load_players(self):
+        return {}
+
+    async def next_id(self, name):
+        counter = self._counters.setdefault(name, itertools.count(1))
+        return next(counter)
+
+    async def setdefault(self, key, value):
+        return self._values.setdefault(key, value)
+
+    async def swap(self, key, value):
+        previous = self._values.get(key)
+        self._values[key] = value
+        return previous
+
+    async def claim(self, name, ttl):
+        return True
+
+
+class BrokerBackend:
+    """State in the broker, changes announced on STATE_CHANNEL"""
+    shared = True
+
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.worker_id = uuid.uuid4().hex[:8]
+        self._conn = BrokerConnection(self.host, self.port)
+        self._sub = BrokerConnection(self.host, self.port)
+        self._listener = None
+
+    def client_manager(self, write_only=False):
+        return BrokerManager(self.host, self.port, write_only=write_only)
+
+    async def start(self, on_message, channels=(STATE_CHANNEL,)):
+        """Deliver other workers' messages on `channels` to `await on_message(message)`"""
+        async def listen():
+            while True:
+                try:
+                    async for _, data in self._sub.subscribe(*channels):
+                        message = json.loads(data)
+                        if message.get('worker') == self.worker_id:
+                            continue
+                        try:
+                            await on_message(message)
+                        except Exception as e:
+                            print(f"State message error ({message.get('op')}): {e}")
+                except (ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+                    print(f"State broker subscription lost ({e}), retrying...")
+                    self._sub.close()
+                    await asyncio.sleep(1)
+
+        self._listener = asyncio.create_task(listen())
+        print(f"State backend: broker at {self.host}:{self.port} (worker {self.worker_id})")
+
+    async def close(self):
+        if self._listener:
+            self._listener.cancel()
+        self._sub.close()
+        self._conn.close()
+
+    async def publish(self, message, channel=STATE_CHANNEL):
+        await self._conn.command('PUBLISH', channel, json.dumps({**message, 'worker': self.worker_id}))
+
+    async def put_players(self, players):
+        """Upsert {sid: player} into the shared registry"""
+        if not players:
+            return
+        args = []
+        for sid, player in players.items():
+            args += [sid, json.dumps({**player, 'worker': self.worker_id})]
+        await self._conn.command('HSET', PLAYERS_KEY, *args)
+
+    async def drop_player(self, sid):
+        await self._conn.command('HDEL', PLAYERS_KEY, sid)
+
+    async def load_players(self):
+        """Every registered player ({sid: player}), including this worker's"""
+        flat = await self._conn.command('HGETALL', PLAYERS_KEY) or []
+        return {flat[i].decode(): json.loads(flat[i + 1]) for i in range(0, len(flat), 2)}
+
+    async def next_id(self, name):
+        return await self._conn.command('INCR', f'huey:id:{name}')
+
+    async def setdefault(self, key, value):
+        """Stored value for key, setting it to `value` if nobody did yet"""
+        await self._conn.command('SET', f'huey:{key}', json.dumps(value), 'NX')
+        return json.loads(await self._conn.command('GET', f'huey:{key}'))
+
+    async def swap(self, key, value):
+        """Set key to `value` and return the previous value (get-then-set, like claim)"""
+        previous = await self._conn.command('GET', f'huey:{key}')
+        await self._conn.command('SET', f'huey:{key}', json.dumps(value))
+        return json.loads(previous) if previous is not None else None
+
+    async def claim(self, name, ttl):
+        """
+        Hold a lease on `name` for `ttl` seconds; True while this worker owns it.
+        Renewal is get-then-set, so two workers can overlap for one tick at worst.
+        """
+        key = f'huey:lease:{name}'
+        ms = int(ttl * 1000)
+        if await self._conn.command('SET', key, self.worker_id, 'NX', 'PX', ms) is not None:
+            return True
+        if await self._conn.command('GET', key) == self.worker_id.encode():
+            await self._conn.command('SET', key, self.worker_id, 'PX', ms)
+            return True
+        return False
+
+
+def create_backend(url=None):
+    """Backend for HUEY_STATE_URL (unset: in-process)"""
+    if not url:
+        return LocalBackend()
+    if urlparse(url).scheme != 'redis':
+        raise ValueError(f"Unsupported state backend URL: {url}")
+    return BrokerBackend(url)
@@ -1,4 +1,5 @@
 import { SocketManager } from './socket.manager.js';
+import { generateChunkTrees } from './terrain.js';
 
 export class MainScene extends Phaser.Scene {
     constructor() {
@@ -156,6 +157,14 @@ export class MainScene extends Phaser.Scene {
         this.placedObjectsGroup = this.add.group();
         this.gridSize = 48; // Minecraft-like grid size
 
+        // World chunk streaming (server pushes world_chunks as we move)
+        this.chunkSize = 768;
+        this.loadedChunks = new Set(); // "cx,cy" of chunks in view
+        this.chunkCache = new Map();   // "cx,cy" -> { version, etag, objects, trees }
+        this.chunkTrees = new Map();   // "cx,cy" -> [tree sprites and minimap dots]
+        // Terrain spec from the welcome bundle (world_chunks can arrive while it is still inflating)
+        this.terrainReady = new Promise(resolve => { this.resolveTerrain = resolve; });
+
         // Health Bar (Moved higher for player visibility)
         this.createHealthBar(this.playerContainer, 40, 6, -40);
 
@@ -1123,13 +1132,8 @@ export class MainScene extends Phaser.Scene {
 
             // Add to minimap
             if (this.minimapConfig) {
-                const { scale } = this.minimapConfig;
-                const dot = this.add.circle(
-                    (data.x + 1000) * scale,
-                    (data.y + 1000) * scale,
-                    2,
-                    0xffff00
-                );
+                const [dotX, dotY] = this.minimapPoint(data.x, data.y, true);
+                const dot = this.add.circle(dotX, dotY, 2, 0xffff00);
                 this.minimapContainer.add(dot);
                 this.minimapNpcDots[data.id] = dot;
             }
@@ -1155,16 +1159,22 @@ export class MainScene extends Phaser.Scene {
     }
 
 
+    minimapPoint(x, y, clamp = false) {
+        // World -> minimap coords. The minimap shows the 2000x2000 area around the origin, but the
+        // terrain is unbounded: points beyond it are pinned to the edge (clamp) or left out (null)
+        const { size, scale, offsetX, offsetY } = this.minimapConfig;
+        const mx = x * scale + offsetX;
+        const my = y * scale + offsetY;
+        if (mx >= 0 && mx <= size && my >= 0 && my <= size) return [mx, my];
+        if (!clamp) return null;
+        return [Phaser.Math.Clamp(mx, 0, size), Phaser.Math.Clamp(my, 0, size)];
+    }
+
     updateMinimap() {
         if (!this.minimapConfig || !this.minimapPlayerDot) return;
 
-        const { scale, offsetX, offsetY } = this.minimapConfig;
-
         // Update my player position on minimap
-        // World coords: -1000 to 1000 -> Minimap coords: 0 to 150
-        const minimapX = (this.playerContainer.x + 1000) * scale;
-        const minimapY = (this.playerContainer.y + 1000) * scale;
-        this.minimapPlayerDot.setPosition(minimapX, minimapY);
+        this.minimapPlayerDot.setPosition(...this.minimapPoint(this.playerContainer.x, this.playerContainer.y, true));
 
         // Update other players on minimap
         for (const [sid, container] of Object.entries(this.otherPlayers)) {
@@ -1176,18 +1186,14 @@ export class MainScene extends Phaser.Scene {
                 this.minimapOtherDots[sid] = dot;
             }
 
-            const otherX = (container.x + 1000) * scale;
-            const otherY = (container.y + 1000) * scale;
-            this.minimapOtherDots[sid].setPosition(otherX, otherY);
+            this.minimapOtherDots[sid].setPosition(...this.minimapPoint(container.x, container.y, true));
         }
 
         // Update NPC positions on minimap
         for (const [nid, container] of Object.entries(this.npcs)) {
             const dot = this.minimapNpcDots[nid];
             if (dot) {
-                const dotX = (container.x + 1000) * scale;
-                const dotY = (container.y + 1000) * scale;
-                dot.setPosition(dotX, dotY);
+                dot.setPosition(...this.minimapPoint(container.x, container.y, true));
             }
         }
 
@@ -1254,61 +1260,8 @@ export class MainScene extends Phaser.Scene {
         }
 
         trees.forEach(t => {
-            // Biome logic: determine texture based on Y coordinate
-            let texture = 'tree';
-            let tint = 0xffffff;
-            let displaySize = 96;
-
-            if (t.y < -700) {
-                texture = 'snow_tree';
-            } else if (t.y > 700) {
-                texture = 'cactus';
-                displaySize = 64; // Cacti are usually a bit smaller
-            }
-
-            // Create tree as part of the physics group
-            const tree = this.treesGroup.create(t.x, t.y, texture);
-            tree.setPipeline('Light2D');
-
-
-            // Visuals
-            tree.setOrigin(0.5, 0.9);
-            tree.setDisplaySize(displaySize, displaySize);
-            tree.setDepth(t.y); // Y-sort immediately
-
-            // Physics Body (Trunk only)
-            // Adjust body size and offset based on tree type
-            tree.refreshBody(); // Sync physics with display size/origin
-
-            if (texture === 'cactus') {
-                // Cactus is 64x64, origin at (0.5, 0.9)
-                // Smaller collision box for cactus trunk
-                tree.body.setSize(16, 16);
-                // Center x: 32, Anchor y: 0.9 * 64 = 57.6
-                tree.body.setOffset(24, 46);
-            } else if (texture === 'snow_tree') {
-                // Snow tree is 96x96, origin at (0.5, 0.9)
-                tree.body.setSize(20, 20);
-                // Center x: 48, Anchor y: 0.9 * 96 = 86.4
-                tree.body.setOffset(38, 70);
-            } else {
-                // Regular tree is 96x96, origin at (0.5, 0.9)
-                tree.body.setSize(20, 20);
-                tree.body.setOffset(38, 70);
-            }
-
-            // Add to minimap
-            if (this.minimapConfig) {
-                const { scale } = this.minimapConfig;
-                const dot = this.add.circle(
-                    (t.x + 1000) * scale,
-                    (t.y + 1000) * scale,
-                    1.5,
-                    0x004400
-                );
-                this.minimapContainer.add(dot);
-                this.minimapTreeDots.push(dot);
-            }
+            const [, dot] = this.createTree(t);
+            if (dot) this.minimapTreeDots.push(dot);
         });
 
         // Add Collider between Player and Trees
@@ -1319,6 +1272,81 @@ export class MainScene extends Phaser.Scene {
         console.log(`Rendered ${trees.length} trees from server with collision.`);
     }
 
+    setTerrain(spec) {
+        // Trees now come per chunk (see loadChunk), generated from the spec unless the server stored edits
+        if (!this.treeCollider && this.playerContainer) {
+            this.treeCollider = this.physics.add.collider(this.playerContainer, this.treesGroup);
+        }
+        this.resolveTerrain(spec);
+    }
+
+    renderChunkTrees(key, trees) {
+        this.clearChunkTrees(key);
+        this.chunkTrees.set(key, trees.flatMap(t => this.createTree(t)));
+    }
+
+    clearChunkTrees(key) {
+        const objects = this.chunkTrees.get(key);
+        if (!objects) return;
+        objects.forEach(obj => obj.destroy());
+        this.chunkTrees.delete(key);
+    }
+
+    createTree(t) {
+        // Returns the tree sprite and its minimap dot; the caller keeps track of (and destroys) both
+        // Biome logic: determine texture based on Y coordinate
+        let texture = 'tree';
+        let tint = 0xffffff;
+        let displaySize = 96;
+
+        if (t.y < -700) {
+            texture = 'snow_tree';
+        } else if (t.y > 700) {
+            texture = 'cactus';
+            displaySize = 64; // Cacti are usually a bit smaller
+        }
+
+        // Create tree as part of the physics group
+        const tree = this.treesGroup.create(t.x, t.y, texture);
+        tree.setPipeline('Light2D');
+
+
+        // Visuals
+        tree.setOrigin(0.5, 0.9);
+        tree.setDisplaySize(displaySize, displaySize);
+        tree.setDepth(t.y); // Y-sort immediately
+
+        // Physics Body (Trunk only)
+        // Adjust body size and offset based on tree type
+        tree.refreshBody(); // Sync physics with display size/origin
+
+        if (texture === 'cactus') {
+            // Cactus is 64x64, origin at (0.5, 0.9)
+            // Smaller collision box for cactus trunk
+            tree.body.setSize(16, 16);
+            // Center x: 32, Anchor y: 0.9 * 64 = 57.6
+            tree.body.setOffset(24, 46);
+        } else if (texture === 'snow_tree') {
+            // Snow tree is 96x96, origin at (0.5, 0.9)
+            tree.body.setSize(20, 20);
+            // Center x: 48, Anchor y: 0.9 * 96 = 86.4
+            tree.body.setOffset(38, 70);
+        } else {
+            // Regular tree is 96x96, origin at (0.5, 0.9)
+            tree.body.setSize(20, 20);
+            tree.body.setOffset(38, 70);
+        }
+
+        // Add to minimap (trees outside the area it covers get no dot)
+        const point = this.minimapConfig && this.minimapPoint(t.x, t.y);
+        if (point) {
+            const dot = this.add.circle(point[0], point[1], 1.5, 0x004400);
+            this.minimapContainer.add(dot);
+            return [tree, dot];
+        }
+        return [tree];
+    }
+
 
     async updateInventoryOnServer() {
         if (!this.token) return;
@@ -1338,6 +1366,14 @@ export class MainScene extends Phaser.Scene {
         }
     }
 
+    applyInventoryDiff(diff) {
+        // diff from /api/inventory/batch: changed slots replace ours, removed slots are emptied
+        const touched = new Set([...diff.removed, ...diff.changed.map(item => item.slot_index)]);
+        this.inventory = this.inventory.filter(item => !touched.has(item.slot_index));
+        diff.changed.forEach(item => this.inventory.push({ ...item }));
+        if (window.updateInventoryUI) window.updateInventoryUI();
+    }
+
     async fetchInventoryFromServer() {
         if (!this.token) return;
         try {
@@ -1755,8 +1791,7 @@ export class MainScene extends Phaser.Scene {
         // 4. Cancel on ESC
         this.input.keyboard.on('keydown-ESC', () => this.cancelBuild());
 
-        // 5. Load existing objects
-        this.loadPlacedObjects();
+        // 5. Existing objects arrive per chunk (see handleWorldChunks)
     }
 
     cancelBuild() {
@@ -1768,20 +1803,66 @@ export class MainScene extends Phaser.Scene {
         }
     }
 
-    async loadPlacedObjects() {
-        try {
-            const response = await fetch('/api/world/objects');
-            const data = await response.json();
-            if (data.success) {
-                // Clear existing group to avoid overlaps on reload
-                this.placedObjectsGroup.clear(true, true);
-                data.objects.forEach(obj => {
-                    this.renderPlacedObject(obj);
-                });
+    chunkKeyOf(x, y) {
+        // Same borders as the server's chunk_of (chunks are whole grid cells)
+        const offset = this.gridSize / 2;
+        return `${Math.floor((x + offset) / this.chunkSize)},${Math.floor((y + offset) / this.chunkSize)}`;
+    }
+
+    handleWorldChunks(data) {
+        this.chunkSize = data.chunk_size;
+        data.leave.forEach(([cx, cy]) => this.unloadChunk(`${cx},${cy}`));
+        data.enter.forEach(({ chunk, version, terrain }) => this.loadChunk(chunk[0], chunk[1], version, terrain));
+    }
+
+    async loadChunk(cx, cy, version, terrain) {
+        const key = `${cx},${cy}`;
+        this.loadedChunks.add(key);
+
+        let cached = this.chunkCache.get(key);
+        if (!cached || cached.version !== version) {
+            try {
+                const headers = cached ? { 'If-None-Match': cached.etag } : {};
+                const response = await fetch(`/api/world/chunks/${cx}/${cy}`, { headers });
+                if (response.status === 304) {
+                    cached.version = version;
+                } else {
+                    const data = await response.json();
+                    if (!data.success) return;
+                    cached = { version: data.version, etag: response.headers.get('ETag'), objects: data.objects, trees: data.trees };
+                    this.chunkCache.set(key, cached);
+                }
+            } catch (e) {
+                console.error("Load chunk error:", e);
+                return;
             }
-        } catch (e) {
-            console.error("Load objects error:", e);
         }
+
+        // Untouched terrain is rebuilt from the seed, edited chunks brought their trees
+        let trees = cached.trees;
+        if (terrain === 'seed') {
+            trees = generateChunkTrees(await this.terrainReady, cx, cy);
+        }
+
+        // Moved away while the request was in flight
+        if (!this.loadedChunks.has(key)) return;
+        this.clearChunkObjects(key);
+        cached.objects.forEach(obj => this.renderPlacedObject(obj));
+        if (terrain) this.renderChunkTrees(key, trees || []);
+    }
+
+    unloadChunk(key) {
+        this.loadedChunks.delete(key);
+        this.clearChunkObjects(key);
+        this.clearChunkTrees(key);
+    }
+
+    clearChunkObjects(key) {
+        this.placedObjectsGroup.getChildren().slice().forEach(child => {
+            if (this.chunkKeyOf(child.getData('x'), child.getData('y')) === key) {
+                child.destroy();
+            }
+        });
     }
 
     renderPlacedObject(obj) {
@@ -1892,6 +1973,8 @@ export class MainScene extends Phaser.Scene {
     }
 
     handleObjectPlaced(data) {
+        this.markChunkStale(data.x, data.y);
+
         // Check if already exists (basic deduplication)
         let exists = false;
         this.placedObjectsGroup.getChildren().forEach(child => {
@@ -1903,7 +1986,20 @@ export class MainScene extends Phaser.Scene {
         }
     }
 
+    markChunkStale(x, y) {
+        // Cached copy no longer matches; next load revalidates it with its ETag
+        const cached = this.chunkCache.get(this.chunkKeyOf(x, y));
+        if (cached) cached.version = -1;
+    }
+
+    handlePositionCorrection(pos) {
+        // The server refused a move (tree, wall or world edge): go back to where it has us
+        if (!this.playerContainer || !this.playerContainer.body) return;
+        this.playerContainer.body.reset(pos.x, pos.y);
+    }
+
     handleObjectRemoved(data) {
+        this.markChunkStale(data.x, data.y);
         this.placedObjectsGroup.getChildren().forEach(child => {
             if (child.getData('x') === data.x && child.getData('y') === data.y) {
                 child.destroy();
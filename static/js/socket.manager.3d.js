@@ -31,11 +31,28 @@ export class SocketManager3D {
             this.game.addOtherPlayer(data.sid, data.player);
         });
 
+        // Area of Interest enter/leave (server.py only sends nearby players)
+        this.socket.on('player_entered', (data) => {
+            if (data.sid === this.socket.id) return;
+            this.game.addOtherPlayer(data.sid, data.player);
+        });
+
+        this.socket.on('player_left', (sid) => {
+            this.game.removeOtherPlayer(sid);
+        });
+
         this.socket.on('player_moved', (data) => {
             if (data.sid === this.socket.id) return;
             this.game.updateOtherPlayer(data.sid, data.x, data.y);
         });
 
+        this.socket.on('world_snapshot', (snapshot) => {
+            for (const [sid, pos] of Object.entries(snapshot.players)) {
+                if (sid === this.socket.id) continue;
+                this.game.updateOtherPlayer(sid, pos.x, pos.y);
+            }
+        });
+
         this.socket.on('player_disconnected', (sid) => {
             this.game.removeOtherPlayer(sid);
         });
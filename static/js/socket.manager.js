@@ -1,8 +1,21 @@
+// player_move is sent at most this often, however fast the display refreshes
+const MOVE_SEND_INTERVAL = 1000 / 30; // ms
+
 export class SocketManager {
     constructor(scene) {
         this.scene = scene;
+        this.pendingMove = null;
+        this.moveTimer = null;
+        this.lastMoveSent = 0;
+        // Binary frame decoding tables (see wire.py)
+        this.sidByEid = {};
+        this.npcIds = [];
         // prevent race conditions: setup events BEFORE connecting
-        this.socket = io({ autoConnect: false });
+        // Opt into packed binary frames for high-frequency events and the single welcome bundle
+        this.socket = io({
+            autoConnect: false,
+            auth: { protocol: 'bin1', welcome: 2 }
+        });
         this.setupEvents();
         this.socket.connect();
     }
@@ -50,43 +63,18 @@ export class SocketManager {
             this.scene.events.emit('nickname-error', data);
         });
 
-        // Initialize existing players
-        this.socket.on('current_players', (players) => {
-            console.log("Socket: Received current_players", players);
-            Object.keys(players).forEach((id) => {
-                if (id === this.socket.id) {
-                    // It's me! Initialize my attributes if needed
-                    if (this.scene.playerContainer) {
-                        this.scene.playerContainer.socketId = id;
-                    }
-                } else {
-                    this.scene.addOtherPlayer(id, players[id]);
-                }
-            });
-
-            this.addLog(`Joined world with ${Object.keys(players).length - 1} other players.`);
-        });
-
-        // Map data from server
-        this.socket.on('map_data', (trees) => {
-            console.log("Socket: Received map_data", trees);
-            this.scene.renderMap(trees);
-        });
-
-        // Guestbook data initial load
-        this.socket.on('guestbook_data', (messages) => {
-            console.log("Socket: Received guestbook_data", messages);
-            this.updateGuestbookUI(messages);
-        });
+        // Everything a new client needs in one message (see welcome.py)
+        this.socket.on('welcome', (bundle) => this.handleWelcome(bundle));
 
-        // NPC data from server
-        this.socket.on('npc_data', (npcs) => {
-            console.log("Socket: Received npc_data", npcs);
-            this.scene.initNPCs(npcs);
-        });
+        // Legacy per-part join events (servers without welcome support)
+        this.socket.on('current_players', (players) => this.handleCurrentPlayers(players));
+        this.socket.on('map_data', (trees) => this.scene.renderMap(trees));
+        this.socket.on('guestbook_data', (messages) => this.updateGuestbookUI(messages));
+        this.socket.on('npc_data', (npcs) => this.handleNpcData(npcs));
 
         // NPCs moved
         this.socket.on('npcs_moved', (updates) => {
+            if (updates instanceof ArrayBuffer) updates = this.decodeNpcs(updates);
             this.scene.updateNPCPositions(updates);
         });
 
@@ -103,6 +91,7 @@ export class SocketManager {
         });
 
         this.socket.on('time_update', (data) => {
+            if (data instanceof ArrayBuffer) data = { world_time: new DataView(data).getFloat32(0, true) };
             this.scene.worldTime = data.world_time;
         });
 
@@ -113,6 +102,8 @@ export class SocketManager {
             // Ignore if it's me (since server broadcasts to everyone now)
             if (data.sid === this.socket.id) return;
 
+            this.rememberEid(data.sid, data.player);
+
             this.scene.addOtherPlayer(data.sid, data.player);
 
             const name = data.player.nickname || 'Unknown';
@@ -186,32 +177,31 @@ export class SocketManager {
             }
         });
 
-        // Player moved
-        this.socket.on('player_moved', (data) => {
-            // Update Debug Info Global
-            window.lastMoveDebug = `${data.sid.substr(0, 4)}.. -> ${Math.round(data.x)},${Math.round(data.y)}`;
-
-            // Filter out my own movements (since server broadcasts to all)
+        // Area of Interest: a player walked into our view range
+        this.socket.on('player_entered', (data) => {
             if (data.sid === this.socket.id) return;
+            this.rememberEid(data.sid, data.player);
+            this.scene.addOtherPlayer(data.sid, data.player);
+        });
 
-            if (this.scene.otherPlayers[data.sid]) {
-                const container = this.scene.otherPlayers[data.sid];
-                const prevX = container.x;
-
-                // Update position
-                container.setPosition(data.x, data.y);
-                container.lastMoveTime = this.scene.time.now; // Track for animation
-
-                // Flip sprite based on movement direction
-                // Container structure: [0]=shadow, [1]=sprite, [2]=text
-                const sprite = container.list[1];
-                if (sprite && sprite.setFlipX) {
-                    if (data.x < prevX) {
-                        sprite.setFlipX(true); // Moving left
-                    } else if (data.x > prevX) {
-                        sprite.setFlipX(false); // Moving right
-                    }
-                }
+        // Area of Interest: a player walked out of our view range (still online)
+        this.socket.on('player_left', (sid) => {
+            if (this.scene.otherPlayers[sid]) {
+                this.scene.otherPlayers[sid].destroy();
+                delete this.scene.otherPlayers[sid];
+            }
+        });
+
+        // Player moved (single update, kept for servers without snapshots)
+        this.socket.on('player_moved', (data) => {
+            this.applyPlayerMove(data.sid, data.x, data.y);
+        });
+
+        // Fixed-tick snapshot: every player in range that moved since the last tick
+        this.socket.on('world_snapshot', (snapshot) => {
+            if (snapshot instanceof ArrayBuffer) snapshot = this.decodeSnapshot(snapshot);
+            for (const [sid, pos] of Object.entries(snapshot.players)) {
+                this.applyPlayerMove(sid, pos.x, pos.y);
             }
         });
 
@@ -229,6 +219,28 @@ export class SocketManager {
             }
         });
 
+        // Several objects at once (e.g. the drops of one inventory batch)
+        this.socket.on('objects_placed', (data) => {
+            if (this.scene.handleObjectPlaced) {
+                data.objects.forEach(obj => this.scene.handleObjectPlaced(obj));
+            }
+        });
+
+        // Chunks to load/unload around us (sent on join and when crossing chunk borders)
+        this.socket.on('world_chunks', (data) => {
+            if (this.scene.handleWorldChunks) {
+                this.scene.handleWorldChunks(data);
+            }
+        });
+
+        // Server-side collision refused our last move
+        this.socket.on('position_correction', (pos) => {
+            this.pendingMove = null; // from before the snap, don't send it
+            if (this.scene.handlePositionCorrection) {
+                this.scene.handlePositionCorrection(pos);
+            }
+        });
+
         this.socket.on('object_removed', (data) => {
             console.log("Socket: Object removed", data);
             if (this.scene.handleObjectRemoved) {
@@ -237,13 +249,148 @@ export class SocketManager {
         });
     }
 
+    async handleWelcome(bundle) {
+        if (bundle.v !== 2) {
+            console.warn("Socket: Unsupported welcome version", bundle.v);
+            return;
+        }
+        // Players first so our own socket id is known before anything renders
+        this.handleCurrentPlayers(bundle.players);
+        this.scene.worldTime = bundle.world_time;
+        this.updateGuestbookUI(bundle.guestbook);
+
+        // Terrain spec only: trees are generated per chunk as world_chunks come in
+        const [terrain, roster] = await Promise.all([
+            this.inflateJSON(bundle.static.terrain),
+            this.inflateJSON(bundle.static.npc_roster)
+        ]);
+        this.scene.setTerrain(terrain);
+
+        // Rebuild the npc_data list from the fixed roster and the current state
+        const npcs = roster.ids.map((id, i) => ({
+            id,
+            type: roster.types[roster.type[i]],
+            x: bundle.npcs.x[i],
+            y: bundle.npcs.y[i],
+            hp: bundle.npcs.hp[i],
+            max_hp: roster.max_hp[i]
+        }));
+        this.handleNpcData(npcs);
+        console.log(`Socket: Welcome v${bundle.v} (world seed ${terrain.seed}, ${npcs.length} NPCs)`);
+    }
+
+    async inflateJSON(buffer) {
+        // Static welcome parts are zlib-compressed JSON
+        const stream = new Blob([buffer]).stream().pipeThrough(new DecompressionStream('deflate'));
+        return JSON.parse(await new Response(stream).text());
+    }
+
+    handleCurrentPlayers(players) {
+        console.log("Socket: Received current_players", players);
+        Object.keys(players).forEach((id) => {
+            this.rememberEid(id, players[id]);
+            if (id === this.socket.id) {
+                // It's me! Initialize my attributes if needed
+                if (this.scene.playerContainer) {
+                    this.scene.playerContainer.socketId = id;
+                }
+            } else {
+                this.scene.addOtherPlayer(id, players[id]);
+            }
+        });
+
+        this.addLog(`Joined world with ${Object.keys(players).length - 1} other players.`);
+    }
+
+    handleNpcData(npcs) {
+        this.npcIds = npcs.map(n => n.id);
+        this.scene.initNPCs(npcs);
+    }
+
+    rememberEid(sid, player) {
+        if (player && player.eid !== undefined) this.sidByEid[player.eid] = sid;
+    }
+
+    // --- Binary frame decoders (layouts documented in wire.py) ---
+
+    decodeSnapshot(buffer) {
+        const view = new DataView(buffer);
+        const tick = view.getUint32(0, true);
+        const count = view.getUint32(4, true);
+        const players = {};
+        for (let i = 0, off = 8; i < count; i++, off += 12) {
+            const sid = this.sidByEid[view.getUint32(off, true)];
+            if (sid === undefined) continue;
+            players[sid] = { x: view.getFloat32(off + 4, true), y: view.getFloat32(off + 8, true) };
+        }
+        return { tick, players };
+    }
+
+    decodeNpcs(buffer) {
+        const view = new DataView(buffer);
+        const count = view.getUint32(0, true);
+        const updates = {};
+        for (let i = 0, off = 4; i < count; i++, off += 8) {
+            const nid = this.npcIds[view.getUint32(off, true)];
+            if (nid === undefined) continue;
+            updates[nid] = { x: view.getInt16(off + 4, true), y: view.getInt16(off + 6, true) };
+        }
+        return updates;
+    }
+
+    applyPlayerMove(sid, x, y) {
+        // Update Debug Info Global
+        window.lastMoveDebug = `${sid.substr(0, 4)}.. -> ${Math.round(x)},${Math.round(y)}`;
+
+        // Filter out my own movements (since server broadcasts to all)
+        if (sid === this.socket.id) return;
+
+        if (this.scene.otherPlayers[sid]) {
+            const container = this.scene.otherPlayers[sid];
+            const prevX = container.x;
+
+            // Update position
+            container.setPosition(x, y);
+            container.lastMoveTime = this.scene.time.now; // Track for animation
+
+            // Flip sprite based on movement direction
+            // Container structure: [0]=shadow, [1]=sprite, [2]=text
+            const sprite = container.list[1];
+            if (sprite && sprite.setFlipX) {
+                if (x < prevX) {
+                    sprite.setFlipX(true); // Moving left
+                } else if (x > prevX) {
+                    sprite.setFlipX(false); // Moving right
+                }
+            }
+        }
+    }
+
     emitMove(x, y) {
         if (!this.socket.connected) {
             console.warn("Socket not connected, cannot emit move.");
             return;
         }
-        // console.log("Emitting Move:", x, y); // Verbose
-        this.socket.emit('player_move', { x, y });
+        // Keep only the latest position; it goes out when the send interval allows
+        this.pendingMove = { x, y };
+        if (this.moveTimer) return;
+        const wait = this.lastMoveSent + MOVE_SEND_INTERVAL - performance.now();
+        if (wait <= 0) {
+            this.flushMove();
+        } else {
+            this.moveTimer = setTimeout(() => {
+                this.moveTimer = null;
+                this.flushMove();
+            }, wait);
+        }
+    }
+
+    flushMove() {
+        if (!this.pendingMove || !this.socket.connected) return;
+        // console.log("Emitting Move:", this.pendingMove.x, this.pendingMove.y); // Verbose
+        this.socket.emit('player_move', this.pendingMove);
+        this.pendingMove = null;
+        this.lastMoveSent = performance.now();
     }
 
     emitEmoji(emoji) {
@@ -257,6 +404,38 @@ export class SocketManager {
         if (!list) return;
         list.innerHTML = '';
         messages.forEach(m => this.addSinglePostToUI(m, true));
+        // The connect payload is only the newest page; older ones are fetched on demand
+        const last = messages[messages.length - 1];
+        this.showOlderGuestbookButton(last ? last.id : null);
+    }
+
+    showOlderGuestbookButton(cursor) {
+        const list = document.getElementById('guestbook-list');
+        if (!list) return;
+        const old = list.querySelector('.gb-more');
+        if (old) old.remove();
+        if (!cursor) return;
+
+        const more = document.createElement('div');
+        more.className = 'gb-item gb-more';
+        more.innerText = 'Load older messages';
+        more.addEventListener('click', () => this.loadOlderGuestbook(cursor));
+        list.appendChild(more);
+    }
+
+    async loadOlderGuestbook(cursor) {
+        try {
+            const response = await fetch(`/api/guestbook?before=${cursor}`);
+            const data = await response.json();
+            if (!data.success) return;
+            const list = document.getElementById('guestbook-list');
+            const more = list && list.querySelector('.gb-more');
+            if (more) more.remove();
+            data.messages.forEach(m => this.addSinglePostToUI(m, true));
+            this.showOlderGuestbookButton(data.next_cursor);
+        } catch (e) {
+            console.error("Guestbook history error:", e);
+        }
     }
 
     addSinglePostToUI(post, append = false) {
@@ -0,0 +1,45 @@
+// Chunk tree generator, a line-by-line port of terrain.py.
+// Untouched chunks are rebuilt here from the welcome bundle's terrain spec
+// instead of being downloaded. Keep both files in step (32-bit integer math only).
+
+function mulberry32(state) {
+    return () => {
+        state = (state + 0x6D2B79F5) >>> 0;
+        let t = state;
+        t = Math.imul(t ^ (t >>> 15), t | 1);
+        t ^= t + Math.imul(t ^ (t >>> 7), t | 61);
+        return (t ^ (t >>> 14)) >>> 0;
+    };
+}
+
+export function chunkSeed(seed, cx, cy) {
+    let h = (seed ^ Math.imul(cx, 0x9E3779B1) ^ Math.imul(cy, 0x85EBCA77)) >>> 0;
+    h ^= h >>> 16;
+    h = Math.imul(h, 0x85EBCA6B);
+    h ^= h >>> 13;
+    h = Math.imul(h, 0xC2B2AE35);
+    h ^= h >>> 16;
+    return h >>> 0;
+}
+
+export function generateChunkTrees(spec, cx, cy) {
+    const size = spec.chunk_size;
+    const x0 = cx * size - spec.origin;
+    const y0 = cy * size - spec.origin;
+    const [low, high] = spec.trees;
+    const safeSq = spec.safe_radius * spec.safe_radius;
+    const limit = spec.limit;
+
+    const next = mulberry32(chunkSeed(spec.seed, cx, cy));
+    const trees = [];
+    const count = low + next() % (high - low + 1);
+    for (let i = 0; i < count; i++) {
+        // Always draw both numbers so skipped trees don't shift the ones after them
+        const x = x0 + next() % size;
+        const y = y0 + next() % size;
+        if (x * x + y * y <= safeSq) continue; // keep the spawn area clear
+        if (limit !== null && (Math.abs(x) > limit || Math.abs(y) > limit)) continue;
+        trees.push({ x, y });
+    }
+    return trees;
+}
@@ -0,0 +1,240 @@
+"""Seeded, chunk-based world generation.
+
+Trees used to be one fixed list (db/map/forest.json). Now every chunk (the
+same 768px chunks as placed objects, see world_grid.py) is generated from
+the world seed on first use, so the world has no size limit and memory
+only holds the chunks around players (LRU). Only edited chunks are stored,
+in the `terrain_chunks` table. The old forest.json is imported once as
+edits, so existing worlds keep their trees.
+
+The generator uses 32-bit integer math only (mulberry32 seeded per chunk),
+so static/js/terrain.js produces exactly the same trees in the browser and
+clients never download an untouched chunk. Change both files together and
+bump GENERATOR_VERSION when the output changes.
+
+Tree types stay biome-by-y on the client (snow trees north, cacti south).
+"""
+import json
+import os
+import secrets
+from collections import OrderedDict
+
+from world_grid import BUILD_GRID, CHUNK_SIZE, chunk_of
+
+GENERATOR_VERSION = 1
+TREES_MIN = 18  # per chunk, ~ the density of the old 120-tree map
+TREES_MAX = 25
+
+MASK = 0xFFFFFFFF
+
+
+def imul(a, b):
+    """Math.imul: 32-bit multiply"""
+    return (a * b) & MASK
+
+
+class Mulberry32:
+    """Tiny 32-bit PRNG, identical to the JS version"""
+
+    def __init__(self, seed):
+        self.state = seed & MASK
+
+    def next(self):
+        self.state = (self.state + 0x6D2B79F5) & MASK
+        t = self.state
+        t = imul(t ^ (t >> 15), t | 1)
+        t ^= (t + imul(t ^ (t >> 7), t | 61)) & MASK
+        return (t ^ (t >> 14)) & MASK
+
+
+def chunk_seed(seed, cx, cy):
+    """Per-chunk seed (murmur3 finalizer over the world seed and chunk coords)"""
+    h = (seed ^ imul(cx & MASK, 0x9E3779B1) ^ imul(cy & MASK, 0x85EBCA77)) & MASK
+    h ^= h >> 16
+    h = imul(h, 0x85EBCA6B)
+    h ^= h >> 13
+    h = imul(h, 0xC2B2AE35)
+    h ^= h >> 16
+    return h
+
+
+def make_spec(seed, limit=None, safe_radius=150):
+    """Everything a client needs to regenerate chunks (sent in the welcome bundle)"""
+    return {
+        'generator': GENERATOR_VERSION,
+        'seed': seed,
+        'chunk_size': CHUNK_SIZE,
+        'origin': BUILD_GRID // 2,
+        'trees': [TREES_MIN, TREES_MAX],
+        'safe_radius': safe_radius,
+        'limit': limit,  # trees only within +-limit (None: unbounded)
+    }
+
+
+def generate_chunk(spec, chunk):
+    """Trees ({'x', 'y'}) of an untouched chunk"""
+    cx, cy = chunk
+    size = spec['chunk_size']
+    x0 = cx * size - spec['origin']
+    y0 = cy * size - spec['origin']
+    low, high = spec['trees']
+    safe_sq = spec['safe_radius'] ** 2
+    limit = spec['limit']
+
+    rng = Mulberry32(chunk_seed(spec['seed'], cx, cy))
+    trees = []
+    for _ in range(low + rng.next() % (high - low + 1)):
+        # Always draw both numbers so skipped trees don't shift the ones after them
+        x = x0 + rng.next() % size
+        y = y0 + rng.next() % size
+        if x * x + y * y <= safe_sq:
+            continue  # keep the spawn area clear
+        if limit is not None and (abs(x) > limit or abs(y) > limit):
+            continue
+        trees.append({'x': x, 'y': y})
+    return trees
+
+
+def load_world_seed(path):
+    """The world's seed, created once (HUEY_WORLD_SEED overrides)"""
+    if 'HUEY_WORLD_SEED' in os.environ:
+        return int(os.environ['HUEY_WORLD_SEED']) & MASK
+    try:
+        # Exclusive create: several workers starting at once still agree on one seed
+        with open(path, 'x', encoding='utf-8') as f:
+            json.dump({'seed': secrets.randbits(32)}, f)
+    except FileExistsError:
+        pass
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['seed']
+
+
+def chunks_within(half):
+    """All chunks overlapping the square [-half, half]"""
+    (min_x, min_y), (max_x, max_y) = chunk_of(-half, -half), chunk_of(half, half)
+    return [(cx, cy) for cx in range(min_x, max_x + 1) for cy in range(min_y, max_y + 1)]
+
+
+def migrate_terrain(conn, legacy_trees=None, legacy_chunks=()):
+    """
+    Create terrain_chunks. On first run, store a legacy tree list as edits to
+    every chunk in `legacy_chunks` (so those chunks look exactly like before).
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS terrain_chunks (
+            cx INTEGER NOT NULL,
+            cy INTEGER NOT NULL,
+            trees TEXT NOT NULL,
+            PRIMARY KEY (cx, cy)
+        )
+    """)
+    if legacy_trees is None or conn.execute("SELECT 1 FROM terrain_chunks LIMIT 1").fetchone():
+        return
+    by_chunk = {chunk: [] for chunk in legacy_chunks}
+    for tree in legacy_trees:
+        by_chunk.setdefault(chunk_of(tree['x'], tree['y']), []).append(tree)
+    conn.executemany(
+        "INSERT INTO terrain_chunks (cx, cy, trees) VALUES (?, ?, ?)",
+        [(cx, cy, json.dumps(trees)) for (cx, cy), trees in by_chunk.items()]
+    )
+    print(f"Imported {len(legacy_trees)} map trees into {len(by_chunk)} terrain chunks")
+
+
+def read_chunk(conn, chunk, spec):
+    """Trees of a chunk straight from the World DB or the generator (for offline tools)"""
+    row = conn.execute("SELECT trees FROM terrain_chunks WHERE cx = ? AND cy = ?", chunk).fetchone()
+    return json.loads(row[0]) if row else generate_chunk(spec, chunk)
+
+
+def save_chunk(conn, chunk, trees):
+    """Store a chunk's trees as an edit (served from the DB instead of the generator from then on)"""
+    conn.execute("INSERT OR REPLACE INTO terrain_chunks (cx, cy, trees) VALUES (?, ?, ?)",
+                 (*chunk, json.dumps(trees)))
+
+
+class TerrainStore:
+    """Chunk trees on demand: generated from the seed or read back from terrain_chunks, kept in an LRU"""
+
+    def __init__(self, pool, spec, max_chunks=256, on_load=None, on_evict=None):
+        self.pool = pool
+        self.spec = spec
+        self.max_chunks = max_chunks
+        self.on_load = on_load    # callback(chunk, trees) when a chunk enters the cache
+        self.on_evict = on_evict  # callback(chunk, trees) when it leaves
+        self.edited = set()       # chunks stored in terrain_chunks
+        self._chunks = OrderedDict()  # (cx, cy) -> trees
+
+        # Metrics
+        self.generated = 0
+        self.loaded = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def load_edited_index(self, conn):
+        self.edited = {(cx, cy) for cx, cy in conn.execute("SELECT cx, cy FROM terrain_chunks")}
+
+    def _read(self, conn, chunk):
+        row = conn.execute("SELECT trees FROM terrain_chunks WHERE cx = ? AND cy = ?", chunk).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def _put(self, chunk, trees):
+        self._chunks[chunk] = trees
+        if self.on_load:
+            self.on_load(chunk, trees)
+
+    def get(self, chunk):
+        """Cached trees of a chunk, or None"""
+        trees = self._chunks.get(chunk)
+        if trees is not None:
+            self._chunks.move_to_end(chunk)
+        return trees
+
+    def preload(self, conn, chunks):
+        """Synchronous load at startup (conn is a World DB connection)"""
+        for chunk in chunks:
+            if chunk in self._chunks:
+                continue
+            if chunk in self.edited:
+                self._put(chunk, self._read(conn, chunk))
+                self.loaded += 1
+            else:
+                self._put(chunk, generate_chunk(self.spec, chunk))
+                self.generated += 1
+
+    async def ensure(self, chunks):
+        """Make sure the chunks are cached (players are about to walk into them)"""
+        missing = [c for c in chunks if self.get(c) is None]
+        for chunk in missing:
+            if chunk in self.edited:
+                trees = await self.pool.run(self._read, chunk)
+                self.loaded += 1
+            else:
+                trees = generate_chunk(self.spec, chunk)
+                self.generated += 1
+            if chunk not in self._chunks:
+                self._put(chunk, trees)
+
+    def trim(self, keep):
+        """Evict least recently used chunks beyond max_chunks, never the ones in `keep`"""
+        excess = len(self._chunks) - self.max_chunks
+        for chunk in list(self._chunks):
+            if excess <= 0:
+                break
+            if chunk in keep:
+                continue
+            trees = self._chunks.pop(chunk)
+            if self.on_evict:
+                self.on_evict(chunk, trees)
+            self.evictions += 1
+            excess -= 1
+
+    def stats(self):
+        return {
+            'cached': len(self._chunks),
+            'edited': len(self.edited),
+            'generated': self.generated,
+            'loaded': self.loaded,
+            'evictions': self.evictions,
+        }
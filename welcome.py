@@ -0,0 +1,79 @@
+"""Welcome bundle sent once on connect.
+
+Instead of five separate emits (current_players, map_data, guestbook_data,
+npc_data, time_init) a client that opts in during the handshake
+(`auth: {welcome: 2}`) gets a single versioned `welcome` message.
+
+Parts that never change after startup (the terrain, the NPC roster) are
+serialized and deflated once into StaticPart bytes and reused for every
+join; they travel as Socket.IO binary attachments so they are never
+re-encoded. Only the small per-join state is serialized per client.
+
+Static parts are content-addressed: the bundle carries every part's hash,
+and a client that already has a part cached sends its hash in the
+handshake (`auth: {welcome: 1, cached: {map: '<hash>'}}`) and gets the
+bundle without it. The map is also served as immutable bytes from
+`/api/map/<hash>`.
+
+Schema v2 replaces the tree map with the terrain spec (seed and generator
+settings, see terrain.py); clients generate the trees chunk by chunk.
+v1 clients still get the full map.
+
+Schema v1:
+    {
+        'v': 1,
+        'static': {'map': <zlib JSON>, 'npc_roster': <zlib JSON>},  # minus cached parts
+        'hashes': {'map': str, 'npc_roster': str},
+        'players': {sid: player},   # nearby players, including yourself
+        'npcs': {'x': [...], 'y': [...], 'hp': [...]},  # roster order
+        'guestbook': [post, ...],
+        'world_time': float
+    }
+
+Schema v2: as v1 with 'terrain' (make_spec() JSON) in place of 'map'.
+"""
+import gzip
+import hashlib
+import json
+import zlib
+
+WELCOME_VERSION = 2
+PARTS = {
+    1: ('map', 'npc_roster'),
+    2: ('terrain', 'npc_roster'),
+}
+
+
+def welcome_version(auth):
+    """Welcome schema the client asked for in the handshake, None for legacy clients"""
+    version = auth.get('welcome') if isinstance(auth, dict) else None
+    return version if isinstance(version, int) and version in PARTS else None
+
+
+class StaticPart:
+    """Payload that is fixed after startup: JSON-encoded and deflated once"""
+
+    def __init__(self, data):
+        self.json = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        self.compressed = zlib.compress(self.json, 9)
+        self.gzipped = gzip.compress(self.json, 9, mtime=0)  # for HTTP (Content-Encoding: gzip)
+        self.hash = hashlib.sha256(self.json).hexdigest()[:16]
+
+
+def cached_parts(auth, static_parts):
+    """Names of the static parts the client already has (matching hash)"""
+    cached = auth.get('cached') if isinstance(auth, dict) else None
+    if not isinstance(cached, dict):
+        return set()
+    return {name for name, part in static_parts.items() if cached.get(name) == part.hash}
+
+
+def bundle(static_parts, version=WELCOME_VERSION, skip=(), **state):
+    """Assemble a welcome message from the version's StaticParts (minus `skip`) and per-join state"""
+    names = PARTS[version]
+    return {
+        'v': version,
+        'static': {name: static_parts[name].compressed for name in names if name not in skip},
+        'hashes': {name: static_parts[name].hash for name in names},
+        **state
+    }
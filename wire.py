@@ -0,0 +1,83 @@
+"""Wire encodings for high-frequency events.
+
+Clients pick a protocol in the Socket.IO handshake (`auth: {protocol: 'bin1'}`).
+JSON stays the default for old clients; binary clients get packed
+little-endian records for `world_snapshot`, `npcs_moved` and `time_update`.
+Each frame is encoded once per protocol and the same bytes go to every
+recipient.
+
+Binary layouts (all little-endian):
+    world_snapshot: uint32 tick, uint32 count, count x (uint32 eid, float32 x, float32 y)
+    npcs_moved:     uint32 count, count x (uint32 npc index, int16 x, int16 y)
+    time_update:    float32 world_time
+"""
+import struct
+import numpy as np
+
+PROTOCOL_JSON = 'json'
+PROTOCOL_BINARY = 'bin1'
+
+# Every client sits in exactly one of these rooms (used for broadcasts)
+JSON_ROOM = 'proto:json'
+BINARY_ROOM = 'proto:bin1'
+
+SNAPSHOT_HEADER = struct.Struct('<II')
+COUNT_HEADER = struct.Struct('<I')
+TIME_RECORD = struct.Struct('<f')
+
+PLAYER_RECORD = np.dtype([('eid', '<u4'), ('x', '<f4'), ('y', '<f4')])
+NPC_RECORD = np.dtype([('index', '<u4'), ('x', '<i2'), ('y', '<i2')])
+
+INT16_MIN, INT16_MAX = -32768, 32767
+
+
+def protocol_from_auth(auth):
+    """Protocol requested by the client during the handshake"""
+    if isinstance(auth, dict) and auth.get('protocol') == PROTOCOL_BINARY:
+        return PROTOCOL_BINARY
+    return PROTOCOL_JSON
+
+
+def room_for(protocol):
+    return BINARY_ROOM if protocol == PROTOCOL_BINARY else JSON_ROOM
+
+
+# --- world_snapshot ---
+
+def encode_snapshot_json(tick, frame):
+    return {'tick': tick, 'players': frame}
+
+
+def encode_snapshot_binary(tick, frame, eids):
+    """frame is {sid: {'x', 'y'}}, eids maps sid -> numeric entity id"""
+    records = np.empty(len(frame), dtype=PLAYER_RECORD)
+    for i, (sid, pos) in enumerate(frame.items()):
+        records[i] = (eids[sid], pos['x'], pos['y'])
+    return SNAPSHOT_HEADER.pack(tick, len(records)) + records.tobytes()
+
+
+# --- npcs_moved ---
+
+def encode_npcs_json(ids, changed, qx, qy):
+    return {
+        ids[i]: {'x': x, 'y': y}
+        for i, x, y in zip(changed.tolist(), qx[changed].tolist(), qy[changed].tolist())
+    }
+
+
+def encode_npcs_binary(changed, qx, qy):
+    records = np.empty(len(changed), dtype=NPC_RECORD)
+    records['index'] = changed
+    records['x'] = np.clip(qx[changed], INT16_MIN, INT16_MAX)
+    records['y'] = np.clip(qy[changed], INT16_MIN, INT16_MAX)
+    return COUNT_HEADER.pack(len(records)) + records.tobytes()
+
+
+# --- time_update ---
+
+def encode_time_json(world_time):
+    return {'world_time': world_time}
+
+
+def encode_time_binary(world_time):
+    return TIME_RECORD.pack(world_time)
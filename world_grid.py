@@ -0,0 +1,122 @@
+"""Integer grid cells for placed_objects.
+
+Buildings snap to a 48px grid on the client (Math.round(x / 48) * 48), so
+every object gets an integer (cell_x, cell_y) key. Point lookups and
+removals become indexed equality queries instead of ABS() scans, and a
+partial unique index keeps two structures out of the same cell (dropped
+items are exempt, several can lie in one cell). Structures that already
+overlapped before the index existed are moved, not deleted, into
+placed_objects_displaced (the oldest one keeps the cell).
+
+Cells are grouped into square chunks of CHUNK_CELLS x CHUNK_CELLS. Clients
+stream the chunks around them instead of the whole table; every chunk has
+a version counter (bumped on each change) that doubles as its ETag.
+"""
+import math
+import secrets
+
+BUILD_GRID = 48
+CHUNK_CELLS = 16
+CHUNK_SIZE = BUILD_GRID * CHUNK_CELLS  # px
+
+
+def grid_cell(x, y):
+    """Cell containing x, y (same rounding as the client's snap)"""
+    return math.floor(x / BUILD_GRID + 0.5), math.floor(y / BUILD_GRID + 0.5)
+
+
+def chunk_of(x, y):
+    """Chunk containing x, y (always the chunk of grid_cell(x, y))"""
+    offset = BUILD_GRID / 2
+    return math.floor((x + offset) / CHUNK_SIZE), math.floor((y + offset) / CHUNK_SIZE)
+
+
+def chunk_cell_range(chunk):
+    """Inclusive (min_cell_x, max_cell_x, min_cell_y, max_cell_y) of a chunk"""
+    cx, cy = chunk
+    return (cx * CHUNK_CELLS, cx * CHUNK_CELLS + CHUNK_CELLS - 1,
+            cy * CHUNK_CELLS, cy * CHUNK_CELLS + CHUNK_CELLS - 1)
+
+
+def fetch_chunk(conn, chunk, columns='type, x, y, owner_username'):
+    """All placed_objects rows in a chunk (range scan on idx_cell)"""
+    min_x, max_x, min_y, max_y = chunk_cell_range(chunk)
+    return conn.execute(
+        f"SELECT {columns} FROM placed_objects WHERE cell_x BETWEEN ? AND ? AND cell_y BETWEEN ? AND ?",
+        (min_x, max_x, min_y, max_y)
+    ).fetchall()
+
+
+class ChunkVersions:
+    """
+    In-memory version counter per chunk.
+    Counters restart at 0 with the process, so ETags carry a per-boot epoch
+    and a client never mistakes a pre-restart copy for the current one.
+    """
+
+    def __init__(self):
+        self.epoch = secrets.token_hex(4)
+        self._versions = {}  # (cx, cy) -> int
+
+    def get(self, chunk):
+        return self._versions.get(chunk, 0)
+
+    def bump(self, chunk):
+        self._versions[chunk] = self._versions.get(chunk, 0) + 1
+        return self._versions[chunk]
+
+    def etag(self, chunk):
+        return f'"{self.epoch}-{chunk[0]}.{chunk[1]}-{self.get(chunk)}"'
+
+
+def migrate_placed_objects(conn):
+    """Add and backfill cell columns plus their indexes (idempotent)"""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(placed_objects)")]
+    for col in ('cell_x', 'cell_y'):
+        if col not in columns:
+            conn.execute(f"ALTER TABLE placed_objects ADD COLUMN {col} INTEGER")
+            print(f"Added column: placed_objects.{col}")
+
+    rows = conn.execute("SELECT id, x, y FROM placed_objects WHERE cell_x IS NULL OR cell_y IS NULL").fetchall()
+    if rows:
+        conn.executemany(
+            "UPDATE placed_objects SET cell_x = ?, cell_y = ? WHERE id = ?",
+            [(*grid_cell(x, y), obj_id) for obj_id, x, y in rows]
+        )
+        print(f"Backfilled grid cells for {len(rows)} objects")
+
+    # Overlapping structures can't satisfy the unique index: the oldest keeps the cell,
+    # the others are set aside (not deleted) so they can be restored or refunded by hand
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS placed_objects_displaced (
+            id INTEGER PRIMARY KEY,
+            type TEXT NOT NULL,
+            x REAL NOT NULL,
+            y REAL NOT NULL,
+            owner_username TEXT,
+            cell_x INTEGER,
+            cell_y INTEGER,
+            displaced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    displaced = conn.execute("""
+        SELECT id, type, x, y, owner_username, cell_x, cell_y FROM placed_objects
+        WHERE type NOT LIKE 'drop_%' AND id NOT IN (
+            SELECT MIN(id) FROM placed_objects WHERE type NOT LIKE 'drop_%' GROUP BY cell_x, cell_y
+        )
+    """).fetchall()
+    if displaced:
+        conn.executemany(
+            "INSERT INTO placed_objects_displaced (id, type, x, y, owner_username, cell_x, cell_y) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            displaced
+        )
+        conn.executemany("DELETE FROM placed_objects WHERE id = ?", [(row[0],) for row in displaced])
+        for obj_id, obj_type, x, y, owner, _, _ in displaced:
+            print(f"Displaced overlapping {obj_type} #{obj_id} at ({x}, {y}) owned by {owner}")
+        print(f"Moved {len(displaced)} overlapping structures to placed_objects_displaced")
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cell ON placed_objects(cell_x, cell_y)")
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_cell_structure ON placed_objects(cell_x, cell_y) "
+        "WHERE type NOT LIKE 'drop_%'"
+    )